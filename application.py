@@ -15,6 +15,8 @@ from luts import (
 )
 
 from routes import routes, request
+from json_provider import APIJSONProvider
+from csv_functions import TABULAR_FORMATS
 
 # Configure logging to emit to stdout
 logging.basicConfig(
@@ -25,6 +27,7 @@ logging.basicConfig(
 
 # Elastic Beanstalk wants `application` to be present.
 application = app = Flask(__name__)
+app.json = APIJSONProvider(app)
 CORS(app)
 
 app.register_blueprint(routes)
@@ -92,7 +95,9 @@ def inject_date():
 @app.before_request
 def validate_get_params():
     class QueryParamsSchema(Schema):
-        format = fields.Str(validate=validate.OneOf(["csv"]), required=False)
+        format = fields.Str(
+            validate=validate.OneOf(TABULAR_FORMATS + ["netcdf"]), required=False
+        )
         summarize = fields.Str(validate=validate.OneOf(["mmm"]), required=False)
 
         # Make sure "community" parameter is only uppercase letters and
@@ -148,6 +153,13 @@ def validate_get_params():
             required=False,
         )
 
+        # Make sure "ids" parameter (batch area queries) is a comma-separated
+        # list of alphanumeric place IDs, less than or equal to 1000 characters long.
+        ids = fields.Str(
+            validate=lambda str: bool(re.match(r"^[A-Za-z0-9,]{1,1000}$", str)),
+            required=False,
+        )
+
         # Make sure "models" parameter contains only valid model names.
         def validate_models(value):
             items = value.split(",")
@@ -196,6 +208,13 @@ def validate_get_params():
     if errors:
         return render_template("422/invalid_get_parameter.html"), 422
 
+    # formats other than CSV are only accepted by the routes that declare them
+    requested_format = request.args.get("format")
+    view = app.view_functions.get(request.endpoint)
+    if requested_format is not None and view is not None:
+        if requested_format not in getattr(view, "output_formats", ["csv"]):
+            return render_template("400/bad_request.html"), 400
+
 
 @app.after_request
 def add_cache_control(response):
@@ -0,0 +1,129 @@
+"""Benchmark CSV exports of large synthetic results.
+
+The payloads are shaped like the largest CSV exports of the API: the cmip6_downscaled point endpoint
+(packaged dicts, model > scenario > day > variable), the era5wrf area and cmip6 monthly point endpoints
+(columnar results) and the modeled daily climatologies of the conus_hydrology endpoint (lists of day
+of year dicts). The time of the whole CSV response is measured, from the packaged or columnar results.
+
+Run from the root directory of this repository:
+    python -m benchmarks.benchmark_csv
+"""
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+from benchmarks.benchmark_postprocessing import best_time, make_payload
+from columnar import build_columnar_result
+from csv_functions import (
+    cmip6_downscaled_csv,
+    cmip6_monthly_csv,
+    conus_hydrology_csv,
+    era5wrf_csv,
+    write_csv,
+)
+
+
+def make_cases(seed=0):
+    rng = np.random.default_rng(seed)
+
+    era5wrf_values = np.round(rng.normal(10, 5, (365 * 60, 6)), 3)
+    era5wrf_values[rng.random(era5wrf_values.shape) < 0.1] = np.nan
+    era5wrf = build_columnar_result(
+        era5wrf_values,
+        {
+            "date": pd.date_range("1960-01-01", periods=365 * 60).strftime("%Y-%m-%d"),
+            "variable": [
+                "t2_min",
+                "t2_mean",
+                "t2_max",
+                "rh2_mean",
+                "rainnc_sum",
+                "seaice_max",
+            ],
+        },
+        precision=1,
+    )
+
+    cmip6_monthly_vars = ["tas", "pr", "evspsbl", "snw", "clt"]
+    cmip6_monthly_values = rng.normal(0, 1, (13, 3, 12 * 85, len(cmip6_monthly_vars)))
+    cmip6_monthly_values[rng.random(cmip6_monthly_values.shape) < 0.2] = np.nan
+    cmip6_monthly = build_columnar_result(
+        cmip6_monthly_values,
+        {
+            "model": [f"model{i}" for i in range(13)],
+            "scenario": ["historical", "ssp245", "ssp585"],
+            "month": [f"{1950 + i // 12}-{i % 12 + 1:02d}" for i in range(12 * 85)],
+            "variable": cmip6_monthly_vars,
+        },
+        {var: 8 if var == "evspsbl" else 3 for var in cmip6_monthly_vars},
+    )
+
+    climatology = [
+        {
+            "doy": doy,
+            "water_year_index": (doy + 91) % 366 + 1,
+            "doy_min": float(doy),
+            "doy_mean": doy + 0.5,
+            "doy_max": doy + 1.0,
+        }
+        for doy in range(1, 367)
+    ]
+    eras = ["1976-2005", "2016-2045", "2046-2075", "2071-2100"]
+    conus_hydrology = {
+        "data": {
+            landcover: {
+                f"model{i}": {
+                    scenario: {era: climatology for era in eras}
+                    for scenario in ["rcp45", "rcp85"]
+                }
+                for i in range(10)
+            }
+            for landcover in ["static", "dynamic"]
+        },
+        "metadata": {"variables": {}},
+    }
+
+    cmip6_downscaled = make_payload(
+        [[f"model{i}" for i in range(6)], ["ssp126", "ssp245", "ssp585"]],
+        365 * 30,
+        ["pr", "tasmax"],
+        None,
+    )
+
+    return [
+        (
+            "cmip6_downscaled point, 6 models x 3 scenarios x 30 years",
+            lambda: cmip6_downscaled_csv(cmip6_downscaled, ["pr", "tasmax"]),
+        ),
+        ("era5wrf area, 60 years", lambda: era5wrf_csv(era5wrf)),
+        (
+            "cmip6 monthly point, 13 models x 3 scenarios x 85 years",
+            lambda: cmip6_monthly_csv(cmip6_monthly, cmip6_monthly_vars),
+        ),
+        (
+            "conus_hydrology modeled climatologies, 2 x 10 x 2 x 4",
+            lambda: conus_hydrology_csv(
+                conus_hydrology, "Modeled Climatology", "original_gcm"
+            ),
+        ),
+    ]
+
+
+def main(repeats=3):
+    app = Flask(__name__)
+    print(f"{'case':<58} {'MB':>6} {'CSV (s)':>8}")
+    for label, make_properties in make_cases():
+
+        def export():
+            properties = make_properties()
+            properties["filename"] = "benchmark.csv"
+            return write_csv(properties).get_data()
+
+        with app.test_request_context():
+            timing, output = best_time(export, repeats)
+        print(f"{label:<58} {len(output) / 1e6:>6.1f} {timing:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
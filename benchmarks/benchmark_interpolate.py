@@ -0,0 +1,67 @@
+"""Benchmark nearest neighbour oversampling in zonal_stats.interpolate against xarray's interp().
+
+Run from the root directory of this repository:
+    python -m benchmarks.benchmark_interpolate
+"""
+
+import time
+import numpy as np
+import rioxarray  # noqa: F401, registers the .rio accessor
+import xarray as xr
+
+from zonal_stats import interpolate
+
+# (label, n_time, n_y, n_x, scale_factor) roughly matching real bbox fetches
+CASES = [
+    ("taspr 2km seasonal, small HUC", 32, 40, 50, 12),
+    ("taspr 2km seasonal, large HUC", 32, 200, 250, 3),
+    ("era5wrf 4km daily, 1 year", 365, 60, 80, 5),
+    ("era5wrf 4km daily, 10 years", 3650, 30, 40, 5),
+]
+
+
+def make_dataset(n_time, n_y, n_x):
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(
+        {"Gray": (("time", "Y", "X"), rng.random((n_time, n_y, n_x), dtype="float32"))},
+        coords={
+            "time": np.arange(n_time),
+            "X": np.arange(n_x) * 2000.0,
+            "Y": (np.arange(n_y) * 2000.0)[::-1],
+        },
+    )
+    return ds.rio.write_crs("EPSG:3338")
+
+
+def interp_reference(ds, scale_factor):
+    new_x = np.linspace(ds["X"][0].item(), ds["X"][-1].item(), ds.sizes["X"] * scale_factor)
+    new_y = np.linspace(ds["Y"][0].item(), ds["Y"][-1].item(), ds.sizes["Y"] * scale_factor)
+    return ds["Gray"].interp(method="nearest", coords={"X": new_x, "Y": new_y})
+
+
+def best_of(func, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    print(f"{'case':<32} {'interp (s)':>11} {'blocks (s)':>11} {'speedup':>8} equal")
+    for label, n_time, n_y, n_x, scale_factor in CASES:
+        ds = make_dataset(n_time, n_y, n_x)
+        interp_time, expected = best_of(lambda: interp_reference(ds, scale_factor))
+        blocks_time, actual = best_of(
+            lambda: interpolate(ds, "Gray", "X", "Y", scale_factor, method="nearest")
+        )
+        equal = actual.identical(expected)
+        print(
+            f"{label:<32} {interp_time:>11.3f} {blocks_time:>11.3f} "
+            f"{interp_time / blocks_time:>7.1f}x {equal}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark JSON serialization of large synthetic responses.
+
+The payloads are shaped like the largest responses of the API: the cmip6_downscaled point endpoint
+(model > scenario > day > variable), the era5wrf area endpoint (day > variable) and the landfast ice
+point endpoint (day > value, NumPy integers). Flask's default JSON provider (with sorted keys) is
+compared with the API's JSON provider using the built-in json module and orjson. Streamed responses of
+the cmip6_downscaled payload and of a columnar era5wrf result are compared with the whole responses for
+time to the first byte and peak memory.
+
+Run from the root directory of this repository:
+    python -m benchmarks.benchmark_json
+"""
+
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from benchmarks.benchmark_postprocessing import best_time, make_payload
+from columnar import build_columnar_result
+from json_provider import APIJSONProvider, default, orjson
+
+# (label, function making the payload) of the benchmarked responses, nodata values are null
+CASES = [
+    (
+        "cmip6_downscaled point, 6 models x 3 scenarios x 30 years",
+        lambda: make_payload(
+            [[f"model{i}" for i in range(6)], ["ssp126", "ssp245", "ssp585"]],
+            365 * 30,
+            ["pr", "tasmax"],
+            None,
+        ),
+    ),
+    (
+        "era5wrf area, 60 years",
+        lambda: make_payload(
+            [],
+            365 * 60,
+            ["t2_min", "t2_mean", "t2_max", "rh2_mean", "wspd10_mean", "rainnc_sum"],
+            None,
+        ),
+    ),
+    (
+        "landfast ice point, 25 years, NumPy values",
+        lambda: {
+            (date(1996, 1, 1) + timedelta(days=i)).strftime("%Y-%m-%d"): value
+            for i, value in enumerate(np.random.default_rng(0).choice([0, 255], 9000))
+        },
+    ),
+]
+
+
+def main(repeats=3):
+    app = Flask(__name__)
+    flask_provider = DefaultJSONProvider(app)
+    # Flask's default provider cannot serialize NumPy scalars
+    flask_provider.default = default
+    json_provider = APIJSONProvider(app)
+    json_provider.encoder = "json"
+    providers = [("flask (s)", flask_provider), ("json (s)", json_provider)]
+    if orjson is not None:
+        orjson_provider = APIJSONProvider(app)
+        orjson_provider.encoder = "orjson"
+        providers.append(("orjson (s)", orjson_provider))
+
+    header = "".join(f"{name:>12}" for name, _provider in providers)
+    print(f"{'case':<58} {'MB':>6}{header}")
+    for label, make_case in CASES:
+        payload = make_case()
+        timings = []
+        expected = None
+        for _name, provider in providers:
+            with app.app_context():
+                timing, response = best_time(
+                    lambda: provider.response(payload), repeats
+                )
+            if expected is None:
+                expected = flask_provider.loads(response.get_data())
+            assert flask_provider.loads(response.get_data()) == expected
+            timings.append(timing)
+        size = len(response.get_data()) / 1e6
+        row = "".join(f"{timing:>12.3f}" for timing in timings)
+        print(f"{label:<58} {size:>6.1f}{row}")
+
+
+def measure_response(make_response):
+    """Get the time to the first byte, total time and peak memory (MB) of sending a response."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = iter(make_response().response)
+    first = next(chunks)
+    first_byte = time.perf_counter() - start
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return first_byte, total, peak, size
+
+
+def main_streaming():
+    app = Flask(__name__)
+    provider = APIJSONProvider(app)
+    rng = np.random.default_rng(0)
+    n_days = 365 * 60
+    variables = ["t2_min", "t2_mean", "t2_max", "rh2_mean", "wspd10_mean", "rainnc_sum"]
+    columnar = build_columnar_result(
+        rng.normal(10, 5, (n_days, len(variables))),
+        {
+            "date": [
+                (date(1950, 1, 1) + timedelta(days=i)).strftime("%Y-%m-%d")
+                for i in range(n_days)
+            ],
+            "variable": variables,
+        },
+        precision=1,
+    )
+    cmip6_downscaled = CASES[0][1]()
+    cases = [
+        ("cmip6_downscaled point, dict", cmip6_downscaled, 2),
+        ("era5wrf area, 60 years, columnar", columnar, 0),
+    ]
+
+    print(
+        f"\n{'streaming':<40} {'first byte (s)':>15} {'total (s)':>10} {'peak MB':>8}"
+    )
+    for label, data, levels in cases:
+        with app.app_context():
+            whole = measure_response(lambda: provider.response(data))
+            streamed = measure_response(lambda: provider.stream_response(data, levels))
+        assert whole[3] == streamed[3]
+        for mode, (first_byte, total, peak, _size) in [
+            ("whole", whole),
+            ("streamed", streamed),
+        ]:
+            name = f"{label}, {mode}"
+            print(f"{name:<40} {first_byte:>15.3f} {total:>10.3f} {peak:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
+    main_streaming()
@@ -0,0 +1,99 @@
+"""Benchmark postprocessing (nullify, prune and prune nulls) of large synthetic point and area results.
+
+The payloads are shaped like the packaged results of the cmip6_downscaled point endpoint
+(model > scenario > day > variable) and the era5wrf area endpoint (day > variable), with a share of
+nodata values. The single pass of nullify_and_prune() is compared with the separate passes it replaces.
+
+Run from the root directory of this repository:
+    python -m benchmarks.benchmark_postprocessing
+"""
+
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from postprocessing import (
+    nullify_and_prune,
+    nullify_nodata,
+    prune_nodata,
+    prune_nulls_with_max_intensity,
+)
+
+# (label, endpoint, nesting of the payload above the day keys, number of days, variables, nodata value)
+CASES = [
+    (
+        "cmip6_downscaled point, 6 models x 3 scenarios x 30 years",
+        "cmip6_downscaled",
+        [[f"model{i}" for i in range(6)], ["ssp126", "ssp245", "ssp585"]],
+        365 * 30,
+        ["pr", "tasmax"],
+        -9999,
+    ),
+    (
+        "era5wrf area, 60 years",
+        "era5wrf_4km",
+        [],
+        365 * 60,
+        ["t2_min", "t2_mean", "t2_max", "rh2_mean", "wspd10_mean", "rainnc_sum"],
+        np.nan,
+    ),
+]
+
+
+def make_payload(nesting, n_days, variables, nodata, seed=0):
+    """Make a nested results dict with a fraction of nodata values, including whole nodata days."""
+    rng = np.random.default_rng(seed)
+    days = [
+        (date(1950, 1, 1) + timedelta(days=i)).strftime("%Y-%m-%d")
+        for i in range(n_days)
+    ]
+
+    def make_level(levels):
+        if levels:
+            return {key: make_level(levels[1:]) for key in levels[0]}
+        values = np.round(rng.normal(10, 5, (n_days, len(variables))), 1).tolist()
+        nodata_days = rng.random(n_days) < 0.1
+        nodata_values = rng.random((n_days, len(variables))) < 0.05
+        return {
+            day: {
+                var: nodata if nodata_days[i] or nodata_values[i, j] else values[i][j]
+                for j, var in enumerate(variables)
+            }
+            for i, day in enumerate(days)
+        }
+
+    return make_level(nesting)
+
+
+def best_time(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(repeats=3):
+    print(f"{'case':<58} {'leaves':>8} {'separate (s)':>13} {'fused (s)':>10}")
+    for label, endpoint, nesting, n_days, variables, nodata in CASES:
+        payload = make_payload(nesting, n_days, variables, nodata)
+        n_leaves = int(np.prod([len(level) for level in nesting])) * n_days
+        n_leaves *= len(variables)
+
+        separate, expected = best_time(
+            lambda: prune_nulls_with_max_intensity(
+                prune_nodata(nullify_nodata(payload, endpoint))
+            ),
+            repeats,
+        )
+        fused, actual = best_time(
+            lambda: nullify_and_prune(payload, endpoint, prune_nulls=True), repeats
+        )
+        assert actual == expected
+        print(f"{label:<58} {n_leaves:>8} {separate:>13.3f} {fused:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Benchmark the zonal statistics engine on synthetic coverages and polygons.
+
+The synthetic datasets are shaped like real bbox fetches from the coverages behind the area endpoints,
+and the polygons range from a small watershed to a large borough, with simple and detailed outlines.
+Coverages on a geographic (EPSG:4326) grid, like fire weather, are masked in EPSG:4326 and weighted by
+cell area, the same way as in the routes.
+Each step of the zonal stats process is timed (best wall time of several runs) and its peak memory
+is measured separately with tracemalloc, so that engine changes can be compared objectively.
+
+Run from the root directory of this repository:
+    python -m benchmarks.benchmark_zonal_stats
+    python -m benchmarks.benchmark_zonal_stats --coverages taspr_2km_seasonal --polygons small_simple
+    python -m benchmarks.benchmark_zonal_stats --json results.json
+"""
+
+import argparse
+import itertools
+import json
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+import rioxarray  # noqa: F401, registers the .rio accessor
+import xarray as xr
+from shapely.geometry import Polygon
+
+from zonal_stats import (
+    calculate_zonal_stats,
+    get_geographic_cell_area,
+    get_geographic_cell_weights,
+    get_scale_factor,
+    interpolate,
+    interpolate_and_compute_zonal_means,
+    interpolate_and_compute_zonal_stats,
+    interpolate_and_compute_zonal_sums,
+    rasterize_polygon,
+)
+
+CRS = "EPSG:3338"
+
+# synthetic coverages, shaped like the real coverages:
+#   resolution: grid cell size in meters, or in degrees for EPSG:4326 coverages
+#   crs: optional CRS of the coverage grid, default EPSG:3338
+#   dims: non-XY dimensions and their sizes
+#   time_series: True if the route streams a daily time series through zonal means,
+#       False if it computes zonal stats for every combination of the dimensions
+COVERAGES = {
+    "taspr_2km_seasonal": {
+        "resolution": 2000,
+        "dims": {"model": 5, "scenario": 3, "decade": 3, "season": 4},
+        "time_series": False,
+    },
+    "era5wrf_4km_daily": {
+        "resolution": 4000,
+        "dims": {"time": 365},
+        "time_series": True,
+    },
+    "fire_weather_12km": {
+        "resolution": 12000,
+        "dims": {"time": 184},
+        "time_series": True,
+    },
+    # the fire weather route stays on the EPSG:4326 source grid and weights cells by their area
+    "fire_weather_4326": {
+        "resolution": 0.125,
+        "crs": "EPSG:4326",
+        "dims": {"time": 184},
+        "time_series": True,
+    },
+}
+
+# synthetic polygons: radius in km and number of vertices
+POLYGONS = {
+    "small_simple": {"radius_km": 10, "n_vertices": 32},
+    "small_detailed": {"radius_km": 10, "n_vertices": 5000},
+    "medium_simple": {"radius_km": 60, "n_vertices": 64},
+    "medium_detailed": {"radius_km": 60, "n_vertices": 20000},
+    "large_detailed": {"radius_km": 250, "n_vertices": 50000},
+}
+
+
+def make_polygon(radius_km, n_vertices):
+    """Make an irregular, roughly circular polygon centered on the origin.
+    Args:
+        radius_km (float): mean radius of the polygon in kilometers
+        n_vertices (int): number of vertices in the polygon outline
+    Returns:
+        polygon (geopandas.GeoDataFrame): single polygon in EPSG:3338
+    """
+    rng = np.random.default_rng(0)
+    angles = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    # a few lobes plus noise, so the outline is not a simple convex shape
+    radii = radius_km * 1000 * (1 + 0.2 * np.sin(5 * angles))
+    radii *= 1 + 0.02 * rng.standard_normal(n_vertices)
+    outline = np.column_stack([radii * np.cos(angles), radii * np.sin(angles)])
+    return gpd.GeoDataFrame(geometry=[Polygon(outline)], crs=CRS)
+
+
+def make_dataset(coverage, polygon):
+    """Make a synthetic dataset covering the bounding box of a polygon, like a WCS bbox fetch.
+    Args:
+        coverage (dict): one of the COVERAGES
+        polygon (geopandas.GeoDataFrame): polygon to make the dataset for, in the CRS of the coverage
+    Returns:
+        ds (xarray.DataSet): dataset with a float32 "Gray" variable
+    """
+    resolution = coverage["resolution"]
+    xmin, ymin, xmax, ymax = polygon.total_bounds
+    x = np.arange(np.floor(xmin / resolution), np.ceil(xmax / resolution) + 1)
+    y = np.arange(np.ceil(ymax / resolution), np.floor(ymin / resolution) - 1, -1)
+    dims = coverage["dims"]
+    shape = tuple(dims.values()) + (y.size, x.size)
+
+    rng = np.random.default_rng(0)
+    data = rng.random(shape, dtype="float32")
+    ds = xr.Dataset(
+        {"Gray": (tuple(dims) + ("Y", "X"), data)},
+        coords={
+            **{dim: np.arange(size) for dim, size in dims.items()},
+            "X": x * resolution,
+            "Y": y * resolution,
+        },
+    )
+    return ds.rio.set_spatial_dims("X", "Y").rio.write_crs(coverage.get("crs", CRS))
+
+
+def get_case_scale_factor(ds, polygon):
+    """Get the scale factor the routes would use for a dataset and polygon."""
+    if ds.rio.crs.is_geographic:
+        grid_cell_area_m2 = get_geographic_cell_area(ds, "X", "Y")
+    else:
+        spatial_resolution = ds.rio.resolution()
+        grid_cell_area_m2 = abs(spatial_resolution[0]) * abs(spatial_resolution[1])
+    return get_scale_factor(grid_cell_area_m2, polygon.to_crs(CRS).area)
+
+
+def get_steps(coverage, ds, polygon):
+    """Get the steps of the zonal stats process to benchmark for a coverage and polygon.
+    Each step is run on the outputs of the previous steps, which are prepared here.
+    Args:
+        coverage (dict): one of the COVERAGES
+        ds (xarray.DataSet): synthetic dataset
+        polygon (geopandas.GeoDataFrame): synthetic polygon
+    Returns:
+        tuple: dict mapping step names to functions that take no arguments, and the scale factor
+    """
+    scale_factor = get_case_scale_factor(ds, polygon)
+    dimnames = list(coverage["dims"])
+
+    if coverage["time_series"]:
+        # the routes interpolate a single slice to rasterize the polygon,
+        # then stream the whole time series through zonal means
+        ds_interp = ds.isel(time=0)
+    else:
+        ds_interp = ds
+    da_i = interpolate(ds_interp, "Gray", "X", "Y", scale_factor, method="nearest")
+    polygon_array = rasterize_polygon(da_i, "X", "Y", polygon)
+    da_i_slice = da_i.isel({dim: 0 for dim in da_i.dims if dim in dimnames})
+
+    steps = {
+        "interpolate": lambda: interpolate(
+            ds_interp, "Gray", "X", "Y", scale_factor, method="nearest"
+        ),
+        "rasterize_polygon": lambda: rasterize_polygon(da_i, "X", "Y", polygon),
+        "calculate_zonal_stats": lambda: calculate_zonal_stats(
+            da_i_slice, polygon_array, "X", "Y", compute_full_stats=True
+        ),
+    }
+    if coverage["time_series"] and ds.rio.crs.is_geographic:
+        weights = get_geographic_cell_weights(da_i, "X", "Y")
+        steps["interpolate_and_compute_zonal_sums"] = (
+            lambda: interpolate_and_compute_zonal_sums(
+                ds, "Gray", "X", "Y", scale_factor, polygon_array, weights
+            )
+        )
+    elif coverage["time_series"]:
+        steps["interpolate_and_compute_zonal_means"] = (
+            lambda: interpolate_and_compute_zonal_means(
+                ds, "Gray", "X", "Y", scale_factor, polygon_array
+            )
+        )
+    else:
+        dimension_combinations = [
+            dict(zip(dimnames, coords))
+            for coords in itertools.product(*[ds[dim].values for dim in dimnames])
+        ]
+        steps["interpolate_and_compute_zonal_stats"] = (
+            lambda: interpolate_and_compute_zonal_stats(
+                polygon,
+                ds,
+                CRS,
+                dimension_combinations,
+                compute_full_stats=True,
+            )
+        )
+    return steps, scale_factor
+
+
+def measure(func, repeats):
+    """Measure the best wall time and the peak traced memory of a function.
+    Args:
+        func (callable): function to measure, taking no arguments
+        repeats (int): number of timed runs
+    Returns:
+        tuple: best wall time in seconds, peak memory in MB
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    # measure memory in a separate run, tracing slows everything down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--coverages",
+        default=",".join(COVERAGES),
+        help="comma-separated synthetic coverages to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "--polygons",
+        default=",".join(POLYGONS),
+        help="comma-separated synthetic polygons to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=3, help="timed runs per step (default: 3)"
+    )
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(
+        f"{'coverage':<20} {'polygon':<16} {'grid':>9} {'sf':>3} "
+        f"{'step':<36} {'time (s)':>9} {'peak (MB)':>10}"
+    )
+    for coverage_name in args.coverages.split(","):
+        coverage = COVERAGES[coverage_name]
+        for polygon_name in args.polygons.split(","):
+            polygon = make_polygon(**POLYGONS[polygon_name])
+            polygon = polygon.to_crs(coverage.get("crs", CRS))
+            ds = make_dataset(coverage, polygon)
+            steps, scale_factor = get_steps(coverage, ds, polygon)
+            grid = f"{ds.sizes['Y']}x{ds.sizes['X']}"
+            for step_name, func in steps.items():
+                seconds, peak_mb = measure(func, args.repeats)
+                print(
+                    f"{coverage_name:<20} {polygon_name:<16} {grid:>9} {scale_factor:>3} "
+                    f"{step_name:<36} {seconds:>9.3f} {peak_mb:>10.1f}"
+                )
+                results.append(
+                    {
+                        "coverage": coverage_name,
+                        "polygon": polygon_name,
+                        "grid": grid,
+                        "scale_factor": scale_factor,
+                        "step": step_name,
+                        "seconds": round(seconds, 4),
+                        "peak_mb": round(peak_mb, 1),
+                    }
+                )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
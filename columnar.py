@@ -0,0 +1,160 @@
+"""Columnar results: labeled arrays that are packaged into nested dicts only when serialized.
+
+A columnar result is an xarray DataArray with one dimension per level of the nested JSON
+structure of an endpoint, labeled with the decoded coordinate values (model names, dates,
+variable names, etc.) that become the keys of the nested dicts. The last dimension holds the
+keys of the innermost dicts. NaN is used for missing values, the same way None is used in
+packaged results, and dicts without any values are left out when the result is serialized.
+"""
+
+import numpy as np
+import xarray as xr
+from flask import render_template
+
+from postprocessing import get_nodata_mask
+
+
+def build_columnar_result(values, dim_encodings, precision=None):
+    """Build a columnar result from an array and the labels of its dimensions.
+
+    Args:
+        values (array-like): array with one axis per dimension in dim_encodings
+        dim_encodings (dict): dimension names mapped to lists of labels, in the order of
+            the array axes and of the levels of the nested results
+        precision (int or dict): number of decimals to round values to when serialized,
+            or labels of the last dimension mapped to their number of decimals
+    Returns:
+        result (xarray.DataArray): labeled array of the values
+    """
+    result = xr.DataArray(
+        np.asarray(values, dtype=float),
+        dims=list(dim_encodings),
+        coords={dim: list(labels) for dim, labels in dim_encodings.items()},
+    )
+    result.attrs["precision"] = precision
+    return result
+
+
+def mask_columnar_nodata(result, endpoint):
+    """Replace the nodata values of a columnar result with NaN.
+
+    Args:
+        result (xarray.DataArray): columnar result
+        endpoint (str): key of nodata_mappings for the endpoint
+    Returns:
+        result (xarray.DataArray): columnar result with NaN at nodata values
+    """
+    nodata_mask = get_nodata_mask(result.values, endpoint)
+    if not nodata_mask.any():
+        return result
+    return result.where(~nodata_mask)
+
+
+def postprocess_columnar(result, endpoint):
+    """Mask nodata of a columnar result, and return 404 if there is no data left.
+
+    Args:
+        result (xarray.DataArray): columnar result
+        endpoint (str): key of nodata_mappings for the endpoint
+    Returns:
+        result (xarray.DataArray): postprocessed columnar result, or a 404 error template
+    """
+    result = mask_columnar_nodata(result, endpoint)
+    if not result.notnull().any():
+        return render_template("404/no_data.html"), 404
+    return result
+
+
+def get_labels_with_data(result, dim):
+    """Get the labels of a dimension that have any data in a columnar result.
+
+    Args:
+        result (xarray.DataArray): columnar result
+        dim (str): dimension name
+    Returns:
+        labels (list): labels of the dimension, in order
+    """
+    has_data = result.notnull().any([other for other in result.dims if other != dim])
+    return result[dim].values[has_data.values].tolist()
+
+
+def get_leaf_rounding(result):
+    """Get a rounding function for each label of the last dimension of a columnar result."""
+    precision = result.attrs.get("precision")
+    leaf_labels = result[result.dims[-1]].values.tolist()
+    if not isinstance(precision, dict):
+        precision = dict.fromkeys(leaf_labels, precision)
+
+    def get_rounding(digits):
+        if digits is None:
+            return float
+        return lambda value: round(float(value), digits)
+
+    return [get_rounding(precision.get(label)) for label in leaf_labels]
+
+
+def columnar_to_nested_dict(result):
+    """Package a columnar result into the nested dict structure of the endpoint.
+    Missing values are left out of the innermost dicts, and dicts without any values are
+    left out altogether, like postprocess() with prune_nulls=True prunes packaged results.
+
+    Args:
+        result (xarray.DataArray): columnar result
+    Returns:
+        nested (dict): nested dict with one level per dimension of the result
+    """
+    values = result.values
+    valid = ~np.isnan(values)
+    labels = [result[dim].values.tolist() for dim in result.dims]
+    rounding = get_leaf_rounding(result)
+    # has_data[level] marks which labels of each level have any values below them
+    has_data = [
+        valid.any(axis=tuple(range(level + 1, values.ndim)))
+        for level in range(values.ndim - 1)
+    ]
+
+    def nest(level, index):
+        if level == values.ndim - 1:
+            return {
+                labels[level][i]: rounding[i](values[index + (i,)])
+                for i in np.flatnonzero(valid[index])
+            }
+        return {
+            labels[level][i]: nest(level + 1, index + (i,))
+            for i in np.flatnonzero(has_data[level][index])
+        }
+
+    return nest(0, ())
+
+
+def iter_columnar_csv_rows(result, chunk_size=10000):
+    """Yield CSV rows from a columnar result, one row per label combination of all but the
+    last dimension with any values: the labels, then the values of each label of the last
+    dimension (None where missing). Rows are formatted a column at a time, chunk_size rows
+    at a time.
+
+    Args:
+        result (xarray.DataArray): columnar result
+        chunk_size (int): number of rows to format at a time
+    Yields:
+        tuples of the labels and values of each row
+    """
+    values = result.values.reshape(-1, result.shape[-1])
+    valid = ~np.isnan(values)
+    rows_with_data = np.flatnonzero(valid.any(axis=1))
+    labels = [result[dim].values for dim in result.dims[:-1]]
+    rounding = get_leaf_rounding(result)
+
+    for start in range(0, rows_with_data.size, chunk_size):
+        rows = rows_with_data[start : start + chunk_size]
+        index = np.unravel_index(rows, result.shape[:-1])
+        columns = [dim_labels[i].tolist() for dim_labels, i in zip(labels, index)]
+        for i, round_value in enumerate(rounding):
+            column = values[rows, i]
+            columns.append(
+                [
+                    round_value(value) if is_valid else None
+                    for value, is_valid in zip(column.tolist(), valid[rows, i].tolist())
+                ]
+            )
+        yield from zip(*columns)
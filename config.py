@@ -12,6 +12,114 @@ SEAICE_BBOX = [-180, 30.98, 180, 90]
 INDICATORS_BBOX = [0, 49.94, 359.37, 90]
 WEB_APP_URL = os.getenv("WEB_APP_URL") or "https://northernclimatereports.org/"
 
+# Zonal stats executor: "thread", "process", or "serial" to disable parallelism.
+# The pool is shared by every request in a worker, and a single request never
+# has more than ZONAL_STATS_REQUEST_CONCURRENCY tasks running at once.
+ZONAL_STATS_EXECUTOR = os.getenv("API_ZONAL_STATS_EXECUTOR") or "thread"
+ZONAL_STATS_MAX_WORKERS = int(
+    os.getenv("API_ZONAL_STATS_MAX_WORKERS") or min(4, os.cpu_count() or 1)
+)
+ZONAL_STATS_REQUEST_CONCURRENCY = int(
+    os.getenv("API_ZONAL_STATS_REQUEST_CONCURRENCY") or 2
+)
+# Memory budget (MB) for the interpolated array of each time series zonal stats task.
+# Long daily time series are streamed through in time chunks that fit the budget, 0 disables.
+ZONAL_STATS_MEMORY_BUDGET_MB = int(os.getenv("API_ZONAL_STATS_MEMORY_BUDGET_MB") or 256)
+
+# Polygons are simplified before rasterization, to this fraction of the oversampled pixel size, 0 disables.
+ZONAL_STATS_SIMPLIFY_TOLERANCE = float(
+    os.getenv("API_ZONAL_STATS_SIMPLIFY_TOLERANCE") or 0.25
+)
+
+# Polygons covering at least this many native grid cells are not oversampled, the boundary error is negligible.
+ZONAL_STATS_NATIVE_CELLS = int(os.getenv("API_ZONAL_STATS_NATIVE_CELLS") or 20000)
+# Area bbox fetches spanning more native grid cells than this request a decimated grid from
+# Rasdaman (WCS scaling), bounding download size and compute for the largest places, 0 disables.
+ZONAL_STATS_WCS_MAX_CELLS = int(os.getenv("API_ZONAL_STATS_WCS_MAX_CELLS") or 0)
+
+# Opt-in pushdown of mean-only area queries to Rasdaman (WCPS clip and avg), so only the means are
+# transferred. A fraction of pushdown results is also computed locally and checked, pushdown results
+# whose largest difference exceeds the tolerance (relative to the largest local mean) are not used.
+if os.getenv("API_ZONAL_STATS_PUSHDOWN"):
+    ZONAL_STATS_PUSHDOWN = os.getenv("API_ZONAL_STATS_PUSHDOWN").lower() == "true"
+else:
+    ZONAL_STATS_PUSHDOWN = False
+ZONAL_STATS_PUSHDOWN_CHECK_RATE = float(
+    os.getenv("API_ZONAL_STATS_PUSHDOWN_CHECK_RATE") or 0.1
+)
+ZONAL_STATS_PUSHDOWN_TOLERANCE = float(
+    os.getenv("API_ZONAL_STATS_PUSHDOWN_TOLERANCE") or 0.02
+)
+# Pushdown queries with longer URLs (i.e. very detailed polygons) are computed locally instead.
+ZONAL_STATS_PUSHDOWN_MAX_URL_LENGTH = int(
+    os.getenv("API_ZONAL_STATS_PUSHDOWN_MAX_URL_LENGTH") or 8000
+)
+
+# Persistent cache of packaged area (zonal stats) results, off unless enabled. Results are stored as
+# JSON in a directory that must be owned by the API user and not writable by anyone else.
+if os.getenv("API_ZONAL_STATS_CACHE"):
+    ZONAL_STATS_CACHE = os.getenv("API_ZONAL_STATS_CACHE").lower() == "true"
+else:
+    ZONAL_STATS_CACHE = False
+ZONAL_STATS_CACHE_DIR = os.getenv("API_ZONAL_STATS_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "data_api_zonal_stats"
+)
+# Cached results older than this many seconds are recomputed, 0 disables.
+ZONAL_STATS_CACHE_MAX_AGE = int(
+    os.getenv("API_ZONAL_STATS_CACHE_MAX_AGE") or 30 * 24 * 3600
+)
+# Size limit (MB) of the cache directory, the oldest results are removed beyond it, 0 disables.
+ZONAL_STATS_CACHE_MAX_MB = int(os.getenv("API_ZONAL_STATS_CACHE_MAX_MB") or 1024)
+# How often (seconds) coverage metadata is re-checked for changes that invalidate cached results.
+ZONAL_STATS_CACHE_VERSION_TTL = int(
+    os.getenv("API_ZONAL_STATS_CACHE_VERSION_TTL") or 3600
+)
+
+# How often (seconds) the in-memory directory of place names and types used for CSV metadata is
+# reloaded from GeoServer.
+PLACE_DIRECTORY_TTL = int(os.getenv("API_PLACE_DIRECTORY_TTL") or 3600)
+
+# Area bbox fetches are snapped to a fixed grid of tiles (meters for EPSG:3338 coverages, degrees for
+# EPSG:4326), fetched concurrently and cached, so overlapping and repeated areas reuse tiles. A bbox
+# needing more than BBOX_TILE_MAX_TILES tiles, or smaller than a quarter of a tile on both sides, is
+# fetched directly. A tile size of 0 disables tiling.
+BBOX_TILE_SIZE_M = float(os.getenv("API_BBOX_TILE_SIZE_M") or 50000)
+BBOX_TILE_SIZE_DEG = float(os.getenv("API_BBOX_TILE_SIZE_DEG") or 0.5)
+BBOX_TILE_MAX_TILES = int(os.getenv("API_BBOX_TILE_MAX_TILES") or 36)
+# Size (MB) of the in-memory LRU cache of fetched tiles, per worker. Tiles expire after
+# ZONAL_STATS_CACHE_VERSION_TTL seconds so that coverage updates are picked up.
+BBOX_TILE_CACHE_MB = int(os.getenv("API_BBOX_TILE_CACHE_MB") or 256)
+
+# Batch area requests: maximum number of places per request, and how much larger (by area) the
+# bbox covering a group of places may be than their own bboxes before they are fetched separately.
+ZONAL_STATS_BATCH_MAX_PLACES = int(os.getenv("API_ZONAL_STATS_BATCH_MAX_PLACES") or 50)
+ZONAL_STATS_BATCH_BBOX_RATIO = float(
+    os.getenv("API_ZONAL_STATS_BATCH_BBOX_RATIO") or 4
+)
+# The parts of a multi-part place (e.g. the Aleutians) are fetched in up to this many bboxes,
+# grouped by the same bbox ratio, instead of one bbox covering all of them.
+ZONAL_STATS_MAX_BBOXES = int(os.getenv("API_ZONAL_STATS_MAX_BBOXES") or 8)
+
+# JSON encoder for responses: "orjson" (falls back to "json" if orjson is not installed) or "json".
+# Keys are serialized in the order the results were packaged unless API_JSON_SORT_KEYS is true.
+JSON_ENCODER = os.getenv("API_JSON_ENCODER") or "orjson"
+if os.getenv("API_JSON_SORT_KEYS"):
+    JSON_SORT_KEYS = os.getenv("API_JSON_SORT_KEYS").lower() == "true"
+else:
+    JSON_SORT_KEYS = False
+# Large time series responses are streamed, serializing this many items of their time level at a time.
+if os.getenv("API_JSON_STREAMING"):
+    JSON_STREAMING = os.getenv("API_JSON_STREAMING").lower() == "true"
+else:
+    JSON_STREAMING = True
+JSON_STREAM_CHUNK_SIZE = int(os.getenv("API_JSON_STREAM_CHUNK_SIZE") or 1000)
+# CSV responses are streamed, writing this many rows at a time.
+CSV_STREAM_CHUNK_ROWS = int(os.getenv("API_CSV_STREAM_CHUNK_ROWS") or 1000)
+# Compression of ?format=parquet and ?format=arrow exports: "zstd", "lz4" or "none".
+TABLE_COMPRESSION = os.getenv("API_TABLE_COMPRESSION") or "zstd"
+# zlib compression level (1-9) of ?format=netcdf exports.
+NETCDF_COMPRESSION_LEVEL = int(os.getenv("API_NETCDF_COMPRESSION_LEVEL") or 4)
+
 if os.getenv("SITE_OFFLINE"):
     SITE_OFFLINE = os.getenv("SITE_OFFLINE").lower() == "true"
 else:
@@ -1,14 +1,53 @@
-from flask import request, Response, render_template
-import copy
+from flask import request, Response, render_template, stream_with_context
 import csv
 import io
+import logging
+from itertools import islice
 from urllib.parse import quote
+import xarray as xr
 from postprocessing import nullify_and_prune
-from fetch_data import extract_nested_dict_keys, get_from_dict
+from columnar import iter_columnar_csv_rows, mask_columnar_nodata
+from config import CSV_STREAM_CHUNK_ROWS, TABLE_COMPRESSION
 from luts import place_type_labels, demographics_order
 from validate_data import place_name_and_type
 from datetime import datetime
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# ?format= values of tabular exports: CSV, or typed columnar files written with pyarrow
+TABULAR_FORMATS = ["csv", "parquet", "arrow"]
+
+# file extension and media type of the formats written by write_table()
+table_formats = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrows", "application/vnd.apache.arrow.stream"),
+}
+
+
+def output_formats(*formats):
+    """Declare the ?format= values a route supports, checked before each request by
+    validate_get_params() in application.py. Routes that do not declare any only accept
+    "csv" (which routes without a CSV export ignore, like before).
+
+    Args:
+        formats (str): supported formats, e.g. *TABULAR_FORMATS, "netcdf"
+
+    Returns:
+        decorator to apply to the route function, below its @routes.route() decorators
+    """
+
+    def decorator(view):
+        view.output_formats = list(formats)
+        return view
+
+    return decorator
+
 
 def create_csv(
     data,
@@ -24,7 +63,8 @@ def create_csv(
 ):
     """Create a CSV for any supported data set
     Args:
-        data (dict): dict with same structure as corresponding JSON endpoint
+        data (dict): dict with same structure as corresponding JSON endpoint,
+            or a columnar result (xarray.DataArray) for the cmip6_monthly and era5wrf_4km endpoints
         endpoint (str): string used to determine CSV processing approach
         place_id (str): place identifier (e.g., AK124)
         lat: latitude for points or None for polygons
@@ -35,8 +75,13 @@ def create_csv(
         start_year: optional start year for CSV
         end_year: optional end year for CSV
     Returns:
-        CSV Response
+        CSV Response, or Parquet or Arrow IPC stream Response if requested with ?format=
     """
+    output_format = request.args.get("format")
+    if output_format in table_formats and pa is None:
+        logger.error(f"pyarrow is not installed, cannot write {output_format} files")
+        return render_template("500/server_error.html"), 500
+
     if not place_id:
         place_id = request.args.get("community")
     if endpoint in ["conus_hydrology", "arctic_hydrology"]:
@@ -55,9 +100,14 @@ def create_csv(
 
     properties = {}
 
-    data = nullify_and_prune(data, endpoint)
-    if data in [{}, None, 0]:
-        return render_template("404/no_data.html"), 404
+    if isinstance(data, xr.DataArray):
+        data = mask_columnar_nodata(data, endpoint)
+        if not data.notnull().any():
+            return render_template("404/no_data.html"), 404
+    else:
+        data = nullify_and_prune(data, endpoint)
+        if data in [{}, None, 0]:
+            return render_template("404/no_data.html"), 404
 
     if endpoint == "beetles":
         properties = beetles_csv(data)
@@ -144,6 +194,12 @@ def create_csv(
             filename += "All communities in Alaska"
         else:
             filename += lat + " " + lon
+
+    if output_format in table_formats:
+        extension, _media_type = table_formats[output_format]
+        properties["filename"] = quote(filename + extension)
+        return write_table(properties, output_format)
+
     filename += ".csv"
     properties["filename"] = quote(filename)
 
@@ -218,85 +274,207 @@ def build_csv_dicts(packaged_data, package_coords, fill_di=None, values=None):
     Returns:
         list of dicts with keys/values corresponding to fieldnames
     """
-    # extract the coordinate values stored in keys. assumes uniform structure
-    # across entire data package (i.e. n levels deep where n == len(fieldnames))
-    data_package_coord_combos = extract_nested_dict_keys(packaged_data)
-    rows = []
-    previous_coord_breadcrumb = None
-    for coords in data_package_coord_combos:
-        # If there is no data, don't add to CSV line
-        if len(coords) <= 1:
-            continue
-        row_di = {}
-        # need more general way of handling fields to be inserted before or after
-        # what are actually available in packaged dicts
-        for field, coord in zip(package_coords, coords):
-            row_di[field] = coord
-        # fill in columns with fixed values if specified
-        if fill_di:
-            for fieldname, value in fill_di.items():
-                row_di[fieldname] = value
-        # write the actual value
-        coords.pop()
-        coord_breadcrumb = coords
-        if coord_breadcrumb == previous_coord_breadcrumb:
-            continue
+    return list(iter_csv_dicts(packaged_data, package_coords, fill_di, values))
+
+
+def iter_csv_dicts(packaged_data, package_coords, fill_di=None, values=None):
+    """
+    Yields the rows of build_csv_dicts() one at a time, as the packaged data is walked.
+    Args:
+        packaged_data (json): JSONlike data package output
+            from the run_fetch_* and run_aggregate_* functions
+        package_coords (list): list of string values corresponding to
+            levels of the packaged_data dict. Should be a subset of fieldnames arg.
+        fill_di (dict): dict to fill in columns with fixed values.
+            Keys should specify the field name and value should be the
+            value to fill
+
+    Yields:
+        dicts with keys/values corresponding to fieldnames
+    """
+    # walk the data package once, writing a row for each dict that holds values.
+    # assumes uniform structure across entire data package
+    # (i.e. n levels deep where n == len(fieldnames))
+    stack = [(packaged_data, iter(packaged_data.items()), [])]
+    previous_node = None
+    while stack:
+        node, items, coords = stack[-1]
+        for key, child in items:
+            if isinstance(child, dict) and len(child) > 0:
+                stack.append((child, iter(child.items()), coords + [key]))
+                break
+            # If there is no data, don't add to CSV line. Dicts holding values
+            # are written once, at their first value (or run of values).
+            if not coords or node is previous_node:
+                continue
+            previous_node = node
+            # need more general way of handling fields to be inserted before or after
+            # what are actually available in packaged dicts
+            row_di = dict(zip(package_coords, coords + [key]))
+            # fill in columns with fixed values if specified
+            if fill_di:
+                row_di.update(fill_di)
+            # write the actual values
+            for value in values:
+                row_di[value] = node.get(value)
+            yield row_di
         else:
-            previous_coord_breadcrumb = coord_breadcrumb
-        for value in values:
-            coords.append(value)
-            try:
-                row_di[value] = get_from_dict(packaged_data, coords)
-            except KeyError:
-                row_di[value] = None
-            coords.pop()
-        rows.append(row_di)
+            stack.pop()
 
-    return rows
+
+def iter_csv_lines(properties):
+    """
+    Yields the metadata, the header and then the rows of a CSV file as they are written,
+    CSV_STREAM_CHUNK_ROWS rows at a time.
+
+    Args:
+        properties (dict): metadata, fieldnames and either CSV dicts or CSV rows
+            (sequences of values in fieldnames order), as a list or any iterable
+
+    Yields:
+        CSV text
+    """
+    output = io.StringIO()
+    output.write(properties["metadata"])
+    if "csv_rows" in properties:
+        writer = csv.writer(output)
+        writer.writerow(properties["fieldnames"])
+        csv_rows = iter(properties["csv_rows"])
+    else:
+        writer = csv.DictWriter(output, fieldnames=properties["fieldnames"])
+        writer.writeheader()
+        csv_rows = iter(properties["csv_dicts"])
+    yield output.getvalue()
+
+    while rows := list(islice(csv_rows, CSV_STREAM_CHUNK_ROWS)):
+        output.seek(0)
+        output.truncate()
+        writer.writerows(rows)
+        yield output.getvalue()
+
+
+def attachment_headers(filename, content_type):
+    """
+    Creates the headers of a downloadable file.
+
+    Args:
+        filename (str): URL-quoted file name
+        content_type (str): Content-Type header value
+
+    Returns:
+        dict of headers
+    """
+    return {
+        "Content-Type": content_type,
+        "Content-Disposition": "attachment; filename="
+        + filename
+        + "; filename*=utf-8''"
+        + filename,
+    }
 
 
 def write_csv(properties):
     """
-    Creates and returns a downloadable CSV file from list of CSV dicts.
+    Creates and returns a downloadable CSV file from CSV dicts, streamed as the rows are written.
 
     Args:
-        properties (dict): metadata, fieldnames, CSV dicts, and filename
+        properties (dict): metadata, fieldnames, CSV dicts or rows, and filename
 
     Returns:
         CSV Response
     """
-    output = io.StringIO()
-    output.write(properties["metadata"])
-    writer = csv.DictWriter(output, fieldnames=properties["fieldnames"])
-    writer.writeheader()
-    writer.writerows(properties["csv_dicts"])
-
     response = Response(
-        output.getvalue(),
+        stream_with_context(iter_csv_lines(properties)),
         mimetype="text/csv",
-        headers={
-            "Content-Type": "text/csv; charset=utf-8",
-            "Content-Disposition": "attachment; filename="
-            + properties["filename"]
-            + "; filename*=utf-8''"
-            + properties["filename"],
-        },
+        headers=attachment_headers(properties["filename"], "text/csv; charset=utf-8"),
     )
     return response
 
 
-def era5wrf_csv(data):
+def build_column_array(values):
+    """
+    Builds a typed Arrow array of the values of a CSV column. Types are inferred from the
+    values, empty strings are read as missing values if the other values are not strings,
+    and columns of mixed types are written as strings.
 
-    csv_dicts = []
-    for date in sorted(data.keys()):
-        row = {"date": date}
-        row.update(data[date])
-        csv_dicts.append(row)
+    Args:
+        values (sequence): values of the column, None where missing
+
+    Returns:
+        pyarrow.Array
+    """
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    try:
+        return pa.array([None if value == "" else value for value in values])
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if value is None else str(value) for value in values])
+
+
+def build_table(properties):
+    """
+    Builds an Arrow table with the same columns and rows as the CSV file of the properties.
+    The CSV metadata lines are kept in the "metadata" key of the schema metadata.
+
+    Args:
+        properties (dict): metadata, fieldnames and either CSV dicts or CSV rows
 
-    if not csv_dicts:
-        fieldnames = ["date"]
+    Returns:
+        pyarrow.Table
+    """
+    fieldnames = properties["fieldnames"]
+    if "csv_rows" in properties:
+        rows = properties["csv_rows"]
     else:
-        fieldnames = ["date"] + [key for key in csv_dicts[0].keys() if key != "date"]
+        rows = (
+            tuple(row.get(field) for field in fieldnames)
+            for row in properties["csv_dicts"]
+        )
+    columns = list(zip(*rows)) or [()] * len(fieldnames)
+
+    table = pa.table(
+        [build_column_array(values) for values in columns], names=fieldnames
+    )
+    return table.replace_schema_metadata({"metadata": properties["metadata"]})
+
+
+def write_table(properties, output_format):
+    """
+    Creates and returns a downloadable Parquet file or Arrow IPC stream of the CSV rows,
+    compressed with TABLE_COMPRESSION.
+
+    Args:
+        properties (dict): metadata, fieldnames, CSV dicts or rows, and filename
+        output_format (str): "parquet" or "arrow"
+
+    Returns:
+        Parquet or Arrow IPC stream Response
+    """
+    table = build_table(properties)
+    compression = None if TABLE_COMPRESSION == "none" else TABLE_COMPRESSION
+    sink = pa.BufferOutputStream()
+    if output_format == "parquet":
+        pq.write_table(table, sink, compression=compression or "none")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=CSV_STREAM_CHUNK_ROWS)
+
+    _extension, media_type = table_formats[output_format]
+    return Response(
+        sink.getvalue().to_pybytes(),
+        mimetype=media_type,
+        headers=attachment_headers(properties["filename"], media_type),
+    )
+
+
+def era5wrf_csv(data):
+    # data is a columnar result with date and variable dimensions
+    data = data.dropna("variable", how="all").sortby("date")
+    csv_rows = iter_columnar_csv_rows(data)
+    fieldnames = ["date"] + data["variable"].values.tolist()
 
     filename = "Dynamically Downscaled ERA5 4km Data"
     metadata_variables = {
@@ -321,7 +499,7 @@ def era5wrf_csv(data):
     metadata += "#\n"
 
     return {
-        "csv_dicts": csv_dicts,
+        "csv_rows": csv_rows,
         "fieldnames": fieldnames,
         "metadata": metadata,
         "filename_data_name": filename,
@@ -402,7 +580,7 @@ def cmip6_downscaled_csv(data, vars=None):
         values = list(metadata_variables.keys())
 
     fieldnames = coords + values
-    csv_dicts = build_csv_dicts(data, fieldnames, values=values)
+    csv_dicts = iter_csv_dicts(data, fieldnames, values=values)
 
     metadata = ""
     for variable in values:
@@ -500,7 +678,8 @@ def cmip6_monthly_csv(data, vars=None):
         values = list(metadata_variables.keys())
 
     fieldnames = coords + values
-    csv_dicts = build_csv_dicts(data, fieldnames, values=values)
+    # data is a columnar result with model, scenario, month, and variable dimensions
+    csv_rows = iter_columnar_csv_rows(data.sel(variable=values))
 
     metadata = ""
     for variable in values:
@@ -536,7 +715,7 @@ def cmip6_monthly_csv(data, vars=None):
     )
 
     return {
-        "csv_dicts": csv_dicts,
+        "csv_rows": csv_rows,
         "fieldnames": fieldnames,
         "metadata": metadata,
         "filename_data_name": filename_data_name,
@@ -915,7 +1094,7 @@ def taspr_csv(data, endpoint):
         for csv_dict in csv_dicts:
             # Add "tas" to variable column and rename value column to "mean".
             if "tas" in csv_dict:
-                tas_dict = copy.deepcopy(csv_dict)
+                tas_dict = dict(csv_dict)
                 if "pr" in tas_dict:
                     del tas_dict["pr"]
                 tas_dict["variable"] = "tas"
@@ -923,7 +1102,7 @@ def taspr_csv(data, endpoint):
                 reformatted_csv_dicts.append(tas_dict)
             # Add "pr" to variable column and rename value column to "mean".
             if "pr" in csv_dict:
-                pr_dict = copy.deepcopy(csv_dict)
+                pr_dict = dict(csv_dict)
                 if "tas" in pr_dict:
                     del pr_dict["tas"]
                 pr_dict["variable"] = "pr"
@@ -933,14 +1112,14 @@ def taspr_csv(data, endpoint):
             if "tas" not in csv_dict and "pr" not in csv_dict:
                 reformatted_csv_dicts.append(csv_dict)
 
-            if "tas" in all_fields:
-                all_fields.remove("tas")
-            if "pr" in all_fields:
-                all_fields.remove("pr")
-            all_fields.append("mean")
+        if "tas" in all_fields:
+            all_fields.remove("tas")
+        if "pr" in all_fields:
+            all_fields.remove("pr")
+        all_fields.append("mean")
 
-            csv_dicts = reformatted_csv_dicts
-            fieldnames = list(dict.fromkeys(all_fields))
+        csv_dicts = reformatted_csv_dicts
+        fieldnames = list(dict.fromkeys(all_fields))
 
     elif endpoint in ["temperature_mmm", "precipitation_mmm"]:
         tas_metadata = "# tas is the temperature at surface in degrees Celsius\n"
@@ -1284,10 +1463,10 @@ def fire_weather_csv(data, filename_prefix, vars):
                         row.update(data[time_period][variable][model][date])
                         for stat in ["min", "mean", "max"]:
                             row[stat] = data[time_period][variable][model][date][stat]
-                        csv_dicts.append(copy.deepcopy(row))
+                        csv_dicts.append(dict(row))
                 else:  # op is "summer_fire_danger_rating_days"
                     row.update(data[time_period][variable][model])
-                    csv_dicts.append(copy.deepcopy(row))
+                    csv_dicts.append(dict(row))
 
     fieldnames = ["period", "variable", "model"]
     if "Rolling" in filename_prefix:
@@ -1371,7 +1550,7 @@ def conus_hydrology_csv(data, filename_prefix, source_metadata):
                         }
                         if "Statistics" in filename_prefix:
                             row.update(data["data"][landcover][model][scenario][era])
-                            csv_dicts.append(copy.deepcopy(row))
+                            csv_dicts.append(dict(row))
                         else:  # modeled or observed daily climatology
                             for doy_dict in data["data"][landcover][model][scenario][
                                 era
@@ -1384,7 +1563,7 @@ def conus_hydrology_csv(data, filename_prefix, source_metadata):
                                         and var_key != "water_year_index"
                                     ):
                                         row[var_key] = doy_dict[var_key]
-                                csv_dicts.append(copy.deepcopy(row))
+                                csv_dicts.append(dict(row))
     fieldnames = ["landcover", "model", "scenario", "era"]
     if "Statistics" in filename_prefix:
         # get variable keys from metadata to use as fieldnames
@@ -1534,7 +1713,7 @@ def arctic_hydrology_csv(data, filename_prefix, source_metadata):
                 }
                 if "Statistics" in filename_prefix:
                     row.update(data["data"][model][era])
-                    csv_dicts.append(copy.deepcopy(row))
+                    csv_dicts.append(dict(row))
                 else:  # modeled daily climatology
                     for doy_dict in data["data"][model][era]:
                         row["doy"] = doy_dict["doy"]
@@ -1542,7 +1721,7 @@ def arctic_hydrology_csv(data, filename_prefix, source_metadata):
                         for var_key in doy_dict.keys():
                             if var_key != "doy" and var_key != "water_year_index":
                                 row[var_key] = doy_dict[var_key]
-                        csv_dicts.append(copy.deepcopy(row))
+                        csv_dicts.append(dict(row))
     fieldnames = ["model", "era"]
     if "Statistics" in filename_prefix:
         # get variable keys from metadata to use as fieldnames
@@ -2,7 +2,6 @@
 A module of data gathering functions for use across multiple endpoints.
 """
 
-import copy
 import io
 import logging
 import operator
@@ -14,11 +13,21 @@ import json
 import re
 import ast
 import datetime
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
 from functools import reduce
-from aiohttp import ClientSession
+import numpy as np
+from aiohttp import ClientResponseError, ClientSession
 from flask import current_app as app
 
+from config import (
+    BBOX_TILE_CACHE_MB,
+    BBOX_TILE_MAX_TILES,
+    BBOX_TILE_SIZE_DEG,
+    BBOX_TILE_SIZE_M,
+    ZONAL_STATS_CACHE_VERSION_TTL,
+)
+
 from generate_requests import (
     generate_wcs_getcov_str,
     generate_netcdf_wcs_getcov_str,
@@ -31,10 +40,21 @@ from generate_urls import (
     generate_wms_and_wfs_query_urls,
     generate_wfs_places_url,
     generate_describe_coverage_url,
+    generate_gs_describe_coverage_url,
 )
 
 logger = logging.getLogger(__name__)
 
+# bbox subsets of WCS GetCoverage URLs, e.g. "SUBSET=X(x1,x2)&SUBSET=Y(y1,y2)"
+WCS_BBOX_SUBSET_RE = re.compile(
+    r"SUBSET=(X|lon)\(([^,()]+),([^,()]+)\)&SUBSET=(Y|lat)\(([^,()]+),([^,()]+)\)"
+)
+
+# netCDF bytes of fetched bbox tiles, keyed by tile URL (least recently used first)
+_netcdf_tiles = OrderedDict()
+_netcdf_tiles_nbytes = 0
+_netcdf_tiles_lock = threading.Lock()
+
 
 async def fetch_wcs_point_data(x, y, cov_id, var_coord=None):
     """Create the async request for data at the specified point.
@@ -196,6 +216,36 @@ def get_poly(poly_id, crs=3338):
     return poly
 
 
+def get_polys(poly_ids, crs=3338):
+    """Get a GeoDataFrame of many polygons from GeoServer, fetching them concurrently.
+    Assumes GeoServer polygons are in EPSG:4326; returns in EPSG:3338 if CRS is not specified.
+    Args:
+        poly_ids (list): list of polygon IDs, e.g. ["FWS12", "19010208"]
+        crs (int): EPSG CRS code
+    Returns:
+        polys (GeoDataFrame): GeoDataFrame with one row per polygon ID found, in the
+            order requested, with the polygon ID in the "id" column
+    """
+    urls = [
+        generate_wfs_places_url("all_boundaries:all_areas", "the_geom", poly_id, "id")
+        for poly_id in poly_ids
+    ]
+    geometries = asyncio.run(fetch_data(urls))
+    if len(urls) == 1:
+        geometries = [geometries]
+
+    features = []
+    for poly_id, geometry in zip(poly_ids, geometries):
+        for feature in geometry["features"]:
+            feature["properties"] = {"id": poly_id}
+            features.append(feature)
+
+    polys = gpd.GeoDataFrame.from_features(features, columns=["geometry", "id"])
+    polys = polys.set_crs(4326).to_crs(crs)
+
+    return polys
+
+
 async def fetch_bbox_geotiff_from_gs(url):
     """Make the async request for GeoTIFF data within the specified bbox
 
@@ -235,7 +285,8 @@ async def fetch_bbox_netcdf(url):
 
 
 async def fetch_bbox_netcdf_list(urls):
-    """Make the async request for the data within the specified bbox
+    """Make the async request for the data within the specified bbox.
+    WCS GetCoverage bboxes are fetched as cached tiles, see fetch_wcs_bbox_netcdf().
 
     Args:
         urls (list): list of URL containing WCS request for bbox in netcdf format
@@ -244,17 +295,208 @@ async def fetch_bbox_netcdf_list(urls):
         xarray.DataSet containing results of WCS netCDF query
     """
     start_time = time.time()
-    netcdf_bytes_list = await fetch_data(urls)
-
-    if not isinstance(netcdf_bytes_list, list):
-        netcdf_bytes_list = [netcdf_bytes_list]
+    ds_list = await asyncio.gather(*[fetch_wcs_bbox_netcdf(url) for url in urls])
 
     app.logger.info(
         f"Fetched BBOX data from Rasdaman, elapsed time {round(time.time() - start_time)}s"
     )
-    # create xarray.DataSets from bytestring list
-    ds_list = [xr.open_dataset(io.BytesIO(bytestr)) for bytestr in netcdf_bytes_list]
-    return ds_list
+    return list(ds_list)
+
+
+async def fetch_wcs_bbox_netcdf(url):
+    """Fetch the netCDF data of a WCS GetCoverage bbox request as tiles of the coverage's tile grid.
+    Requests without a bbox subset, or with WCS scaling (which changes the grid), are fetched as is.
+
+    Args:
+        url (str): URL containing WCS request for bbox in netcdf format
+    Returns:
+        xarray.DataSet containing results of WCS netCDF query
+    """
+    match = WCS_BBOX_SUBSET_RE.search(url)
+    if match is None or "SCALEFACTOR" in url or "SCALEAXES" in url:
+        netcdf_bytes = await fetch_data([url])
+        return xr.open_dataset(io.BytesIO(netcdf_bytes))
+
+    x_dim, x1, x2, y_dim, y1, y2 = match.groups()
+    bbox_bounds = (float(x1), float(y1), float(x2), float(y2))
+    tile_size = BBOX_TILE_SIZE_DEG if x_dim == "lon" else BBOX_TILE_SIZE_M
+
+    def get_url(bounds):
+        xmin, ymin, xmax, ymax = bounds
+        subset = f"SUBSET={x_dim}({xmin},{xmax})&SUBSET={y_dim}({ymin},{ymax})"
+        return url[: match.start()] + subset + url[match.end() :]
+
+    return await fetch_tiled_bbox_netcdf(bbox_bounds, get_url, x_dim, y_dim, tile_size)
+
+
+async def fetch_tiled_bbox_netcdf(bbox_bounds, get_url, x_dim, y_dim, tile_size):
+    """Fetch the netCDF data of a bbox by snapping it to a fixed grid of tiles, fetching the tiles
+    concurrently (or reusing cached ones) and mosaicking them back together, so that overlapping
+    and repeated bboxes share tiles.
+
+    Args:
+        bbox_bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        get_url (function): returns the request URL for a 4-tuple of bounds
+        x_dim (str): name of the x dimension of the fetched data
+        y_dim (str): name of the y dimension of the fetched data
+        tile_size (float): tile size in the units of the bbox, 0 to fetch the bbox directly
+            (bboxes much smaller than a tile are also fetched directly)
+    Returns:
+        xarray.DataSet with the cells intersecting the bbox
+    """
+    xmin, ymin, xmax, ymax = bbox_bounds
+    tiles = get_bbox_tiles(bbox_bounds, tile_size)
+    if len(tiles) > BBOX_TILE_MAX_TILES:
+        # large areas would need too many requests, and are rarely repeated exactly
+        tiles = []
+    elif xmax - xmin < tile_size / 4 and ymax - ymin < tile_size / 4:
+        # fetching whole tiles (up to four, across a tile corner) for a small bbox costs far
+        # more than the bbox itself
+        tiles = []
+
+    if tiles:
+        try:
+            tile_bytes = await fetch_netcdf_tiles([get_url(tile) for tile in tiles])
+            tile_datasets = [xr.open_dataset(io.BytesIO(b)) for b in tile_bytes]
+            return mosaic_bbox_tiles(tile_datasets, tiles, bbox_bounds, x_dim, y_dim)
+        except (ClientResponseError, ValueError) as exc:
+            # tiles reaching past the edge of a coverage can be rejected or clipped (and then
+            # do not line up with their neighbours), so fetch the bbox itself
+            logger.info(f"Tiled fetch failed ({exc}), fetching the whole bbox")
+
+    netcdf_bytes = await fetch_data([get_url(bbox_bounds)])
+    return xr.open_dataset(io.BytesIO(netcdf_bytes))
+
+
+def get_bbox_tiles(bbox_bounds, tile_size):
+    """Get the tiles of a fixed tile grid (anchored at 0, 0) that a bbox intersects.
+
+    Args:
+        bbox_bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        tile_size (float): tile size in the units of the bbox, 0 for no tiles
+    Returns:
+        tiles (list): list of 4-tuples of tile bounds, row by row (south to north, west to east)
+    """
+    if not tile_size:
+        return []
+    xmin, ymin, xmax, ymax = bbox_bounds
+    x_tiles = np.arange(np.floor(xmin / tile_size), np.floor(xmax / tile_size) + 1)
+    y_tiles = np.arange(np.floor(ymin / tile_size), np.floor(ymax / tile_size) + 1)
+    return [
+        (
+            float(i * tile_size),
+            float(j * tile_size),
+            float((i + 1) * tile_size),
+            float((j + 1) * tile_size),
+        )
+        for j in y_tiles
+        for i in x_tiles
+    ]
+
+
+async def fetch_netcdf_tiles(urls):
+    """Fetch netCDF tiles, reusing tiles from the in-memory LRU tile cache.
+
+    Args:
+        urls (list): list of tile request URLs
+    Returns:
+        list: netCDF bytes of each tile, in the order of the URLs
+    """
+    global _netcdf_tiles_nbytes
+
+    tile_bytes = {}
+    now = time.time()
+    with _netcdf_tiles_lock:
+        for url in urls:
+            cached = _netcdf_tiles.get(url)
+            if cached is not None and now - cached[1] < ZONAL_STATS_CACHE_VERSION_TTL:
+                _netcdf_tiles.move_to_end(url)
+                tile_bytes[url] = cached[0]
+
+    missing = [url for url in dict.fromkeys(urls) if url not in tile_bytes]
+    if missing:
+        logger.info(f"Fetching {len(missing)} of {len(urls)} bbox tiles")
+        fetched = await fetch_data(missing)
+        if len(missing) == 1:
+            fetched = [fetched]
+        tile_bytes.update(zip(missing, fetched))
+
+        with _netcdf_tiles_lock:
+            for url, netcdf_bytes in zip(missing, fetched):
+                if url in _netcdf_tiles:
+                    _netcdf_tiles_nbytes -= len(_netcdf_tiles.pop(url)[0])
+                _netcdf_tiles[url] = (netcdf_bytes, now)
+                _netcdf_tiles_nbytes += len(netcdf_bytes)
+            while _netcdf_tiles and _netcdf_tiles_nbytes > BBOX_TILE_CACHE_MB * 1024**2:
+                _, (evicted, _) = _netcdf_tiles.popitem(last=False)
+                _netcdf_tiles_nbytes -= len(evicted)
+
+    return [tile_bytes[url] for url in urls]
+
+
+def mosaic_bbox_tiles(tile_datasets, tiles, bbox_bounds, x_dim, y_dim):
+    """Mosaic the datasets of the tiles fetched for a bbox, and crop the mosaic to the bbox.
+
+    Args:
+        tile_datasets (list): list of xarray.DataSets, one per tile
+        tiles (list): list of 4-tuples of tile bounds from get_bbox_tiles(), in the same order
+        bbox_bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+    Returns:
+        xarray.DataSet with the cells intersecting the bbox, like a direct fetch of the bbox
+    """
+    # each tile comes back with every cell it intersects, so neighbouring tiles share the cells
+    # on their common edge: keep only the cells centered in [min, max) of each tile
+    trimmed = []
+    for ds, (xmin, ymin, xmax, ymax) in zip(tile_datasets, tiles):
+        x = ds[x_dim].values
+        y = ds[y_dim].values
+        trimmed.append(
+            ds.isel({x_dim: (x >= xmin) & (x < xmax), y_dim: (y >= ymin) & (y < ymax)})
+        )
+
+    # tiles are ordered row by row, west to east and south to north, so reverse them for
+    # coordinates that run the other way (e.g. rows running north to south)
+    def concat(datasets, dim):
+        coords = tile_datasets[0][dim].values
+        if coords.size > 1 and coords[0] > coords[-1]:
+            datasets = datasets[::-1]
+        return xr.concat(
+            datasets,
+            dim=dim,
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            join="exact",
+        )
+
+    n_x_tiles = len({tile[0] for tile in tiles})
+    rows = [
+        concat(trimmed[i : i + n_x_tiles], x_dim)
+        for i in range(0, len(trimmed), n_x_tiles)
+    ]
+    mosaic = concat(rows, y_dim)
+
+    # tiles clipped by the coverage edge, or on a different grid, leave gaps or offsets
+    # between their cells (tiles with different cells across the seam fail the join above)
+    for dim in (x_dim, y_dim):
+        steps = np.diff(mosaic[dim].values)
+        if steps.size and not np.allclose(steps, steps[0], rtol=1e-6, atol=0):
+            raise ValueError(f"Tiles do not line up along {dim}")
+
+    # keep the cells whose footprint intersects (or touches) the bbox
+    xmin, ymin, xmax, ymax = bbox_bounds
+    x = mosaic[x_dim].values
+    y = mosaic[y_dim].values
+    x_half = np.abs(np.diff(x)).min() / 2 if x.size > 1 else 0
+    y_half = np.abs(np.diff(y)).min() / 2 if y.size > 1 else 0
+    return mosaic.isel(
+        {
+            x_dim: (x >= xmin - x_half) & (x <= xmax + x_half),
+            y_dim: (y >= ymin - y_half) & (y <= ymax + y_half),
+        }
+    )
 
 
 def get_all_possible_dimension_combinations(iter_coords, dim_names, dim_encodings):
@@ -313,34 +555,6 @@ def get_from_dict(data_dict, map_list):
     return reduce(operator.getitem, map_list, data_dict)
 
 
-def extract_nested_dict_keys(dict_, result_list=None, in_line_list=None):
-    """Extract keys of nested dictionary to list of tuples
-
-    Args:
-        dict_ (dict): nested dictionary to extract keys from
-        result_list (list): leave as None
-        in_line_list (list): leave as None
-
-    Notes:
-        Thanks to https://stackoverflow.com/a/62928173/11417211
-    """
-    is_return_list = True if result_list is None else False
-    if is_return_list:
-        result_list = []
-    is_create_new = True if in_line_list is None else False
-    for k, v in dict_.items():
-        if is_create_new:
-            in_line_list = []
-        out_line_list = copy.deepcopy(in_line_list)
-        out_line_list.append(k)
-        if not isinstance(v, dict) or len(v) == 0:
-            result_list.append(out_line_list)
-        else:
-            extract_nested_dict_keys(dict_[k], result_list, out_line_list)
-    if is_return_list:
-        return result_list
-
-
 def deepflatten(iterable, depth=None, types=None, ignore=None):
     """Flatten a nested list of unknown length. Adapted from the "iteration_utilities" library v. 0.11.0.
 
@@ -406,6 +620,20 @@ async def describe_via_wcps(cov_id):
     return json_description
 
 
+async def describe_via_gs_wcs(cov_id):
+    """Get the metadata of a GeoServer coverage via a WCS DescribeCoverage request.
+
+    Args:
+        cov_id (str): GeoServer coverage ID
+
+    Returns:
+        xml_description (str): coverage description in XML format
+    """
+    req_url = generate_gs_describe_coverage_url(cov_id)
+    xml_description = await fetch_data([req_url])
+    return xml_description
+
+
 def get_encoding_from_axis_attributes(axis, coverage_metadata):
     """Extract the axis encoding dictionary from the coverage metadata. Assumes that the
     coverage has an axis named <axis> with an "encoding" attribute. Assumes the attribute is a string
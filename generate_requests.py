@@ -96,7 +96,9 @@ def generate_wcs_getcov_str(
     return wcs_getcov_str
 
 
-def generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id, var_coord=None):
+def generate_netcdf_wcs_getcov_str(
+    bbox_bounds, cov_id, var_coord=None, scale_factor=1
+):
     """Generate a WCS GetCoverage request for netCDF data over an area.
 
     Args:
@@ -104,6 +106,8 @@ def generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id, var_coord=None):
         cov_id (str): Rasdaman coverage ID
         var_coord (int): coordinate value corresponding to variable name to query,
             default=None will include all variables
+        scale_factor (int): factor to decimate the X and Y axes by (WCS scaling, other axes
+            are not scaled), default=1 fetches the native resolution
     Returns:
         netcdf_wcs_getcov_str (str): WCS GetCoverage Request to append to a query URL
     """
@@ -113,6 +117,9 @@ def generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id, var_coord=None):
     netcdf_wcs_getcov_str = generate_wcs_getcov_str(
         x, y, cov_id, var_coord, encoding="netcdf"
     )
+    if scale_factor > 1:
+        # SCALEFACTOR would also decimate the non-spatial axes (era, model, etc.)
+        netcdf_wcs_getcov_str += f"&SCALEAXES=X({scale_factor}),Y({scale_factor})"
     return netcdf_wcs_getcov_str
 
 
@@ -181,6 +188,45 @@ def generate_netcdf_average_wcps_str(bbox_bounds, generate_average_wcps_str_kwar
     return netcdf_avg_wcps_str
 
 
+def generate_zonal_mean_wcps_str(
+    cov_id, polygon_wkt, crs, axis_sizes, encoding="json"
+):
+    """Generates a WCPS request string that clips a coverage to a polygon
+    and averages it server-side, for every combination of the coverage's
+    non-spatial axes at once.
+
+    Args:
+        cov_id (str): Rasdaman coverage ID
+        polygon_wkt (str): WKT of the (multi)polygon to clip to, in the
+            coverage CRS
+        crs (str): CRS of the coverage and polygon, e.g. "EPSG:3338"
+        axis_sizes (dict): non-spatial axis names mapped to their number
+            of grid positions, in coverage axis order, e.g. {"era": 5, "model": 7}
+        encoding (str): encoding of the returned array of means
+
+    Returns:
+        WCPS query to be included in generate_wcs_url(). The result is
+        an array of means indexed by the grid position along each axis.
+    """
+    over_str = ", ".join(
+        f"$a{i} {axis}(0:{n - 1})" for i, (axis, n) in enumerate(axis_sizes.items())
+    )
+    # subset by grid position (CRS:1), axis coordinates are not always contiguous
+    subset_str = ",".join(
+        f'{axis}:"CRS:1"($a{i})' for i, axis in enumerate(axis_sizes)
+    )
+    crs_uri = f"http://www.opengis.net/def/crs/EPSG/0/{crs.split(':')[-1]}"
+    wcps_request_str = quote(
+        (
+            f"ProcessCoverages&query=for $c in ({cov_id}) "
+            f"return encode( coverage zonal_means over {over_str} "
+            f'values avg( clip( $c[{subset_str}], {polygon_wkt}, "{crs_uri}" ) ), '
+            f'"application/{encoding}")'
+        )
+    )
+    return wcps_request_str
+
+
 def generate_wcps_describe_coverage_str(cov_id):
     """Generate a WCPS DescribeCoverage request for a given coverage.
 
@@ -112,6 +112,17 @@ def generate_describe_coverage_url(describe_coverage_str):
     return f"{RAS_BASE_URL}/ows?&SERVICE=WCS&VERSION=2.1.0&REQUEST=ProcessCoverages&query={describe_coverage_str}"
 
 
+def generate_gs_describe_coverage_url(cov_id):
+    """Generate a GeoServer WCS DescribeCoverage URL.
+
+    Args:
+        cov_id (str): GeoServer coverage ID
+    Returns:
+        URL for a WCS DescribeCoverage request, which returns XML
+    """
+    return f"{GS_BASE_URL}/ows?&SERVICE=WCS&VERSION=2.0.1&REQUEST=DescribeCoverage&COVERAGEID={cov_id}"
+
+
 def generate_wfs_conus_hydrology_url(stream_id):
     """
     Generate a WFS URL for fetching CONUS hydrology data for a given stream ID. Returns both attributes and geometry for a single stream ID.
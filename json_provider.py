@@ -0,0 +1,242 @@
+"""JSON provider for API responses.
+
+Serializes NumPy scalars and arrays and columnar results directly, writes non-finite floats
+(NaN, inf) as null, and only sorts keys if configured to. orjson is used if it is installed.
+"""
+
+import json
+import logging
+import math
+from itertools import islice
+
+import numpy as np
+import xarray as xr
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+from columnar import columnar_to_nested_dict
+from config import (
+    JSON_ENCODER,
+    JSON_SORT_KEYS,
+    JSON_STREAMING,
+    JSON_STREAM_CHUNK_SIZE,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def default(obj):
+    """Serialize values that the JSON encoders do not serialize themselves.
+
+    Args:
+        obj: value to serialize, e.g. a NumPy scalar or array or a columnar result
+    Returns:
+        a JSON serializable value
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, xr.DataArray):
+        return columnar_to_nested_dict(obj)
+    # dates, dataclasses, etc. are serialized like Flask does by default
+    return DefaultJSONProvider.default(obj)
+
+
+def replace_non_finite(data):
+    """Replace non-finite floats with None, since NaN and Infinity are not valid JSON.
+
+    Args:
+        data: JSON-like data, with values that default() can serialize
+    Returns:
+        data with None in place of non-finite floats
+    """
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {key: replace_non_finite(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [replace_non_finite(value) for value in data]
+    if isinstance(data, (np.generic, np.ndarray, xr.DataArray)):
+        return replace_non_finite(default(data))
+    return data
+
+
+def stream_json(data, levels=0):
+    """Return data as a streamed JSON response, with the same output as returning it from a route.
+
+    Args:
+        data (dict or xarray.DataArray): packaged or columnar results
+        levels (int): number of levels above the time level, e.g. 2 for model > scenario > time
+    Returns:
+        JSON Response
+    """
+    if not JSON_STREAMING:
+        return current_app.json.response(data)
+    return current_app.json.stream_response(data, levels)
+
+
+class APIJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using orjson if available, with NumPy support and no key sorting."""
+
+    default = staticmethod(default)
+    sort_keys = JSON_SORT_KEYS
+    encoder = JSON_ENCODER
+
+    def __init__(self, app):
+        super().__init__(app)
+        if self.encoder == "orjson" and orjson is None:
+            logger.warning("orjson is not installed, using json to encode responses")
+            self.encoder = "json"
+
+    def dumps_bytes(self, obj, indent=False):
+        """Serialize data as UTF-8 encoded JSON.
+
+        Args:
+            obj: data to serialize
+            indent (bool): if True, indent the JSON with two spaces
+        Returns:
+            JSON bytes
+        """
+        if self.encoder == "orjson":
+            option = (
+                orjson.OPT_SERIALIZE_NUMPY
+                | orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+            )
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                # e.g. NumPy arrays of dtypes orjson does not support, or very large integers
+                pass
+
+        if indent:
+            return self.dumps(obj, indent=2).encode()
+        return self.dumps(obj, separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        """Serialize data as JSON to a string with the built-in json module.
+
+        Args:
+            obj: data to serialize
+            kwargs: passed to json.dumps()
+        Returns:
+            JSON string
+        """
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("sort_keys", self.sort_keys)
+        kwargs.setdefault("allow_nan", False)
+        try:
+            return json.dumps(obj, **kwargs)
+        except ValueError:
+            return json.dumps(replace_non_finite(obj), **kwargs)
+
+    def dumps_key(self, key):
+        """Serialize a dict key, followed by the colon, as compact JSON bytes."""
+        # keys that are not strings are converted the same way as when a whole dict is serialized
+        return self.dumps_bytes({key: None})[1:-5]
+
+    def iter_json(self, obj, levels=0, chunk_size=JSON_STREAM_CHUNK_SIZE):
+        """Serialize data as compact JSON bytes in pieces, with the same output as dumps_bytes().
+        The first levels of dicts are serialized key by key, the items of the next level are
+        serialized chunk_size items at a time. Columnar results are only packaged into dicts
+        one chunk at a time.
+
+        Args:
+            obj (dict or xarray.DataArray): packaged or columnar results
+            levels (int): number of levels of dicts to serialize key by key
+            chunk_size (int): number of items to serialize at a time below those levels
+        Yields:
+            JSON bytes
+        """
+        if isinstance(obj, xr.DataArray) and obj.ndim > 1:
+            if levels > 0:
+                items = (
+                    (label, obj[i])
+                    for i, label in enumerate(obj[obj.dims[0]].values.tolist())
+                    if obj[i].notnull().any()
+                )
+            else:
+                chunks = (
+                    columnar_to_nested_dict(obj[start : start + chunk_size])
+                    for start in range(0, obj.shape[0], chunk_size)
+                )
+                items = (item for chunk in chunks for item in chunk.items())
+        elif isinstance(obj, dict):
+            items = iter(obj.items())
+        else:
+            yield self.dumps_bytes(obj)
+            return
+
+        yield b"{"
+        separator = b""
+        if levels > 0:
+            for key, value in items:
+                yield separator + self.dumps_key(key)
+                yield from self.iter_json(value, levels - 1, chunk_size)
+                separator = b","
+        else:
+            while chunk := dict(islice(items, chunk_size)):
+                yield separator + self.dumps_bytes(chunk)[1:-1]
+                separator = b","
+        yield b"}"
+
+    def stream_response(self, obj, levels=0):
+        """Serialize data as JSON into a streamed Flask Response, with the same output as
+        response(). Indented or key-sorted output is not streamed.
+
+        The first chunk of data is serialized before returning, so that errors packaging it
+        are raised in the route (e.g. to return a 500). Errors in later chunks can only be
+        logged, since the 200 status has been sent by then: the response is cut short.
+
+        Args:
+            obj (dict or xarray.DataArray): packaged or columnar results
+            levels (int): number of levels of dicts to serialize key by key
+        Returns:
+            JSON Response
+        """
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        if indent or self.sort_keys:
+            return self.response(obj)
+
+        pieces = self.iter_json(obj, levels)
+        head = []
+        for piece in pieces:
+            head.append(piece)
+            # opening braces and keys come before any data is serialized
+            if piece != b"{" and not piece.endswith(b":"):
+                break
+
+        def generate():
+            yield from head
+            try:
+                yield from pieces
+            except Exception:
+                logger.exception("Streamed JSON response failed after it was started")
+                raise
+            yield b"\n"
+
+        return self._app.response_class(generate(), mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs):
+        if self.encoder == "orjson" and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        """Serialize the arguments as JSON into a Flask Response, like DefaultJSONProvider."""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(
+            self.dumps_bytes(obj, indent) + b"\n", mimetype=self.mimetype
+        )
@@ -0,0 +1,168 @@
+"""A module to return xarray results as downloadable, compressed NetCDF files.
+
+Results are written straight from the xarray objects the routes already hold, with the
+dimension labels decoded from the coverage metadata, instead of being packaged into nested
+dicts first.
+"""
+
+import io
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from flask import Response, request
+
+from config import NETCDF_COMPRESSION_LEVEL
+from csv_functions import attachment_headers
+from validate_data import place_name_and_type
+
+
+def columnar_to_dataset(result):
+    """Convert a columnar result into a Dataset with one data variable per label of its
+    last dimension. Labels without any data are left out, and a "date" dimension of date
+    strings is converted to datetimes.
+
+    Args:
+        result (xarray.DataArray): columnar result
+
+    Returns:
+        xarray.Dataset
+    """
+    leaf_dim = result.dims[-1]
+    result = result.dropna(leaf_dim, how="all")
+    if "date" in result.dims:
+        result = result.assign_coords(date=pd.to_datetime(result["date"].values))
+    ds = result.to_dataset(dim=leaf_dim)
+    # the precision of a columnar result is not a valid NetCDF attribute
+    ds.attrs = {}
+    return ds
+
+
+def clean_netcdf_attrs(attrs):
+    """Drop attributes that NetCDF files cannot hold (None, nested dicts, etc.) and store
+    booleans as integers.
+
+    Args:
+        attrs (dict): attributes of a Dataset or variable
+
+    Returns:
+        dict of attributes
+    """
+    cleaned = {}
+    for key, value in attrs.items():
+        if isinstance(value, (bool, np.bool_)):
+            cleaned[key] = int(value)
+        elif isinstance(value, (str, int, float, np.number, np.ndarray)):
+            cleaned[key] = value
+        elif isinstance(value, (list, tuple)) and all(
+            isinstance(item, (str, int, float)) for item in value
+        ):
+            cleaned[key] = list(value)
+    return cleaned
+
+
+def write_netcdf(ds, filename):
+    """
+    Creates and returns a downloadable NetCDF file of a Dataset, with the data variables
+    compressed at NETCDF_COMPRESSION_LEVEL.
+
+    Args:
+        ds (xarray.Dataset): data to write
+        filename (str): URL-quoted file name
+
+    Returns:
+        NetCDF Response
+    """
+    ds = ds.copy()
+    ds.attrs = clean_netcdf_attrs(ds.attrs)
+    for variable in ds.variables.values():
+        variable.attrs = clean_netcdf_attrs(variable.attrs)
+        # chunking and packing of the fetched files do not apply to the results
+        variable.encoding = {}
+    encoding = {
+        var: {"zlib": True, "complevel": NETCDF_COMPRESSION_LEVEL}
+        for var in ds.data_vars
+    }
+
+    output = io.BytesIO()
+    ds.to_netcdf(output, engine="h5netcdf", encoding=encoding)
+    return Response(
+        output.getvalue(),
+        mimetype="application/x-netcdf",
+        headers=attachment_headers(filename, "application/x-netcdf"),
+    )
+
+
+def create_netcdf(
+    ds,
+    filename_data_name,
+    place_id=None,
+    lat=None,
+    lon=None,
+    place_name=None,
+):
+    """Create a NetCDF file of a Dataset, with the location of the request in its
+    attributes and file name, named like the CSV file of the same request.
+
+    Args:
+        ds (xarray.Dataset): data to write
+        filename_data_name (str): name of the data set for the file name
+        place_id (str): place identifier (e.g., AK124)
+        lat: latitude for points or None for polygons
+        lon: longitude for points or None for polygons
+        place_name (str): name of the place, looked up from place_id if not given
+
+    Returns:
+        NetCDF Response
+    """
+    if place_name is None:
+        place_name, _place_type = place_name_and_type(place_id)
+
+    ds = ds.copy()
+    if place_name is not None:
+        ds.attrs["location"] = place_name
+    if place_id is not None:
+        ds.attrs["place_id"] = place_id
+    if lat is not None and lon is not None:
+        ds.attrs["latitude"] = float(lat)
+        ds.attrs["longitude"] = float(lon)
+    ds.attrs["url"] = "https://earthmaps.io" + request.path
+
+    filename = filename_data_name + " for "
+    if place_name is not None:
+        filename += place_name
+    else:
+        filename += str(lat) + " " + str(lon)
+    filename += ".nc"
+
+    return write_netcdf(ds, quote(filename))
+
+
+def hydrology_netcdf(
+    ds, gdf, stream_id, filename_data_name, source, populate_attributes
+):
+    """Create a NetCDF file of a decoded hydrology dataset, with the vector attributes of
+    the stream and the data source in the dataset attributes.
+
+    Args:
+        ds (xarray.Dataset): hydrology data, with decoded dimension values
+        gdf (geopandas.GeoDataFrame): vector features of the stream
+        stream_id (str): stream ID of the hydrology data
+        filename_data_name (str): name of the data set for the file name
+        source (str): data source requested with the "source" parameter
+        populate_attributes (function): fills a dict with the attributes of the stream
+            from gdf, including its latitude and longitude
+
+    Returns:
+        NetCDF Response
+    """
+    attributes = populate_attributes({}, gdf)
+    ds = ds.assign_attrs(attributes, data_source=source)
+    return create_netcdf(
+        ds,
+        filename_data_name,
+        place_id=stream_id,
+        place_name="Stream ID " + stream_id,
+        lat=attributes["latitude"],
+        lon=attributes["longitude"],
+    )
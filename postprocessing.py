@@ -1,3 +1,4 @@
+import numpy as np
 from flask import render_template
 
 nodata_values = {
@@ -78,6 +79,76 @@ nodata_mappings = {
 }
 
 
+def get_nodata_test(nodata):
+    """Build a test for nodata values that matches values the same way as comparing their strings,
+    i.e. str(value) in map(str, nodata), but with typed set lookups instead of string conversions.
+    So, for example, -9999 matches -9999 and "-9999" but not -9999.0, and "nan" matches any NaN.
+
+    Args:
+        nodata (list): nodata values of an endpoint
+    Returns:
+        is_nodata (callable): takes a value and returns True if it is a nodata value
+    """
+    strings = frozenset(map(str, nodata))
+    ints = frozenset(x for x in nodata if type(x) is int)
+    floats = frozenset(x for x in nodata if type(x) is float and x == x)
+    match_nan = "nan" in strings
+    match_none = "None" in strings
+
+    def is_nodata(value):
+        # check the most common types first, values are mostly floats
+        value_type = type(value)
+        if value_type is float:
+            return value in floats if value == value else match_nan
+        if value_type is str:
+            return value in strings
+        if value is None:
+            return match_none
+        if isinstance(value, (bool, np.bool_)):
+            return str(value) in strings
+        if isinstance(value, (int, np.integer)):
+            return value in ints
+        if isinstance(value, (float, np.floating)):
+            return value in floats if value == value else match_nan
+        if isinstance(value, str):
+            return value in strings
+        return str(value) in strings
+
+    return is_nodata
+
+
+nodata_tests = {
+    endpoint: get_nodata_test(nodata) for endpoint, nodata in nodata_mappings.items()
+}
+
+
+def get_nodata_mask(values, endpoint):
+    """Get a mask of the nodata values in an array, so that nodata can be dropped before the array is
+    packaged into dicts. Values are matched the same way as nullify_nodata() matches them in the packaged
+    results, e.g. a float array only matches float (or "nan") nodata values of the endpoint.
+
+    Args:
+        values (array-like): numeric or string values, e.g. a NumPy array from a fetched dataset
+        endpoint (str): key of nodata_mappings for the endpoint
+    Returns:
+        mask (numpy.ndarray): boolean array of the same shape, True where values are nodata
+    """
+    values = np.asarray(values)
+    nodata = nodata_mappings[endpoint]
+
+    if np.issubdtype(values.dtype, np.floating):
+        mask = np.isin(values, [x for x in nodata if type(x) is float and x == x])
+        if "nan" in map(str, nodata):
+            mask |= np.isnan(values)
+        return mask
+    if np.issubdtype(values.dtype, np.integer):
+        return np.isin(values, [x for x in nodata if type(x) is int])
+    if values.dtype.kind == "U":
+        return np.isin(values, list(map(str, nodata)))
+
+    return np.asarray(np.frompyfunc(nodata_tests[endpoint], 1, 1)(values), dtype=bool)
+
+
 def nullify_nodata_value(value, endpoint):
     """Return None if a nodata value is detected, otherwise return the original value.
 
@@ -86,7 +157,7 @@ def nullify_nodata_value(value, endpoint):
     Returns:
         value: The original value or None if a nodata value was detected
     """
-    if str(value) in map(str, nodata_mappings[endpoint]):
+    if nodata_tests[endpoint](value):
         return None
     return value
 
@@ -99,15 +170,18 @@ def nullify_nodata(data, endpoint):
     Returns:
         nullified (dict): The same results dict with nodata values set to None
     """
-    if isinstance(data, list):
-        return list(map(lambda x: nullify_nodata(x, endpoint), data))
-    if isinstance(data, tuple):
-        return tuple(map(lambda x: nullify_nodata(x, endpoint), data))
-    if isinstance(data, dict):
-        return dict(map(lambda x: nullify_nodata(x, endpoint), data.items()))
+    is_nodata = nodata_tests[endpoint]
 
-    nullified = nullify_nodata_value(data, endpoint)
-    return nullified
+    def nullify(data):
+        if isinstance(data, list):
+            return [nullify(x) for x in data]
+        if isinstance(data, tuple):
+            return tuple(nullify(x) for x in data)
+        if isinstance(data, dict):
+            return {nullify(key): nullify(value) for key, value in data.items()}
+        return None if is_nodata(data) else data
+
+    return nullify(data)
 
 
 def prune_nodata_dict(data):
@@ -140,7 +214,8 @@ def prune_nodata_list(data):
     for value in data:
         if type(value) in [list, dict, tuple]:
             pruned_value = prune_nodata(value)
-            if len(pruned_value) > 0:
+            # dicts without data are pruned to None
+            if pruned_value is not None and len(pruned_value) > 0:
                 pruned.append(pruned_value)
 
     return pruned
@@ -187,16 +262,93 @@ def prune_nodata(data):
     return data
 
 
-def nullify_and_prune(data, endpoint):
-    """Filter nodata values, prune empty branches, and return data"""
-    nullified_data = nullify_nodata(data, endpoint)
-    pruned_data = prune_nodata(nullified_data)
-    return pruned_data
+def nullify_and_prune(data, endpoint, prune_nulls=False, keys_to_keep=None):
+    """Filter nodata values, prune empty branches, and return data. This gives the same result as
+    prune_nodata(nullify_nodata(data, endpoint)), optionally followed by prune_nulls_with_max_intensity(),
+    in a single traversal of the data.
+
+    Args:
+        data (dict): Results dict
+        endpoint (str): key of nodata_mappings for the endpoint
+        prune_nulls (bool): if True, also remove None values from dicts like prune_nulls_with_max_intensity()
+        keys_to_keep (list): keys to keep even if their value is None, if prune_nulls is True
+    Returns:
+        pruned (dict): The same data with nodata values set to None and empty and None branches pruned
+    """
+    is_nodata = nodata_tests[endpoint]
+    keys_to_keep = set(keys_to_keep or [])
+    scalar_types = {float, int, str, type(None)}
+
+    def nullify_and_prune_dict(data, prune_nulls):
+        pruned = {}
+        has_data = False
+        for key, value in data.items():
+            # keys are nullified too, tuples are nullified but not pruned
+            if isinstance(key, tuple):
+                key = nullify_nodata(key, endpoint)
+            elif is_nodata(key):
+                key = None
+
+            if type(value) in scalar_types:
+                if is_nodata(value):
+                    value = None
+            elif isinstance(value, dict):
+                value = nullify_and_prune_dict(value, prune_nulls)
+            elif isinstance(value, list):
+                value = nullify_and_prune_list(value)
+            elif isinstance(value, tuple):
+                value = nullify_nodata(value, endpoint)
+            elif is_nodata(value):
+                value = None
+
+            if value is not None:
+                has_data = True
+            elif prune_nulls and key not in keys_to_keep:
+                continue
+            pruned[key] = value
+
+        if has_data:
+            return pruned
+        return None
+
+    def nullify_and_prune_list(data):
+        # only containers are kept in lists, nulls are not pruned from dicts within lists
+        pruned = []
+        for value in data:
+            if isinstance(value, dict):
+                value = nullify_and_prune_dict(value, False)
+                if value is None:
+                    continue
+            elif isinstance(value, list):
+                value = nullify_and_prune_list(value)
+            elif isinstance(value, tuple):
+                value = nullify_nodata(value, endpoint)
+            else:
+                continue
+            if len(value) > 0:
+                pruned.append(value)
+        return pruned
+
+    if isinstance(data, dict):
+        return nullify_and_prune_dict(data, prune_nulls)
+    if isinstance(data, list):
+        return nullify_and_prune_list(data)
+    return nullify_nodata(data, endpoint)
 
 
-def postprocess(data, endpoint, titles=None):
-    """Nullify and prune data, add titles, and return 404 if appropriate"""
-    pruned_data = nullify_and_prune(data, endpoint)
+def postprocess(data, endpoint, titles=None, prune_nulls=False, keys_to_keep=None):
+    """Nullify and prune data, add titles, and return 404 if appropriate
+
+    Args:
+        data (dict): Results dict
+        endpoint (str): key of nodata_mappings for the endpoint
+        titles (list, str): title or list of titles to add to the data package
+        prune_nulls (bool): if True, also remove None values from dicts like prune_nulls_with_max_intensity()
+        keys_to_keep (list): keys to keep even if their value is None, if prune_nulls is True
+    Returns:
+        pruned_data (dict): postprocessed data, or a 404 error template
+    """
+    pruned_data = nullify_and_prune(data, endpoint, prune_nulls, keys_to_keep)
     if pruned_data in [{}, None, 0]:
         return render_template("404/no_data.html"), 404
 
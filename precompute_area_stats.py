@@ -0,0 +1,207 @@
+"""Precompute area (zonal stats) results for every known place.
+
+Requests each cached area endpoint for every polygon listed by the /places/<type> endpoints, using the
+same Flask app the API runs. Each request computes the result and stores it in the zonal stats cache
+(see zonal_stats_cache.py), which the area routes read first. Run this on the API host as the API user,
+with API_ZONAL_STATS_CACHE=true and the same API_ZONAL_STATS_CACHE_DIR, so the running API picks up the
+results.
+
+Progress is appended to a JSON lines log as each request finishes. Re-running with the same log skips
+any place/endpoint pair that already has a final status (200, 404 or 422), so an interrupted run can be
+resumed and failed requests are retried.
+
+Usage examples:
+    python precompute_area_stats.py
+    python precompute_area_stats.py --types hucs,boroughs --endpoints taspr,beetles --workers 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from application import application
+from config import ZONAL_STATS_CACHE, ZONAL_STATS_CACHE_DIR
+from luts import all_jsons
+from zonal_stats_cache import check_cache_dir
+
+logger = logging.getLogger(__name__)
+
+# area endpoints whose results are stored in the zonal stats cache
+area_endpoints = {
+    "taspr": "/taspr/area/{place_id}",
+    "flammability": "/alfresco/flammability/area/{place_id}",
+    "veg_type": "/alfresco/veg_type/area/{place_id}",
+    "beetles": "/beetles/area/{place_id}",
+    "indicators": "/indicators/base/area/{place_id}",
+    "elevation": "/elevation/area/{place_id}",
+}
+
+# statuses that will not change by requesting again
+final_statuses = [200, 404, 422]
+
+# communities are points, not polygons, so they have no area endpoints
+area_place_types = [place_type for place_type in all_jsons if place_type != "communities"]
+
+
+def get_places(client, place_types):
+    """Get all places of the requested types from the /places/<type> endpoints.
+    Args:
+        client (flask.testing.FlaskClient): test client for the API
+        place_types (list): place types, e.g. ["hucs", "boroughs"]
+    Returns:
+        places (list): list of dicts with (at least) "id", "name" and "type" keys
+    """
+    places = []
+    for place_type in place_types:
+        response = client.get(f"/places/{place_type}")
+        if response.status_code != 200:
+            logger.warning(f"Could not list {place_type}: HTTP {response.status_code}")
+            continue
+        places.extend(response.get_json())
+    return places
+
+
+def read_progress(progress_path):
+    """Read the (place ID, endpoint) pairs that are already done from a progress log.
+    Args:
+        progress_path (str): path to the JSON lines progress log
+    Returns:
+        done (set): set of (place ID, endpoint) tuples with a final status
+    """
+    done = set()
+    if not os.path.isfile(progress_path):
+        return done
+    with open(progress_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a partially written last line from an interrupted run
+                continue
+            if record["status"] in final_statuses:
+                done.add((record["place_id"], record["endpoint"]))
+    return done
+
+
+def precompute_place(place, endpoints, done, progress_path, progress_lock):
+    """Request every area endpoint for a single place, logging progress as each finishes.
+    Args:
+        place (dict): place from the /places/<type> endpoints
+        endpoints (list): names of the area endpoints to request
+        done (set): (place ID, endpoint) pairs to skip
+        progress_path (str): path to the JSON lines progress log
+        progress_lock (threading.Lock): lock for appending to the progress log
+    Returns:
+        timings (list): list of (endpoint, status, seconds) tuples
+    """
+    place_id = str(place["id"])
+    timings = []
+    # each thread needs its own client
+    with application.test_client() as client:
+        for endpoint in endpoints:
+            if (place_id, endpoint) in done:
+                continue
+            url = area_endpoints[endpoint].format(place_id=place_id)
+            start_time = time.time()
+            try:
+                status = client.get(url).status_code
+            except Exception as exc:
+                logger.warning(f"{url} failed: {exc}")
+                status = 500
+            seconds = round(time.time() - start_time, 2)
+            timings.append((endpoint, status, seconds))
+
+            record = {
+                "place_id": place_id,
+                "type": place.get("type"),
+                "endpoint": endpoint,
+                "status": status,
+                "seconds": seconds,
+            }
+            with progress_lock:
+                with open(progress_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--types",
+        default=",".join(area_place_types),
+        help="comma-separated place types to precompute (default: all area types)",
+    )
+    parser.add_argument(
+        "--endpoints",
+        default=",".join(area_endpoints),
+        help="comma-separated area endpoints to precompute (default: all)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="number of places to precompute at once (default: 2)",
+    )
+    parser.add_argument(
+        "--progress",
+        default="precompute_area_stats_progress.jsonl",
+        help="progress log, used to resume an interrupted run",
+    )
+    args = parser.parse_args()
+
+    place_types = args.types.split(",")
+    endpoints = args.endpoints.split(",")
+    for endpoint in endpoints:
+        if endpoint not in area_endpoints:
+            parser.error(f"unknown endpoint '{endpoint}'")
+
+    # without the cache every place would be computed, stored nowhere, and logged as done
+    if not ZONAL_STATS_CACHE:
+        parser.error("the zonal stats cache is off, set API_ZONAL_STATS_CACHE=true")
+    if not check_cache_dir():
+        parser.error(
+            f"the zonal stats cache directory {ZONAL_STATS_CACHE_DIR} cannot be used, "
+            "it must be owned by this user and not writable by group or others"
+        )
+
+    with application.test_client() as client:
+        places = get_places(client, place_types)
+    done = read_progress(args.progress)
+    todo = [
+        place
+        for place in places
+        if any((str(place["id"]), endpoint) not in done for endpoint in endpoints)
+    ]
+    logger.info(
+        f"{len(places)} places found, {len(places) - len(todo)} already done, {len(todo)} to go"
+    )
+
+    progress_lock = threading.Lock()
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(
+                precompute_place, place, endpoints, done, args.progress, progress_lock
+            ): place
+            for place in todo
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            place = futures[future]
+            timings = future.result()
+            total = sum(seconds for _, _, seconds in timings)
+            details = ", ".join(
+                f"{endpoint} {status} {seconds}s" for endpoint, status, seconds in timings
+            )
+            logger.info(
+                f"[{i}/{len(todo)}] {place['id']} ({place.get('name')}): {round(total, 2)}s [{details}]"
+            )
+
+    logger.info(f"Precomputed {len(todo)} places in {round(time.time() - start_time)}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,18 +15,36 @@ from fetch_data import (
     fetch_data,
     generate_nested_dict,
     get_poly,
+    get_polys,
     describe_via_wcps,
     get_all_possible_dimension_combinations,
 )
-from zonal_stats import interpolate_and_compute_zonal_stats
-from validate_request import get_coverage_encodings, get_coverage_crs_str
+from zonal_stats import (
+    compute_grouped_zonal_means,
+    get_polygon_part_groups,
+    get_wcs_scale_factor,
+    group_polygons_by_bbox,
+    interpolate_and_compute_multipart_zonal_stats,
+)
+from zonal_stats_cache import get_or_compute_zonal_stats
+from zonal_stats_pushdown import get_zonal_means_with_pushdown
+from validate_request import (
+    get_axis_coordinate_values,
+    get_coverage_encodings,
+    get_coverage_crs_str,
+)
 from csv_functions import create_csv
 from validate_request import (
     validate_latlon,
     validate_var_id,
 )
 from postprocessing import nullify_and_prune, postprocess
-from config import WEST_BBOX, EAST_BBOX
+from config import (
+    WEST_BBOX,
+    EAST_BBOX,
+    ZONAL_STATS_BATCH_MAX_PLACES,
+    ZONAL_STATS_PUSHDOWN,
+)
 from . import routes
 
 alfresco_api = Blueprint("alfresco_api", __name__)
@@ -38,6 +56,8 @@ var_ep_lu = {
         "bandnames": ["Gray"],
         "label": "Flammability",
         "crs": None,
+        "axis_coords": None,  # populated below
+        "resolution": 1000,
     },
     "veg_type": {
         "cov_id_str": "alfresco_vegetation_type_percentage",
@@ -45,6 +65,8 @@ var_ep_lu = {
         "bandnames": ["Gray"],
         "label": "Vegetation Type",
         "crs": None,
+        "axis_coords": None,  # populated below
+        "resolution": 1000,
     },
 }
 
@@ -60,6 +82,15 @@ async def get_alfresco_metadata(var_ep_lu):
     var_ep_lu["flammability"]["crs"] = get_coverage_crs_str(flam_metadata)
     var_ep_lu["veg_type"]["crs"] = get_coverage_crs_str(veg_metadata)
 
+    for var_ep, metadata in [
+        ("flammability", flam_metadata),
+        ("veg_type", veg_metadata),
+    ]:
+        var_ep_lu[var_ep]["axis_coords"] = {
+            axis: [int(coord) for coord in coords]
+            for axis, coords in get_axis_coordinate_values(metadata).items()
+        }
+
     return var_ep_lu
 
 
@@ -67,24 +98,32 @@ async def get_alfresco_metadata(var_ep_lu):
 var_ep_lu = asyncio.run(get_alfresco_metadata(var_ep_lu))
 
 
-async def fetch_alf_bbox_data(bbox_bounds, cov_id_str):
-    """Make the async request for the data at the specified point for a specific coverage
+async def fetch_alf_bbox_data(bbox_bounds_list, cov_id_str, resolution):
+    """Make the async requests for the data within the specified bboxes for a specific coverage
 
     Args:
-        bbox_bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        bbox_bounds_list (list): list of 4-tuples of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>),
+            e.g. one per group of polygon parts
         cov_id_str (str): shared portion of coverage_ids to query
+        resolution (float): native grid cell size of the coverage in meters
     Returns:
-        bbox_ds (xarray.DataSet): xarray dataset with the data for the bbox
+        bbox_ds_list (list): list of xarray datasets with the data for each bbox
     """
-    # set up WCS request strings
-    request_strs = []
-    request_strs.append(generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id_str))
+    # set up WCS request strings, very large areas are fetched at a decimated resolution
+    # (the same for every bbox, so that all parts of a polygon share one grid resolution)
+    scale_factor = max(
+        get_wcs_scale_factor(bbox_bounds, resolution)
+        for bbox_bounds in bbox_bounds_list
+    )
+    request_strs = [
+        generate_netcdf_wcs_getcov_str(
+            bbox_bounds, cov_id_str, scale_factor=scale_factor
+        )
+        for bbox_bounds in bbox_bounds_list
+    ]
     urls = [generate_wcs_query_url(request_str) for request_str in request_strs]
     bbox_ds_list = await fetch_bbox_netcdf_list(urls)
-    bbox_ds = bbox_ds_list[
-        0
-    ]  # there is only ever one dataset in the list for this endpoint
-    return bbox_ds
+    return bbox_ds_list
 
 
 def run_aggregate_var_polygon(var_ep, poly_id):
@@ -102,18 +141,118 @@ def run_aggregate_var_polygon(var_ep, poly_id):
     cov_id_str = var_ep_lu[var_ep]["cov_id_str"]
     bandname = var_ep_lu[var_ep]["bandnames"][0]
     crs = var_ep_lu[var_ep]["crs"]
-    ds = asyncio.run(fetch_alf_bbox_data(polygon.total_bounds, cov_id_str))
+    resolution = var_ep_lu[var_ep]["resolution"]
+
+    dim_combos, dimension_combinations = get_alf_dim_combos(var_ep)
+
+    def compute_local_means():
+        # far-apart parts of the polygon are fetched in separate, tighter bboxes
+        polygon_parts = get_polygon_part_groups(polygon)
+        ds_list = asyncio.run(
+            fetch_alf_bbox_data(
+                [parts.total_bounds for parts in polygon_parts], cov_id_str, resolution
+            )
+        )
+        for ds in ds_list:
+            check_alf_dims(var_ep, ds, bandname)
+        results = interpolate_and_compute_multipart_zonal_stats(
+            polygon_parts,
+            ds_list,
+            crs,
+            dimension_combinations,
+            var_name=bandname,
+            x_dim="X",
+            y_dim="Y",
+        )
+        return [combo_zonal_stats_dict["mean"] for _, combo_zonal_stats_dict in results]
+
+    if ZONAL_STATS_PUSHDOWN:
+        means = get_zonal_means_with_pushdown(
+            polygon,
+            cov_id_str,
+            crs,
+            var_ep_lu[var_ep]["axis_coords"],
+            dimension_combinations,
+            resolution,
+            compute_local_means,
+        )
+    else:
+        means = compute_local_means()
+
+    return package_alf_zonal_means(var_ep, dim_combos, means)
+
+
+def run_aggregate_var_polygons(var_ep, poly_ids):
+    """Get data summary (zonal mean) of single variable in many polygons at once. Polygons close
+    to each other share a single bbox fetch, and all polygons in a bbox are summarized together
+    in one grouped reduction.
+
+    Args:
+        var_ep (str): variable endpoint (one of "flammability" or "veg_type")
+        poly_ids (list): list of unique `id`s used to identify the Polygons
+    Returns:
+        aggr_results (dict): maps polygon IDs to data representing zonal stats within the polygon.
+            Polygon IDs that are not found are left out.
+    """
+    polygons = get_polys(poly_ids)
+    cov_id_str = var_ep_lu[var_ep]["cov_id_str"]
+    bandname = var_ep_lu[var_ep]["bandnames"][0]
+    crs = var_ep_lu[var_ep]["crs"]
+    resolution = var_ep_lu[var_ep]["resolution"]
+
+    groups = group_polygons_by_bbox(polygons)
+    urls = []
+    for group in groups:
+        bbox_bounds = polygons.iloc[group].total_bounds
+        scale_factor = get_wcs_scale_factor(bbox_bounds, resolution)
+        urls.append(
+            generate_wcs_query_url(
+                generate_netcdf_wcs_getcov_str(
+                    bbox_bounds, cov_id_str, scale_factor=scale_factor
+                )
+            )
+        )
+    ds_list = asyncio.run(fetch_bbox_netcdf_list(urls))
+    for ds in ds_list:
+        check_alf_dims(var_ep, ds, bandname)
+
+    dim_combos, dimension_combinations = get_alf_dim_combos(var_ep)
+    aggr_results = {}
+    for group, ds in zip(groups, ds_list):
+        means = compute_grouped_zonal_means(
+            polygons.iloc[group],
+            ds,
+            crs,
+            dimension_combinations,
+            var_name=bandname,
+            x_dim="X",
+            y_dim="Y",
+        )
+        for i, poly_id in enumerate(polygons["id"].iloc[group]):
+            aggr_results[poly_id] = package_alf_zonal_means(
+                var_ep, dim_combos, means[:, i].tolist()
+            )
+
+    return aggr_results
+
+
+def get_alf_dim_combos(var_ep):
+    """Get all combinations of the non-XY dimensions of an ALFRESCO coverage, in the order of
+    the coverage metadata (fetched data is checked against it with check_alf_dims()).
 
-    # get all combinations of non-XY dimensions in the dataset and their corresponding encodings
-    # and create a dict to hold the results for each combo
-    all_dims = ds[bandname].dims
-    dimnames = [dim for dim in all_dims if dim not in ["X", "Y"]]
+    Args:
+        var_ep (str): variable endpoint (one of "flammability" or "veg_type")
+    Returns:
+        tuple: list of encoded dimension combos (e.g. ["1950-1979", "MODEL-SPINUP", "historical"]),
+            and list of dicts mapping dimension names to coordinate values, one per combo
+    """
+    axis_coords = var_ep_lu[var_ep]["axis_coords"]
+    dimnames = list(axis_coords)
     dim_encodings = var_ep_lu[var_ep]["dim_encodings"]
-    iter_coords = list(itertools.product(*[list(ds[dim].values) for dim in dimnames]))
+    iter_coords = list(itertools.product(*axis_coords.values()))
     dim_combos = get_all_possible_dimension_combinations(
         iter_coords, dimnames, dim_encodings
     )
-    aggr_results = generate_nested_dict(dim_combos)
 
     # Creates list of dictionaries containing all combinations of
     # dimension names and unique coordinate values
@@ -122,18 +261,47 @@ def run_aggregate_var_polygon(var_ep, poly_id):
         for coords in iter_coords
     ]
 
-    results = interpolate_and_compute_zonal_stats(
-        polygon,
-        ds,
-        crs,
-        dimension_combinations,
-        var_name=bandname,
-        x_dim="X",
-        y_dim="Y",
-    )
+    return dim_combos, dimension_combinations
 
-    for (combo_dict, combo_zonal_stats_dict), dim_combo in zip(results, dim_combos):
-        result = combo_zonal_stats_dict["mean"]
+
+def check_alf_dims(var_ep, ds, bandname):
+    """Check that the non-XY dimensions of a fetched ALFRESCO dataset, and their coordinates,
+    are in the order of the coverage metadata that get_alf_dim_combos() builds the combos from.
+
+    Args:
+        var_ep (str): variable endpoint (one of "flammability" or "veg_type")
+        ds (xarray.DataSet): dataset fetched for a bbox
+        bandname (str): name of the data variable
+    Returns:
+        None
+    Raises:
+        ValueError: if the dataset does not match the coverage metadata
+    """
+    ds_axis_coords = {
+        dim: [int(coord) for coord in ds[dim].values]
+        for dim in ds[bandname].dims
+        if dim not in ["X", "Y"]
+    }
+    axis_coords = var_ep_lu[var_ep]["axis_coords"]
+    if list(ds_axis_coords.items()) != list(axis_coords.items()):
+        raise ValueError(
+            f"Dimensions of the fetched {var_ep} data do not match the coverage metadata"
+        )
+
+
+def package_alf_zonal_means(var_ep, dim_combos, means):
+    """Package the zonal means of an ALFRESCO variable into a nested dict.
+
+    Args:
+        var_ep (str): variable endpoint (one of "flammability" or "veg_type")
+        dim_combos (list): list of encoded dimension combos, from get_alf_dim_combos()
+        means (list): zonal mean for each dimension combo
+    Returns:
+        aggr_results (dict): data representing zonal stats within the polygon.
+    """
+    aggr_results = generate_nested_dict(dim_combos)
+
+    for result, dim_combo in zip(means, dim_combos):
         if var_ep == "flammability":
             result = round(result, 4)
             # use the dim_combo to index into the results dict (era, model, scenario)
@@ -258,6 +426,45 @@ def run_fetch_alf_local_data(var_ep, lat, lon):
     return huc12_pkg
 
 
+@routes.route("/alfresco/<var_ep>/area/batch")
+def run_fetch_alf_batch_area_data(var_ep):
+    """ALFRESCO batch aggregation data endpoint. Fetch data within many AOI polygons,
+    listed in the `ids` query parameter, for specified variable and return JSON-like dict.
+
+    Args:
+        var_ep (str): variable endpoint. Flammability or veg type
+    Returns:
+        poly_pkgs (dict): maps AOI polygon IDs to the zonal means of variable(s) for that polygon,
+            or None if there is no data for that polygon
+    """
+    if var_ep not in var_ep_lu or request.args.get("format") == "csv":
+        return render_template("400/bad_request.html"), 400
+
+    # drop duplicate IDs, keeping the requested order
+    poly_ids = list(dict.fromkeys(request.args.get("ids", "").split(",")))
+    if not 0 < len(poly_ids) <= ZONAL_STATS_BATCH_MAX_PLACES:
+        return render_template("400/bad_request.html"), 400
+    if not all(poly_id.isalnum() for poly_id in poly_ids):
+        return render_template("400/bad_request.html"), 400
+
+    try:
+        poly_pkgs = run_aggregate_var_polygons(var_ep, poly_ids)
+    except:
+        return render_template("422/invalid_area.html"), 422
+
+    # every ID must be a known polygon, same as the single area endpoint
+    if len(poly_pkgs) < len(poly_ids):
+        return render_template("422/invalid_area.html"), 422
+
+    postprocessed = {}
+    for poly_id in poly_ids:
+        poly_pkg = postprocess(poly_pkgs[poly_id], var_ep)
+        # this is only ever true when it is returning a "no data" error template
+        postprocessed[poly_id] = None if isinstance(poly_pkg, tuple) else poly_pkg
+
+    return postprocessed
+
+
 @routes.route("/alfresco/<var_ep>/area/<var_id>")
 def run_fetch_alf_area_data(var_ep, var_id, ignore_csv=False):
     """ALFRESCO aggregation data endpoint. Fetch data within AOI polygon for specified
@@ -278,7 +485,15 @@ def run_fetch_alf_area_data(var_ep, var_id, ignore_csv=False):
         return poly_type
 
     try:
-        poly_pkg = run_aggregate_var_polygon(var_ep, var_id)
+        poly_pkg = get_or_compute_zonal_stats(
+            var_id,
+            [var_ep_lu[var_ep]["cov_id_str"]],
+            # pushdown means are computed at the native resolution, cache them separately
+            [var_ep, "pushdown"] if ZONAL_STATS_PUSHDOWN else var_ep,
+            run_aggregate_var_polygon,
+            var_ep,
+            var_id,
+        )
     except:
         return render_template("422/invalid_area.html"), 422
 
@@ -21,7 +21,8 @@ from generate_urls import generate_wfs_arctic_hydrology_url
 from fetch_data import fetch_data, fetch_layer_data, describe_via_wcps
 from validate_request import get_axis_encodings
 from postprocessing import prune_nulls_with_max_intensity
-from csv_functions import create_csv
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
+from netcdf_functions import hydrology_netcdf
 from config import RAS_BASE_URL
 from . import routes
 
@@ -477,6 +478,7 @@ def arctic_hydrology_about():
 
 
 @routes.route("/arctic_hydrology/stats/<stream_id>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_get_arctic_hydrology_stats_data(stream_id):
     """
     Function to fetch hydrology data from Rasdaman for a single stream ID.
@@ -516,6 +518,16 @@ def run_get_arctic_hydrology_stats_data(stream_id):
                 continue
             ds = ds.assign_coords({dim: [mapping[int(v)] for v in ds[dim].values]})
 
+        if request.args.get("format") == "netcdf":
+            return hydrology_netcdf(
+                ds,
+                gdf,
+                stream_id,
+                "Hydrologic Statistics",
+                source,
+                populate_feature_attributes,
+            )
+
         # package the stats data + metadata into a dictionary for JSON serialization
         try:
             data_dict = package_stats_data(stream_id, ds)
@@ -526,7 +538,7 @@ def run_get_arctic_hydrology_stats_data(stream_id):
         data_dict = populate_feature_attributes(data_dict, gdf)
         data_dict = prune_nulls_with_max_intensity(data_dict)
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             try:
                 return create_csv(
                     data=data_dict,
@@ -552,6 +564,7 @@ def run_get_arctic_hydrology_stats_data(stream_id):
 
 
 @routes.route("/arctic_hydrology/modeled_climatology/<stream_id>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_get_arctic_hydrology_modeled_climatology(stream_id):
     """
     Function to fetch hydrograph data from Rasdaman for a single stream ID.
@@ -568,6 +581,11 @@ def run_get_arctic_hydrology_modeled_climatology(stream_id):
     elif source == "gcm_diff":
         return render_template("400/bad_request.html"), 400
 
+    if request.args.get("format") == "netcdf" and source != "original_gcm":
+        # GCM-projected changes are only applied to the Cheng climatology when
+        # packaging JSON, NetCDF output holds the original GCM values
+        return render_template("400/bad_request.html"), 400
+
     if not stream_id.isdigit():
         return render_template("400/bad_request.html"), 400
 
@@ -592,6 +610,16 @@ def run_get_arctic_hydrology_modeled_climatology(stream_id):
             decoded_datasets.append(ds)
         datasets = decoded_datasets
 
+        if request.args.get("format") == "netcdf":
+            return hydrology_netcdf(
+                xr.merge(datasets, join="outer", combine_attrs="drop_conflicts"),
+                gdf,
+                stream_id,
+                "Modeled Daily Climatologies",
+                source,
+                populate_feature_attributes,
+            )
+
         # package the hydrograph datasets into a dictionary for JSON serialization
         data_dict = package_hydrograph_data(stream_id, datasets)
         data_dict = package_metadata(
@@ -600,7 +628,7 @@ def run_get_arctic_hydrology_modeled_climatology(stream_id):
         data_dict = populate_feature_attributes(data_dict, gdf)
         data_dict = prune_nulls_with_max_intensity(data_dict)
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             try:
                 return create_csv(
                     data=data_dict,
@@ -1,5 +1,4 @@
 import asyncio
-import numpy as np
 import itertools
 from flask import Blueprint, render_template, request
 
@@ -14,7 +13,8 @@ from fetch_data import (
     get_poly,
     get_all_possible_dimension_combinations,
 )
-from zonal_stats import interpolate_and_compute_zonal_stats
+from zonal_stats import interpolate_and_compute_zonal_class_counts
+from zonal_stats_cache import get_or_compute_zonal_stats
 from csv_functions import create_csv
 from validate_request import (
     validate_latlon,
@@ -23,10 +23,7 @@ from validate_request import (
     get_coverage_encodings,
     get_coverage_crs_str,
 )
-from postprocessing import (
-    nullify_and_prune,
-    prune_nulls_with_max_intensity,
-)
+from postprocessing import nullify_and_prune
 from . import routes
 from config import WEST_BBOX, EAST_BBOX
 
@@ -136,49 +133,47 @@ def run_aggregate_var_polygon(poly_id):
         for coords in iter_coords
     ]
 
-    beetle_results = interpolate_and_compute_zonal_stats(
+    # risk levels are a handful of integer classes, so count the cells of each level
+    # within the polygon for all combinations at once
+    risk_levels = list(protection_levels_dict.keys())
+    class_counts = interpolate_and_compute_zonal_class_counts(
         polygon,
         ds,
         crs,
         dim_combinations,
+        risk_levels,
         var_name=bandname,
         x_dim="X",
         y_dim="Y",
-        compute_full_stats=True,
     )
 
-    for (combo_dict, combo_zonal_stats_dict), dim_combo in zip(
-        beetle_results, dim_combos
-    ):
-        vals_counts_dict = combo_zonal_stats_dict["unique_values_and_counts"]
+    for counts, dim_combo in zip(class_counts, dim_combos):
+        total_cells = int(counts.sum())
 
-        # if nan is the only value in the subset, set all null results for this dim combo (will get pruned)
-        if len(vals_counts_dict) == 1 and np.isnan(list(vals_counts_dict.keys())).any():
+        # if there is no data in the subset, set all null results for this dim combo (will get pruned)
+        if total_cells == 0:
             results = None
 
-        # otherwise, populate results dict using only non-nan values
-        # with the counts from vals_counts_dict expressed as percentages
+        # otherwise, populate results dict with the counts of each level expressed as percentages
         else:
-            results = dict()
-            non_nan_vals_counts_dict = {
-                k: v for k, v in vals_counts_dict.items() if np.isnan(k) == False
+            # levels found in the polygon area come first, then those not found (set to 0)
+            results = {
+                level: round(int(count) / total_cells * 100)
+                for level, count in zip(risk_levels, counts)
+                if count > 0
             }
-            total_cells = sum(non_nan_vals_counts_dict.values())
-
-            for key in non_nan_vals_counts_dict:
-                results[key] = round(non_nan_vals_counts_dict[key] / total_cells * 100)
-
-            # if any protection levels were not found in the polygon area, set the percentages to 0
-            for level in protection_levels_dict.keys():
-                if level not in results.keys():
+            for level in risk_levels:
+                if level not in results:
                     results[level] = 0
 
             # get the climate protection level to the protection level with the highest percentage (i.e., the mode)
             highest_pct_key = max(results, key=results.get)
 
             # replace the results keys with the full string from the protection_levels_dict
-            for key in results.keys():
-                results[protection_levels_dict[key]["pct_label"]] = results.pop(key)
+            results = {
+                protection_levels_dict[key]["pct_label"]: pct
+                for key, pct in results.items()
+            }
 
             # and finally add the protection level to the results dict
             results["climate-protection"] = protection_levels_dict[highest_pct_key][
@@ -260,8 +255,7 @@ def run_point_fetch_all_beetles(lat, lon):
                     ]
                 }
 
-        results = nullify_and_prune(results, "beetles")
-        results = prune_nulls_with_max_intensity(results)
+        results = nullify_and_prune(results, "beetles", prune_nulls=True)
 
         if results in [{}, None, 0]:
             return render_template("404/no_data.html"), 404
@@ -296,9 +290,14 @@ def beetle_area_data_endpoint(var_id):
         return poly_type
 
     try:
-        results = run_aggregate_var_polygon(var_id)
-        results = nullify_and_prune(results, "beetles")
-        results = prune_nulls_with_max_intensity(results)
+        results = get_or_compute_zonal_stats(
+            var_id,
+            [var_ep_lu["beetles"]["cov_id_str"]],
+            "beetles",
+            run_aggregate_var_polygon,
+            var_id,
+        )
+        results = nullify_and_prune(results, "beetles", prune_nulls=True)
 
         if results in [{}, None, 0]:
             return render_template("404/no_data.html"), 404
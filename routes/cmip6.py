@@ -20,8 +20,13 @@ from validate_request import (
     construct_latlon_bbox_from_coverage_bounds,
     validate_latlon_in_bboxes,
 )
-from postprocessing import postprocess, prune_nulls_with_max_intensity
-from csv_functions import create_csv
+from columnar import (
+    build_columnar_result,
+    get_labels_with_data,
+    postprocess_columnar,
+)
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
+from json_provider import stream_json
 from . import routes
 
 logger = logging.getLogger(__name__)
@@ -103,10 +108,8 @@ def package_cmip6_monthly_data(
         end_year (int): end year
 
     Returns:
-        di (dict): dictionary mirroring structure of nested list with keys derived from coverage metadata
+        result (xarray.DataArray): columnar result with model, scenario, month, and variable dimensions
     """
-    di = dict()
-
     # get vars from coverage metadata if not specified
     if vars is None:
         vars = coverage_metadata["variables"]
@@ -126,90 +129,45 @@ def package_cmip6_monthly_data(
     # third is a large list of strings:
     #   each string represents a month in the time range requested (start to end year)
     #   each string is a space-separated list of values, one for each variable requested
-
+    # parse these into one (model, scenario, time, variable) array
+    values = np.full(
+        (len(models), len(scenarios), len(times), len(vars)), np.nan
+    )
     for mi, model_li in enumerate(point_data_list):
-        model = models[mi]
-        if model not in di:
-            di[model] = dict()
-
         for si, scenario_li in enumerate(model_li):
-            scenario = scenarios[si]
-            if scenario not in di[model]:
-                di[model][scenario] = dict()
-
             for toi, time_str in enumerate(scenario_li):
-                time = times[toi]
-                di[model][scenario][time] = dict()
-
-                # split the space-separated string of values into a list
-                # first check if its a float, int, or None (occurs if only 1 variable is requested)
+                # check if its a float, int, or None (occurs if only 1 variable is requested)
                 if isinstance(time_str, float) or isinstance(time_str, int):
-                    value_list = [str(time_str)]
-                elif time_str is None:
-                    value_list = [None for _ in vars]
-                else:
-                    value_list = time_str.split(" ")
-                for vi, varname in enumerate(vars):
-                    value = value_list[vi]
-
-                    # clean data - replace "null" or None with np.nan
-                    # these values are allowed and not necessarily pruned from the response
-                    if value == "null" or value is None:
-                        value = np.nan
-                    # Evaporation has very tiny values.
-                    if varname == "evspsbl":
-                        precision = 8
-                    else:
-                        precision = 3
-
-                    di[model][scenario][time][varname] = round(float(value), precision)
+                    values[mi, si, toi, 0] = time_str
+                elif time_str is not None:
+                    # "null" values are left as np.nan
+                    values[mi, si, toi] = [
+                        float(value) if value != "null" else np.nan
+                        for value in time_str.split(" ")
+                    ]
 
     # Responses from Rasdaman include the same array length for both
     # historical and projected data, representing every possible year
     # in the request. This means both the historical and projected data
     # arrays may include entire years populated with NaNs if the year range
     # spans 2014 -2015 (2014 is the last year for historical data, and
-    # 2015 is the first year of projected data).
-
-    # The code below replaces NaNs with -9999 for entire years that have no data.
-    # Consider the -9999 value as a flag to indicate that the prune_nulls_with_max_intensity()
-    # function should drop the entire scenario / year combo from the response.
-
-    # If the scenario is historical and the year is greater than 2014,
-    # all NaN values are replaced with -9999 and will be pruned from the response.
-    # If the scenario is not historical, and the year is less than 2015,
-    # all NaN values are replaced with -9999 and will be pruned from the response.
-
-    for model, scenarios in di.items():
-        for scenario, months in scenarios.items():
-            for month, variables in months.items():
-                for variable, value in variables.items():
-                    if scenario == "historical" and int(month[:4]) > 2014:
-                        if np.isnan(value):
-                            di[model][scenario][month][variable] = -9999
-                    elif scenario != "historical" and int(month[:4]) < 2015:
-                        if np.isnan(value):
-                            di[model][scenario][month][variable] = -9999
-
-    # We can also see entire nodata years in the projected data if a specific
-    # scenario did not include data for a particular variable.
-    # Iterate through the dictionary again, and check if all values for all variables in a scenario are np.nan
-    # If so, replace all those np.nan values with -9999
-    for model, scenarios in di.items():
-        for scenario, months in scenarios.items():
-            for month, variables in months.items():
-                all_nan = True
-                for variable, value in variables.items():
-                    if not np.isnan(value):
-                        all_nan = False
-                        break
-                if all_nan:
-                    for variable in variables:
-                        di[model][scenario][month][variable] = -9999
-
-    di = prune_nulls_with_max_intensity(di)
-
-    return di
+    # 2015 is the first year of projected data). Whole scenarios can also
+    # be missing a variable. NaNs are nodata values for this endpoint, so
+    # these months are left out when the result is postprocessed and serialized.
+
+    # Evaporation has very tiny values.
+    precision = {varname: 8 if varname == "evspsbl" else 3 for varname in vars}
+
+    return build_columnar_result(
+        values,
+        {
+            "model": models,
+            "scenario": scenarios,
+            "month": times,
+            "variable": vars,
+        },
+        precision,
+    )
 
 
 @routes.route("/cmip6/")
@@ -224,6 +182,7 @@ def cmip6_references():
 
 @routes.route("/cmip6/point/<lat>/<lon>")
 @routes.route("/cmip6/point/<lat>/<lon>/<start_year>/<end_year>")
+@output_formats(*TABULAR_FORMATS)
 def run_fetch_cmip6_monthly_point_data(lat, lon, start_year=None, end_year=None):
     """
     Query the CMIP6 monthly coverage
@@ -318,23 +277,20 @@ def run_fetch_cmip6_monthly_point_data(lat, lon, start_year=None, end_year=None)
             point_data_list, coverage_metadata, vars, start_year, end_year
         )
 
-        results = prune_nulls_with_max_intensity(postprocess(results, "cmip6_monthly"))
+        results = postprocess_columnar(results, "cmip6_monthly")
     except:
         return render_template("500/server_error.html"), 500
 
-    if request.args.get("format") == "csv":
+    if isinstance(results, tuple):
+        # no data
+        return results
+
+    if request.args.get("format") in TABULAR_FORMATS:
         try:
             # if no specific var(s) requested, find all unique vars in the results after pruning
             # we need to pass this list explicitly to create_csv since results from land- or sea-only variables may be missing
             if vars is None:
-                vars = []
-                for model in results:
-                    for scenario in results[model]:
-                        for month in results[model][scenario]:
-                            for var in results[model][scenario][month]:
-                                # append only if not already in list
-                                if var not in vars:
-                                    vars.append(var)
+                vars = get_labels_with_data(results, "variable")
             logger.debug(f"Results limited to {vars}")
 
             place_id = request.args.get("community")
@@ -351,4 +307,7 @@ def run_fetch_cmip6_monthly_point_data(lat, lon, start_year=None, end_year=None)
         except:
             return render_template("500/server_error.html"), 500
 
-    return results
+    try:
+        return stream_json(results, levels=2)
+    except:
+        return render_template("500/server_error.html"), 500
@@ -13,8 +13,9 @@ from validate_request import (
     project_latlon,
     generate_time_index_from_coverage_metadata,
 )
-from postprocessing import postprocess, prune_nulls_with_max_intensity
-from csv_functions import create_csv
+from postprocessing import postprocess
+from json_provider import stream_json
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
 
 from luts import (
     cmip6_downscaled_options,
@@ -92,6 +93,7 @@ def cmip6_downscaled_about():
 
 
 @routes.route("/cmip6_downscaled/point/<lat>/<lon>")
+@output_formats(*TABULAR_FORMATS)
 def cmip6_downscaled_point(lat, lon):
     """
     Fetch CMIP6 downscaled daily data for at a specified point for each variable/model/scenario,
@@ -142,7 +144,7 @@ def cmip6_downscaled_point(lat, lon):
         results = fetch_all_requested_combos(lat, lon, vars, models, scenarios)
         if isinstance(results, tuple):
             return results
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             place_id = request.args.get("community")
             return create_csv(
                 results,
@@ -159,7 +161,10 @@ def cmip6_downscaled_point(lat, lon):
             return render_template("404/no_data.html"), 404
         return render_template("500/server_error.html"), 500
 
-    return results
+    try:
+        return stream_json(results, levels=2)
+    except:
+        return render_template("500/server_error.html"), 500
 
 
 def fetch_all_requested_combos(lat, lon, vars, models, scenarios):
@@ -198,7 +203,7 @@ def fetch_all_requested_combos(lat, lon, vars, models, scenarios):
                             results[model][scenario][time] = {}
                         results[model][scenario][time][varname] = value
 
-    results = prune_nulls_with_max_intensity(postprocess(results, "cmip6_downscaled"))
+    results = postprocess(results, "cmip6_downscaled", prune_nulls=True)
     return results
 
 
@@ -26,7 +26,8 @@ from generate_urls import (
 from fetch_data import fetch_data, fetch_layer_data, describe_via_wcps
 from validate_request import get_axis_encodings
 from postprocessing import prune_nulls_with_max_intensity
-from csv_functions import create_csv
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
+from netcdf_functions import hydrology_netcdf
 from config import RAS_BASE_URL
 from . import routes
 import statistics
@@ -837,6 +838,7 @@ def conus_hydrology_about():
 
 
 @routes.route("/conus_hydrology/stats/<stream_id>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_get_conus_hydrology_stats_data(stream_id):
     """
     Function to fetch hydrology data from Rasdaman for a single stream ID.
@@ -876,6 +878,16 @@ def run_get_conus_hydrology_stats_data(stream_id):
                 continue
             ds = ds.assign_coords({dim: [mapping[int(v)] for v in ds[dim].values]})
 
+        if request.args.get("format") == "netcdf":
+            return hydrology_netcdf(
+                ds,
+                gdf,
+                stream_id,
+                "Hydrologic Statistics",
+                source,
+                populate_feature_name_and_location_attributes,
+            )
+
         # package the stats data + metadata into a dictionary for JSON serialization
         data_dict = package_stats_data(stream_id, ds)
         data_dict = package_metadata(ds, data_dict, source=source)
@@ -885,7 +897,7 @@ def run_get_conus_hydrology_stats_data(stream_id):
         data_vars = list(ds.data_vars)
         data_dict = prune_nulls_with_max_intensity(data_dict, keys_to_keep=data_vars)
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             try:
                 return create_csv(
                     data=data_dict,
@@ -914,6 +926,7 @@ def run_get_conus_hydrology_stats_data(stream_id):
 
 
 @routes.route("/conus_hydrology/modeled_climatology/<stream_id>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_get_conus_hydrology_modeled_climatology(stream_id):
     """
     Function to fetch hydrograph data from Rasdaman for a single stream ID.
@@ -930,6 +943,11 @@ def run_get_conus_hydrology_modeled_climatology(stream_id):
     elif source == "gcm_diff":
         return render_template("400/bad_request.html"), 400
 
+    if request.args.get("format") == "netcdf" and source != "original_gcm":
+        # GCM-projected changes are only applied to the Maurer climatology when
+        # packaging JSON, NetCDF output holds the original GCM values
+        return render_template("400/bad_request.html"), 400
+
     if not stream_id.isdigit():
         return render_template("400/bad_request.html"), 400
 
@@ -954,6 +972,16 @@ def run_get_conus_hydrology_modeled_climatology(stream_id):
             decoded_datasets.append(ds)
         datasets = decoded_datasets
 
+        if request.args.get("format") == "netcdf":
+            return hydrology_netcdf(
+                xr.merge(datasets, join="outer", combine_attrs="drop_conflicts"),
+                gdf,
+                stream_id,
+                "Modeled Daily Climatologies",
+                source,
+                populate_feature_name_and_location_attributes,
+            )
+
         # package the hydrograph datasets into a dictionary for JSON serialization
         data_dict = package_hydrograph_data(stream_id, datasets)
         data_dict = package_metadata(
@@ -962,7 +990,7 @@ def run_get_conus_hydrology_modeled_climatology(stream_id):
         data_dict = populate_feature_name_and_location_attributes(data_dict, gdf)
         data_dict = prune_nulls_with_max_intensity(data_dict)
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             try:
                 return create_csv(
                     data=data_dict,
@@ -995,6 +1023,7 @@ def run_get_conus_hydrology_modeled_climatology(stream_id):
 
 
 @routes.route("/conus_hydrology/observed_climatology/<stream_id>")
+@output_formats(*TABULAR_FORMATS)
 def run_get_conus_hydrology_gauge_data(stream_id):
     """
     Function to fetch USGS stream gauge data associated with a single stream ID.
@@ -1024,7 +1053,7 @@ def run_get_conus_hydrology_gauge_data(stream_id):
         if isinstance(gauge_data_dict, tuple):
             return gauge_data_dict  # return 400 if gauge_data_dict is a tuple
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             try:
                 return create_csv(
                     data=gauge_data_dict,
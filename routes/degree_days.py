@@ -21,7 +21,7 @@ from validate_request import (
     validate_latlon,
     project_latlon,
 )
-from postprocessing import prune_nulls_with_max_intensity, postprocess
+from postprocessing import postprocess
 from config import WEST_BBOX, EAST_BBOX
 from . import routes
 
@@ -427,9 +427,7 @@ def run_fetch_dd_point_data(
     # the preview arg is only used for CSV generation and should never occur with additional request args
     if preview:
         dd_data_package = package_unabridged_response(point_data, start_year, end_year)
-        tidy_package = prune_nulls_with_max_intensity(
-            postprocess(dd_data_package, cov_id_str)
-        )
+        tidy_package = postprocess(dd_data_package, cov_id_str, prune_nulls=True)
         if tidy_package in [{}, None, 0]:
             return render_template("404/no_data.html"), 404
         else:
@@ -445,9 +443,7 @@ def run_fetch_dd_point_data(
     # if no request args, return unabridged tidy package
     if len(request.args) == 0:
         dd_data_package = package_unabridged_response(point_data, start_year, end_year)
-        tidy_package = prune_nulls_with_max_intensity(
-            postprocess(dd_data_package, cov_id_str)
-        )
+        tidy_package = postprocess(dd_data_package, cov_id_str, prune_nulls=True)
         return tidy_package
 
     # if args exist, check if they are allowed
@@ -460,9 +456,7 @@ def run_fetch_dd_point_data(
             dd_data_package = package_distilled_response(
                 point_data, start_year, end_year
             )
-            tidy_package = prune_nulls_with_max_intensity(
-                postprocess(dd_data_package, cov_id_str)
-            )
+            tidy_package = postprocess(dd_data_package, cov_id_str, prune_nulls=True)
             if tidy_package in [{}, None, 0]:
                 return render_template("404/no_data.html"), 404
             else:
@@ -478,17 +472,13 @@ def run_fetch_dd_point_data(
             dd_data_package = package_distilled_response(
                 point_data, start_year, end_year
             )
-            tidy_package = prune_nulls_with_max_intensity(
-                postprocess(dd_data_package, cov_id_str)
-            )
+            tidy_package = postprocess(dd_data_package, cov_id_str, prune_nulls=True)
             return tidy_package
         elif "format" in request.args:
             dd_data_package = package_unabridged_response(
                 point_data, start_year, end_year
             )
-            tidy_package = prune_nulls_with_max_intensity(
-                postprocess(dd_data_package, cov_id_str)
-            )
+            tidy_package = postprocess(dd_data_package, cov_id_str, prune_nulls=True)
             if tidy_package in [{}, None, 0]:
                 return render_template("404/no_data.html"), 404
             else:
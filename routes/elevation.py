@@ -13,6 +13,7 @@ from fetch_data import (
     get_poly,
 )
 from zonal_stats import interpolate_and_compute_zonal_stats
+from zonal_stats_cache import get_cached_zonal_stats, cache_zonal_stats
 from validate_request import (
     validate_latlon,
     validate_var_id,
@@ -24,6 +25,7 @@ from . import routes
 elevation_api = Blueprint("elevation_api", __name__)
 
 wms_targets = ["astergdem_min_max_avg"]
+cov_id = "astergdem_min_max_avg"
 wfs_targets = {}
 target_crs = (
     "EPSG:3338"  # hard coded for now, since metadata is not fetched from GeoServer
@@ -100,6 +102,13 @@ def run_area_fetch_all_elevation(var_id):
     if type(poly_type) is tuple:
         return poly_type
 
+    # the DEM comes from GeoServer, so it is versioned with its GeoServer coverage metadata
+    cached_results = get_cached_zonal_stats(
+        var_id, [cov_id], "astergdem_min_max_avg", backend=GS_BASE_URL
+    )
+    if cached_results is not None:
+        return postprocess(cached_results, "elevation")
+
     try:
         polygon = get_poly(var_id)
     except:
@@ -111,7 +120,7 @@ def run_area_fetch_all_elevation(var_id):
     request_str = generate_wcs_getcov_str(
         xstr,
         ystr,
-        "astergdem_min_max_avg",
+        cov_id,
         var_coord=None,
         encoding="GeoTIFF",
         projection=target_crs,
@@ -161,4 +170,7 @@ def run_area_fetch_all_elevation(var_id):
             else:
                 results[band] = int(combo_zonal_stats_dict["mean"])
 
+    cache_zonal_stats(
+        var_id, [cov_id], "astergdem_min_max_avg", results, backend=GS_BASE_URL
+    )
     return postprocess(results, "elevation")
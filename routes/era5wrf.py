@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import time
+import numpy as np
 from flask import Blueprint, render_template, request
 
 
@@ -24,10 +25,16 @@ from zonal_stats import (
     get_scale_factor,
     rasterize_polygon,
     interpolate,
-    calculate_zonal_means_vectorized,
+    interpolate_and_compute_zonal_means,
+    run_zonal_tasks,
 )
-from postprocessing import postprocess, prune_nulls_with_max_intensity
-from csv_functions import create_csv
+from columnar import (
+    build_columnar_result,
+    postprocess_columnar,
+)
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
+from netcdf_functions import columnar_to_dataset, create_netcdf
+from json_provider import stream_json
 from . import routes
 
 era5wrf_api = Blueprint("era5wrf_api", __name__)
@@ -61,24 +68,36 @@ def package_era5wrf_point_data(data_dict, coverage_meta):
         coverage_meta (dict): Coverage metadata containing time axis
 
     Returns:
-        dict: Time-first structured data {date: {variable: value}}
+        xarray.DataArray: Time-first columnar result {date: {variable: value}}
     """
 
     time_index = generate_time_index_from_coverage_metadata(coverage_meta)
+    return package_era5wrf_time_series(data_dict, time_index)
 
-    # package data with time keys at top level
-    packaged_data = {}
-    for i, timestamp in enumerate(time_index):
-        date_key = timestamp.strftime("%Y-%m-%d")
-        packaged_data[date_key] = {}
 
-        # add each variable's value for this date
-        for variable, values in data_dict.items():
-            if i < len(values) and values[i] is not None:
-                # round to 1 decimal good for current variable set, might need to change later
-                packaged_data[date_key][variable] = round(values[i], 1)
+def package_era5wrf_time_series(data_dict, time_index):
+    """Package daily values of ERA5-WRF variables into a time-first columnar result.
 
-    return packaged_data
+    Args:
+        data_dict (dict): Variable names mapped to lists or arrays of daily values
+        time_index (pd.DatetimeIndex): dates of the daily values
+
+    Returns:
+        xarray.DataArray: Time-first columnar result {date: {variable: value}}
+    """
+    variables = list(data_dict)
+    values = np.full((len(time_index), len(variables)), np.nan)
+    for i, variable in enumerate(variables):
+        # None becomes NaN, a nodata value
+        var_values = np.array(data_dict[variable][: len(time_index)], dtype=float)
+        values[: var_values.size, i] = var_values
+
+    # round to 1 decimal good for current variable set, might need to change later
+    return build_columnar_result(
+        values,
+        {"date": time_index.strftime("%Y-%m-%d"), "variable": variables},
+        precision=1,
+    )
 
 
 @routes.route("/era5wrf/")
@@ -112,6 +131,7 @@ async def fetch_era5_wrf_point_data(x, y, variables):
 
 
 @routes.route("/era5wrf/point/<lat>/<lon>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def era5wrf_point(lat, lon):
     """ERA5-WRF point data endpoint.
     Args:
@@ -169,17 +189,27 @@ def era5wrf_point(lat, lon):
             "t2_mean"
         ]  # any coverage metadata for time axis, they are all the same
         packaged_data = package_era5wrf_point_data(all_data, reference_meta)
-        postprocessed = prune_nulls_with_max_intensity(
-            postprocess(packaged_data, "era5wrf_4km")
-        )
+        postprocessed = postprocess_columnar(packaged_data, "era5wrf_4km")
+        if isinstance(postprocessed, tuple):
+            # no data
+            return postprocessed
+
+        if request.args.get("format") == "netcdf":
+            return create_netcdf(
+                columnar_to_dataset(postprocessed),
+                "Dynamically Downscaled ERA5 4km Data",
+                place_id=request.args.get("community"),
+                lat=lat,
+                lon=lon,
+            )
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             place_id = request.args.get("community")
             return create_csv(
                 postprocessed, "era5wrf_4km", place_id=place_id, lat=lat, lon=lon
             )
 
-        return postprocessed
+        return stream_json(postprocessed)
 
     except Exception as exc:
         if hasattr(exc, "status") and exc.status == 404:
@@ -242,19 +272,22 @@ def process_era5wrf_zonal_stats(polygon, datasets_dict, variables):
     )
     rasterized_polygon_array = rasterize_polygon(da_i, "X", "Y", polygon)
 
-    zonal_results = {}
-    for var_name in variables:
-
-        ds = datasets_dict[var_name]
-
-        # interpolate the entire time series for the variable
-        da_i_3d = interpolate(ds, var_name, "X", "Y", scale_factor, method="nearest")
-
-        # calculate zonal stats for the entire time series
-        time_series_means = calculate_zonal_means_vectorized(
-            da_i_3d, rasterized_polygon_array, "X", "Y"
-        )
-        zonal_results[var_name] = time_series_means
+    # interpolate the entire time series and calculate zonal stats for each variable in parallel
+    time_series_means = run_zonal_tasks(
+        interpolate_and_compute_zonal_means,
+        [
+            (
+                datasets_dict[var_name],
+                var_name,
+                "X",
+                "Y",
+                scale_factor,
+                rasterized_polygon_array,
+            )
+            for var_name in variables
+        ],
+    )
+    zonal_results = dict(zip(variables, time_series_means))
 
     logger.info(f"Zonal stats processed in {round(time.time() - time_start, 2)} seconds")
     return zonal_results
@@ -267,32 +300,23 @@ def package_era5wrf_area_data(zonal_results, coverage_meta, variables):
         coverage_meta (dict): Coverage metadata containing time axis
         variables (list): List of variable names
     Returns:
-        dict: Time-first structured data {date: {variable: zonal_mean}}
+        xarray.DataArray: Time-first columnar result {date: {variable: zonal_mean}}
     """
     logger.info(f"Packaging area data for {variables} variables")
     time_start = time.time()
     time_index = generate_time_index_from_coverage_metadata(coverage_meta)
 
     # package data with time keys at top level, same as point query
-    packaged_data = {}
-    for i, timestamp in enumerate(time_index):
-        date_key = timestamp.strftime("%Y-%m-%d")
-        packaged_data[date_key] = {}
-
-        # add each variable's zonal mean for this date
-        for variable in variables:
-            if (
-                i < len(zonal_results[variable])
-                and zonal_results[variable][i] is not None
-            ):
-                # round to 1 decimal for consistency with point queries
-                packaged_data[date_key][variable] = round(zonal_results[variable][i], 1)
+    packaged_data = package_era5wrf_time_series(
+        {variable: zonal_results[variable] for variable in variables}, time_index
+    )
 
     logger.info(f"Area data packaged in {round(time.time() - time_start, 2)} seconds")
     return packaged_data
 
 
 @routes.route("/era5wrf/area/<place_id>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def era5wrf_area(place_id):
 
     poly_type = validate_var_id(place_id)
@@ -334,14 +358,22 @@ def era5wrf_area(place_id):
             zonal_results, reference_meta, variables
         )
 
-        postprocessed = prune_nulls_with_max_intensity(
-            postprocess(packaged_data, "era5wrf_4km")
-        )
+        postprocessed = postprocess_columnar(packaged_data, "era5wrf_4km")
+        if isinstance(postprocessed, tuple):
+            # no data
+            return postprocessed
+
+        if request.args.get("format") == "netcdf":
+            return create_netcdf(
+                columnar_to_dataset(postprocessed),
+                "Dynamically Downscaled ERA5 4km Data",
+                place_id=place_id,
+            )
 
-        if request.args.get("format") == "csv":
+        if request.args.get("format") in TABULAR_FORMATS:
             return create_csv(postprocessed, "era5wrf_4km", place_id=place_id)
 
-        return postprocessed
+        return stream_json(postprocessed)
 
     except Exception as exc:
         if hasattr(exc, "status") and exc.status == 404:
@@ -28,12 +28,19 @@ from validate_request import (
     validate_var_id,
 )
 from zonal_stats import (
+    get_geographic_cell_area,
+    get_geographic_cell_weights,
+    get_polygon_part_groups,
     get_scale_factor,
     rasterize_polygon,
     interpolate,
-    calculate_zonal_means_vectorized,
+    interpolate_and_compute_zonal_sums,
+    run_zonal_tasks,
 )
-from csv_functions import create_csv
+from config import ZONAL_STATS_MEMORY_BUDGET_MB
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
+from netcdf_functions import create_netcdf
+from postprocessing import get_nodata_mask
 from luts import summer_fire_danger_ratings_dict
 
 from . import routes
@@ -192,19 +199,46 @@ async def fetch_point_data_for_all_vars(requested_vars, lat, lon, var_time_slice
     return fetched_data
 
 
-async def fetch_polygon_data_for_all_vars(requested_vars, polygon, var_time_slices):
+async def fetch_polygon_data_for_all_vars(
+    requested_vars, polygon_parts, var_time_slices
+):
     """
     Fetch the data for the requested variables in the polygon and time range.
+    Each group of polygon parts is fetched in its own bbox, so places that cross the antimeridian
+    do not fetch a bbox spanning the whole globe.
+
+    Args:
+        requested_vars (list): list of requested variables
+        polygon_parts (list): list of GeoDataFrames with groups of polygon parts to fetch data for,
+            from get_polygon_part_groups()
+        var_time_slices (dict): dict of time slices for each variable
+    Returns:
+        list: list of dictionaries with fetched data as xarray.Datasets, one per variable,
+            and one dictionary per group of polygon parts
+    """
+    datasets_dicts = await asyncio.gather(
+        *[
+            fetch_bbox_data_for_all_vars(
+                requested_vars, parts.total_bounds, var_time_slices
+            )
+            for parts in polygon_parts
+        ]
+    )
+    return list(datasets_dicts)
+
+
+async def fetch_bbox_data_for_all_vars(requested_vars, bbox_bounds, var_time_slices):
+    """
+    Fetch the data for the requested variables in a bbox and time range.
 
     Args:
         requested_vars (list): list of requested variables
-        polygon (GeoDataFrame): polygon to fetch data for
+        bbox_bounds (tuple): 4-tuple of lon/lat lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
         var_time_slices (dict): dict of time slices for each variable
     Returns:
         dict: Dictionary with fetched data as xarray.Datasets, one per variable
     """
     tasks = []
-    bbox_bounds = polygon.total_bounds
     x_str = f"{bbox_bounds[0]},{bbox_bounds[2]}"
     y_str = f"{bbox_bounds[1]},{bbox_bounds[3]}"
     for var in requested_vars:
@@ -231,12 +265,13 @@ async def fetch_polygon_data_for_all_vars(requested_vars, polygon, var_time_slic
     return datasets_dict
 
 
-def calculate_fwi_zonal_stats(polygon, datasets_dict, variables):
+def calculate_fwi_zonal_stats(polygon_parts, datasets_dicts, variables):
     """Process zonal statistics for variable datasets.
 
     Args:
-        polygon (GeoDataFrame): Target polygon
-        datasets_dict (dict): Dictionary with variable names mapped to xarray.Datasets
+        polygon_parts (list): List of GeoDataFrames with groups of parts of the target polygon
+        datasets_dicts (list): List of dictionaries with variable names mapped to xarray.Datasets,
+            one per group of polygon parts
         variables (list): List of variable names
 
     Returns:
@@ -245,52 +280,70 @@ def calculate_fwi_zonal_stats(polygon, datasets_dict, variables):
     logger.info(f"Processing zonal stats for {variables} variables")
     time_start = time.time()
 
-    # convert polygon and all datasets to 3338 so we can do area calculations in meters
-    polygon = polygon.to_crs(epsg=3338)
-
-    # we need to split the datasets by model and reproject each one because we cant reproject multi-model datasets directly
-    datasets_by_var_model_dict = {}
-    for var_name in variables:
-        datasets_by_var_model_dict[var_name] = {}
-        var_ds = datasets_dict[var_name]
-        models = var_ds["model"].values
-        for model in models:
-            ds_model = var_ds.sel(model=model)
-            ds_model = ds_model.rio.write_crs("EPSG:4326", inplace=True)
-            ds_model = ds_model.rio.reproject("EPSG:3338")
-            datasets_by_var_model_dict[var_name][model] = ds_model
-
-    # use first dataset to get spatial resolution and rasterization
-    ds = next(iter(datasets_by_var_model_dict[variables[0]].values()))
-
-    # get scale factor once, not per variable or time slice!
-    spatial_resolution = ds.rio.resolution()
-    grid_cell_area_m2 = abs(spatial_resolution[0]) * abs(spatial_resolution[1])
-    polygon_area_m2 = polygon.area
-    scale_factor = get_scale_factor(grid_cell_area_m2, polygon_area_m2)
+    # the data stay on their EPSG:4326 source grid: the polygon is masked in 4326 and cells are
+    # weighted by their area, instead of reprojecting every model's full time series to 3338
+    datasets_dict = datasets_dicts[0]
+    ds = datasets_dict[variables[0]]
+    x_dim, y_dim = ds.rio.x_dim, ds.rio.y_dim
 
-    # create an initial array for the basis of polygon rasterization
-    # why? polygon rasterization bogs down hard when doing it in the loop
-    da_i = interpolate(
-        ds.isel(time=0), variables[0], "x", "y", scale_factor, method="nearest"
+    # get scale factor once, not per variable, time slice or polygon part!
+    grid_cell_area_m2 = get_geographic_cell_area(ds, x_dim, y_dim)
+    polygon_area_m2 = np.array(
+        [sum(parts.to_crs(epsg=3338).area.sum() for parts in polygon_parts)]
     )
+    scale_factor = get_scale_factor(grid_cell_area_m2, polygon_area_m2)
 
-    rasterized_polygon_array = rasterize_polygon(da_i, "x", "y", polygon)
-
-    zonal_results = {}
-    for var_name in variables:
-        zonal_results[var_name] = {}
-        for model in datasets_by_var_model_dict[var_name]:
-            ds = datasets_by_var_model_dict[var_name][model]
-            # interpolate the entire time series for the variable
-            da_i_3d = interpolate(
-                ds, var_name, "x", "y", scale_factor, method="nearest"
+    # create an initial array per polygon part bbox for the basis of polygon rasterization
+    # why? polygon rasterization bogs down hard when doing it in the loop
+    rasterized_parts = []
+    for parts, parts_datasets_dict in zip(polygon_parts, datasets_dicts):
+        da_i = interpolate(
+            parts_datasets_dict[variables[0]].isel(time=0, model=0),
+            variables[0],
+            x_dim,
+            y_dim,
+            scale_factor,
+            method="nearest",
+        )
+        rasterized_parts.append(
+            (
+                rasterize_polygon(da_i, x_dim, y_dim, parts.to_crs(epsg=4326)),
+                get_geographic_cell_weights(da_i, x_dim, y_dim),
             )
-            # calculate zonal stats for the entire time series
-            time_series_means = calculate_zonal_means_vectorized(
-                da_i_3d, rasterized_polygon_array, "x", "y"
+        )
+
+    # interpolate the entire time series and calculate zonal sums for each variable, model and
+    # polygon part in parallel, then combine the sums of the parts into zonal means
+    var_models = [
+        (var_name, model)
+        for var_name in variables
+        for model in datasets_dict[var_name]["model"].values
+    ]
+    n_parts = len(polygon_parts)
+    time_series_sums = run_zonal_tasks(
+        interpolate_and_compute_zonal_sums,
+        [
+            (
+                datasets_dicts[i][var_name].sel(model=model),
+                var_name,
+                x_dim,
+                y_dim,
+                scale_factor,
+                rasterized_parts[i][0],
+                rasterized_parts[i][1],
+                ZONAL_STATS_MEMORY_BUDGET_MB,
             )
-            zonal_results[var_name][model] = time_series_means
+            for var_name, model in var_models
+            for i in range(n_parts)
+        ],
+    )
+    zonal_results = {var_name: {} for var_name in variables}
+    for j, (var_name, model) in enumerate(var_models):
+        part_sums = time_series_sums[j * n_parts : (j + 1) * n_parts]
+        weighted_sums = sum(sums for sums, _ in part_sums)
+        weight_sums = sum(totals for _, totals in part_sums)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            zonal_results[var_name][model] = (weighted_sums / weight_sums).tolist()
 
     logger.info(
         f"Zonal stats processed in {round(time.time() - time_start, 2)} seconds"
@@ -325,6 +378,12 @@ def calculate_fwi_zonal_stats(polygon, datasets_dict, variables):
 #### POSTPROCESSING FUNCTIONS ####
 
 
+def mask_fwi_nodata(ds, var):
+    """Mask the fire weather nodata values of a variable as NaN, on the whole array at once."""
+    nodata_mask = get_nodata_mask(ds[var].values, "fire_weather")
+    return ds.assign({var: ds[var].where(~nodata_mask)})
+
+
 def dayofyear_to_mmdd(dayofyear):
     """Convert integer day of year (1-365) to a MM-DD string for a non-leap year."""
     days = float(dayofyear - 1)  # this cant be an int, so we convert to float
@@ -356,6 +415,64 @@ def build_variable_year_range_str_from_start_and_end_year(var, start_year, end_y
     return year_range_str
 
 
+def nday_rolling_stats(n, ds, var, model_encoding):
+    """
+    Take an n-day rolling average of the values of one variable, and summarize the min, mean, and max
+    of those rolling averages per model and DOY across the entire time range, skipping NAs.
+
+    Args:
+        n (int): number of days for rolling average
+        ds (xarray.Dataset): dataset of the variable, with model and time dimensions
+        var (str): variable name
+        model_encoding (dict): model names by integer model coordinate, from the coverage metadata
+    Returns:
+        xarray.DataArray: min/mean/max values rounded to 3 decimals, with stat, model (names),
+            and dayofyear (MM-DD strings) dimensions
+    """
+    ds = mask_fwi_nodata(ds, var)
+    # Apply a n-day rolling average along the time dimension
+    ds_rolled = ds.rolling(time=int(n), center=True).mean(skipna=True)
+
+    # Group by day of year and model, and calculate min, mean, max
+    stats = ["min", "mean", "max"]
+    stat_dataarrays = []
+    for stat in stats:
+        ds_stat = getattr(ds_rolled.groupby(["time.dayofyear", "model"]), stat)(
+            skipna=True
+        )
+        # Replace the integer DOY with dates in format MM-DD for better readability
+        ds_stat = set_dataset_doy_str(ds_stat)
+        stat_dataarrays.append(ds_stat[var].transpose("model", "dayofyear"))
+
+    da = xr.concat(stat_dataarrays, dim="stat").assign_coords(stat=stats).round(3)
+    # use model names from the coverage metadata
+    return da.assign_coords(
+        model=[model_encoding[int(model)] for model in da["model"].values]
+    )
+
+
+def nday_rolling_average_dataset(n, data_dict, var_coverage_metadata):
+    """
+    Summarize the n-day rolling averages of every variable (see nday_rolling_stats) into one Dataset,
+    for NetCDF output.
+
+    Args:
+        n (int): number of days for rolling average
+        data_dict (dict): dict of xarray.Datasets, one per variable
+        var_coverage_metadata (dict): metadata for each variable, which includes model encoding
+    Returns:
+        xarray.Dataset: one data variable per fire weather variable
+    """
+    return xr.Dataset(
+        {
+            var: nday_rolling_stats(
+                n, ds, var, var_coverage_metadata[var]["model_encoding"]
+            )
+            for var, ds in data_dict.items()
+        }
+    )
+
+
 def nday_rolling_average(n, data_dict, var_coverage_metadata, start_year, end_year):
     """
     For each dataset in the dictionary, we will take an n-day rolling average of values (smoothing).
@@ -387,47 +504,28 @@ def nday_rolling_average(n, data_dict, var_coverage_metadata, start_year, end_ye
     for var in data_dict:
         var_nday_summary[year_range_str][var] = {}
 
-        ds = data_dict[var]
-        # Apply a n-day rolling average along the time dimension
-        ds_rolled = ds.rolling(time=int(n), center=True).mean(skipna=True)
-
-        # Group by day of year and model, and calculate min, mean, max
-        ds_min_doy = ds_rolled.groupby(["time.dayofyear", "model"]).min(skipna=True)
-        ds_mean_doy = ds_rolled.groupby(["time.dayofyear", "model"]).mean(skipna=True)
-        ds_max_doy = ds_rolled.groupby(["time.dayofyear", "model"]).max(skipna=True)
-
-        # Replace the integer DOY with dates in format MM-DD for better readability
-        ds_min_doy = set_dataset_doy_str(ds_min_doy)
-        ds_mean_doy = set_dataset_doy_str(ds_mean_doy)
-        ds_max_doy = set_dataset_doy_str(ds_max_doy)
+        da = nday_rolling_stats(
+            n, data_dict[var], var, var_coverage_metadata[var]["model_encoding"]
+        )
+        # extract the min/mean/max values of every model and DOY as an array before building any dicts
+        stat_values = da.values
+        stats = da["stat"].values.tolist()
+        mean_index = stats.index("mean")
+        doys = da["dayofyear"].values
 
         # for each model in the dataset create a dict of DOYs under that model
-        for model in ds_mean_doy["model"].values:
-            # use model names from the coverage metadata
-            model_name_str = var_coverage_metadata[var]["model_encoding"][int(model)]
-            var_nday_summary[year_range_str][var][model_name_str] = {}
-            # for each DOY in the dataset extract min/mean/max values and create a dict of them under that DOY
-            for doy in ds_mean_doy["dayofyear"].values:
-                var_nday_summary[year_range_str][var][model_name_str][doy] = {
-                    "min": float(
-                        ds_min_doy.sel(dayofyear=doy, model=model)
-                        .to_array()
-                        .values[0]
-                        .round(3)
-                    ),
-                    "mean": float(
-                        ds_mean_doy.sel(dayofyear=doy, model=model)
-                        .to_array()
-                        .values[0]
-                        .round(3)
-                    ),
-                    "max": float(
-                        ds_max_doy.sel(dayofyear=doy, model=model)
-                        .to_array()
-                        .values[0]
-                        .round(3)
-                    ),
+        for mi, model_name_str in enumerate(da["model"].values.tolist()):
+            # skip models without any data in the time range
+            if np.isnan(stat_values[mean_index, mi]).all():
+                continue
+            # for each DOY in the dataset create a dict of min/mean/max values under that DOY
+            var_nday_summary[year_range_str][var][model_name_str] = {
+                doy: {
+                    stat: float(stat_values[si, mi, di])
+                    for si, stat in enumerate(stats)
                 }
+                for di, doy in enumerate(doys)
+            }
 
     return var_nday_summary
 
@@ -468,7 +566,7 @@ def summer_fire_danger_rating_days(
     for var in data_dict:
         var_summer_fire_summary[year_range_str][var] = {}
 
-        ds = data_dict[var]
+        ds = mask_fwi_nodata(data_dict[var], var)
         # drop any months that arent June, July, or August
         ds = ds.sel(time=ds["time"].dt.month.isin([6, 7, 8]))
 
@@ -534,6 +632,41 @@ def drop_era5(results_dict):
     return results_dict
 
 
+def fire_weather_netcdf(
+    n, data_dict, start_year, end_year, place_id=None, lat=None, lon=None
+):
+    """Return the n-day rolling average summaries of the fire weather variables as a NetCDF file.
+    Summer fire danger rating day counts are only available as JSON or CSV, so the routes
+    reject NetCDF requests for them before fetching any data.
+
+    Args:
+        n (int): number of days for rolling average
+        data_dict (dict): dict of xarray.Datasets, one per variable
+        start_year (int): start year of the data, or None
+        end_year (int): end year of the data, or None
+        place_id (str): place identifier, for area queries
+        lat: latitude for point queries
+        lon: longitude for point queries
+    Returns:
+        NetCDF Response
+    """
+    ds = nday_rolling_average_dataset(n, data_dict, var_coverage_metadata)
+    # like nday_rolling_average(), leave out models without any data in the time range
+    ds = ds.dropna("model", how="all")
+    if start_year is not None and start_year >= 2021:
+        ds = ds.drop_sel(model="era5", errors="ignore")
+    ds.attrs["years"] = build_variable_year_range_str_from_start_and_end_year(
+        list(data_dict.keys())[0], start_year, end_year
+    )
+    return create_netcdf(
+        ds,
+        f"CMIP6 Fire Weather Indices - {n} Day Rolling Average",
+        place_id=place_id,
+        lat=lat,
+        lon=lon,
+    )
+
+
 #### FLASK ROUTES ####
 
 
@@ -544,6 +677,7 @@ def fire_weather_about():
 
 @routes.route("/fire_weather/point/<lat>/<lon>")
 @routes.route("/fire_weather/point/<lat>/<lon>/<start_year>/<end_year>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_fetch_fire_weather_point_data(lat, lon, start_year=None, end_year=None):
     """
     Query the daily fire weather coverage.
@@ -554,7 +688,7 @@ def run_fetch_fire_weather_point_data(lat, lon, start_year=None, end_year=None):
             valid operations: 3_day_rolling_average, 5_day_rolling_average, 7_day_rolling_average, summer_fire_danger_rating_days
             only one operation can be performed at a time
             default is 3_day_rolling_average
-        format: output format (only supports "csv")
+        format: output format ("csv", "parquet", "arrow", or "netcdf" for rolling averages)
 
     Args:
         lat (float): latitude
@@ -588,16 +722,24 @@ def run_fetch_fire_weather_point_data(lat, lon, start_year=None, end_year=None):
 
     requested_ops = request.args.get("op")
 
+    if ops_dict.get(requested_ops, None) == None:
+        n = 3  # default to 3-day rolling average
+    else:
+        n = ops_dict.get(requested_ops)
+
+    if request.args.get("format") == "netcdf" and n not in [3, 5, 7]:
+        return render_template("400/bad_request.html"), 400
+
     fetched_data = asyncio.run(
         fetch_point_data_for_all_vars(
             requested_vars, float(lat), float(lon), var_time_slices
         )
     )
 
-    if ops_dict.get(requested_ops, None) == None:
-        n = 3  # default to 3-day rolling average
-    else:
-        n = ops_dict.get(requested_ops)
+    if request.args.get("format") == "netcdf":
+        return fire_weather_netcdf(
+            n, fetched_data, start_year, end_year, lat=lat, lon=lon
+        )
 
     if n in [3, 5, 7]:
         processed_data = nday_rolling_average(
@@ -619,7 +761,7 @@ def run_fetch_fire_weather_point_data(lat, lon, start_year=None, end_year=None):
     if start_year is not None and start_year >= 2021:
         processed_data = drop_era5(processed_data)
 
-    if request.args.get("format") == "csv":
+    if request.args.get("format") in TABULAR_FORMATS:
         # reformat ops string for filename prefix, e.g "CMIP6 Fire Weather Indices - 3 Day Rolling Average"
         filename_prefix = "CMIP6 Fire Weather Indices - " + " ".join(
             [word.capitalize() for word in requested_ops[0].split("_")]
@@ -640,6 +782,7 @@ def run_fetch_fire_weather_point_data(lat, lon, start_year=None, end_year=None):
 
 @routes.route("/fire_weather/area/<place_id>")
 @routes.route("/fire_weather/area/<place_id>/<start_year>/<end_year>")
+@output_formats(*TABULAR_FORMATS, "netcdf")
 def run_fetch_fire_weather_area_data(place_id, start_year=None, end_year=None):
     """
     Query the daily fire weather coverage.
@@ -649,7 +792,7 @@ def run_fetch_fire_weather_area_data(place_id, start_year=None, end_year=None):
         op: postprocessing operation to perform (required)
             valid operations: 3_day_rolling_average, 5_day_rolling_average, 7_day_rolling_average, summer_fire_danger_rating_days
             only one operation can be performed at a time
-        format: output format (only supports "csv")
+        format: output format ("csv", "parquet", "arrow", or "netcdf" for rolling averages)
 
     Args:
         place_id (str): place identifier, used to fetch polygon and compute zonal statistics
@@ -691,23 +834,34 @@ def run_fetch_fire_weather_area_data(place_id, start_year=None, end_year=None):
 
     requested_ops = request.args.get("op")
 
+    if ops_dict.get(requested_ops, None) == None:
+        n = 3  # default to 3-day rolling average
+    else:
+        n = ops_dict.get(requested_ops)
+
+    if request.args.get("format") == "netcdf" and n not in [3, 5, 7]:
+        return render_template("400/bad_request.html"), 400
+
     try:
-        # fetch bbox datasets for requested variables
-        datasets_dict = asyncio.run(
-            fetch_polygon_data_for_all_vars(requested_vars, polygon, var_time_slices)
+        # fetch bbox datasets for requested variables, far-apart polygon parts in separate bboxes
+        polygon_parts = get_polygon_part_groups(polygon)
+        datasets_dicts = asyncio.run(
+            fetch_polygon_data_for_all_vars(
+                requested_vars, polygon_parts, var_time_slices
+            )
         )
         zonal_results = calculate_fwi_zonal_stats(
-            polygon, datasets_dict, requested_vars
+            polygon_parts, datasets_dicts, requested_vars
         )
     except Exception as exc:
         if hasattr(exc, "status") and exc.status == 404:
             return render_template("404/no_data.html"), 404
         return render_template("500/server_error.html"), 500
 
-    if ops_dict.get(requested_ops, None) == None:
-        n = 3  # default to 3-day rolling average
-    else:
-        n = ops_dict.get(requested_ops)
+    if request.args.get("format") == "netcdf":
+        return fire_weather_netcdf(
+            n, zonal_results, start_year, end_year, place_id=place_id
+        )
 
     if n in [3, 5, 7]:
         processed_data = nday_rolling_average(
@@ -729,7 +883,7 @@ def run_fetch_fire_weather_area_data(place_id, start_year=None, end_year=None):
     if start_year is not None and start_year >= 2021:
         processed_data = drop_era5(processed_data)
 
-    if request.args.get("format") == "csv":
+    if request.args.get("format") in TABULAR_FORMATS:
         # reformat ops string for filename prefix, e.g "CMIP6 Fire Weather Indices - 3 Day Rolling Average"
         if requested_ops is None:
             # use first key of ops dict for default if no ops requested
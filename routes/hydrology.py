@@ -14,7 +14,7 @@ from validate_request import (
     get_coverage_encodings,
 )
 from postprocessing import postprocess
-from csv_functions import create_csv
+from csv_functions import create_csv, TABULAR_FORMATS, output_formats
 from config import WEST_BBOX, EAST_BBOX
 from . import routes
 
@@ -361,6 +361,7 @@ def hydro_about():
 
 
 @routes.route("/hydrology/point/<lat>/<lon>")
+@output_formats(*TABULAR_FORMATS)
 def run_get_hydrology_point_data(lat, lon, summarize=None, preview=None):
     validation = validate_latlon(lat, lon, [hydrology_coverage_id])
     if validation == 400:
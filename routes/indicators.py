@@ -26,7 +26,11 @@ from fetch_data import (
     ymd_to_cftime_value,
     cftime_value_to_ymd,
 )
-from zonal_stats import interpolate_and_compute_zonal_stats
+from zonal_stats import (
+    get_polygon_part_groups,
+    interpolate_and_compute_multipart_zonal_stats,
+)
+from zonal_stats_cache import get_or_compute_zonal_stats
 from validate_request import (
     validate_latlon,
     latlon_is_numeric_and_in_geodetic_range,
@@ -40,7 +44,6 @@ from validate_request import (
 from postprocessing import (
     nullify_and_prune,
     postprocess,
-    prune_nulls_with_max_intensity,
 )
 from csv_functions import create_csv
 from . import routes
@@ -127,24 +130,24 @@ async def fetch_indicators_point_data(lat, lon, cov_id_str, proj_str):
     return point_data_list
 
 
-async def fetch_indicators_bbox_data(bbox_bounds, cov_id_str):
-    """Make the async request for the data at the specified point for a specific coverage
+async def fetch_indicators_bbox_data(bbox_bounds_list, cov_id_str):
+    """Make the async requests for the data within the specified bboxes for a specific coverage
 
     Args:
-        bbox_bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        bbox_bounds_list (list): list of 4-tuples of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>),
+            e.g. one per group of polygon parts
         cov_id_str (str): shared portion of coverage_ids to query
     Returns:
-        bbox_ds (xarray.DataSet): xarray dataset with the data for the bbox
+        bbox_ds_list (list): list of xarray datasets with the data for each bbox
     """
     # set up WCS request strings
-    request_strs = []
-    request_strs.append(generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id_str))
+    request_strs = [
+        generate_netcdf_wcs_getcov_str(bbox_bounds, cov_id_str)
+        for bbox_bounds in bbox_bounds_list
+    ]
     urls = [generate_wcs_query_url(request_str) for request_str in request_strs]
     bbox_ds_list = await fetch_bbox_netcdf_list(urls)
-    bbox_ds = bbox_ds_list[
-        0
-    ]  # there is only ever one dataset in the list for this endpoint
-    return bbox_ds
+    return bbox_ds_list
 
 
 def package_cmip5_point_data(rasdaman_response):
@@ -202,8 +205,7 @@ def package_cmip5_point_data(rasdaman_response):
             dim_combo[4]
         ] = stat_value
 
-    results = nullify_and_prune(results, "ncar12km_indicators")
-    results = prune_nulls_with_max_intensity(results)
+    results = nullify_and_prune(results, "ncar12km_indicators", prune_nulls=True)
     return results
 
 
@@ -225,7 +227,14 @@ def run_aggregate_var_polygon(poly_id, var_ep):
     bandname = var_ep_lu[var_ep]["bandnames"][0]
     crs = var_ep_lu[var_ep]["crs"]
 
-    ds = asyncio.run(fetch_indicators_bbox_data(polygon.total_bounds, cov_id_str))
+    # far-apart parts of the polygon are fetched in separate, tighter bboxes
+    polygon_parts = get_polygon_part_groups(polygon)
+    ds_list = asyncio.run(
+        fetch_indicators_bbox_data(
+            [parts.total_bounds for parts in polygon_parts], cov_id_str
+        )
+    )
+    ds = ds_list[0]
 
     # get all combinations of non-XY dimensions in the dataset and their corresponding encodings
     # and create a dict to hold the results for each combo
@@ -245,9 +254,9 @@ def run_aggregate_var_polygon(poly_id, var_ep):
         for coords in iter_coords
     ]
 
-    results = interpolate_and_compute_zonal_stats(
-        polygon,
-        ds,
+    results = interpolate_and_compute_multipart_zonal_stats(
+        polygon_parts,
+        ds_list,
         crs,
         dim_combinations,
         var_name=bandname,
@@ -285,8 +294,9 @@ def run_aggregate_var_polygon(poly_id, var_ep):
         ] = result
 
     # remove null values from the results dict
-    aggr_results = nullify_and_prune(aggr_results, "ncar12km_indicators")
-    aggr_results = prune_nulls_with_max_intensity(aggr_results)
+    aggr_results = nullify_and_prune(
+        aggr_results, "ncar12km_indicators", prune_nulls=True
+    )
 
     return aggr_results
 
@@ -428,8 +438,7 @@ def summarize_cmip6_mmm(results):
                     if era in cmip6_eras.keys() and data
                 }
 
-    results = nullify_and_prune(results, "cmip6_indicators")
-    results = prune_nulls_with_max_intensity(results)
+    results = nullify_and_prune(results, "cmip6_indicators", prune_nulls=True)
 
     return results
 
@@ -578,7 +587,14 @@ def get_cmip5_indicators_area_data(var_id):
         return poly_type
 
     try:
-        aggr_results = run_aggregate_var_polygon(var_id, "cmip5_indicators")
+        aggr_results = get_or_compute_zonal_stats(
+            var_id,
+            [var_ep_lu["cmip5_indicators"]["cov_id_str"]],
+            "cmip5_indicators",
+            run_aggregate_var_polygon,
+            var_id,
+            "cmip5_indicators",
+        )
 
     except:
         return render_template("422/invalid_area.html"), 422
@@ -20,8 +20,9 @@ from fetch_data import (
     fetch_wcs_point_data,
     describe_via_wcps,
 )
-from postprocessing import prune_nulls_with_max_intensity, postprocess
+from postprocessing import postprocess
 from csv_functions import create_csv
+from json_provider import stream_json
 
 # following are global because we only need to fetch metadata once
 # but must do it to determine request validity and what coverage to query
@@ -112,12 +113,15 @@ def run_point_fetch_all_landfastice(lat, lon):
         landfastice_time_series = package_landfastice_data(
             rasdaman_response, target_meta
         )
-        postprocessed = prune_nulls_with_max_intensity(
-            postprocess(landfastice_time_series, "landfast_sea_ice")
+        postprocessed = postprocess(
+            landfastice_time_series, "landfast_sea_ice", prune_nulls=True
         )
+        if isinstance(postprocessed, tuple):
+            # no data
+            return postprocessed
         if request.args.get("format") == "csv":
             return create_csv(postprocessed, "landfast_sea_ice", lat=lat, lon=lon)
-        return postprocessed
+        return stream_json(postprocessed)
     except Exception as exc:
         if hasattr(exc, "status") and exc.status == 404:
             return render_template("404/no_data.html"), 404
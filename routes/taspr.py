@@ -1,11 +1,9 @@
 import asyncio
-import io
 import time
 import itertools
 from urllib.parse import quote
 import numpy as np
 import pandas as pd
-import xarray as xr
 from flask import (
     Blueprint,
     render_template,
@@ -19,6 +17,7 @@ from generate_requests import generate_wcs_getcov_str, generate_mmm_wcs_getcov_s
 from generate_urls import generate_wcs_query_url
 from fetch_data import (
     fetch_data,
+    fetch_tiled_bbox_netcdf,
     fetch_wcs_point_data,
     get_from_dict,
     get_poly,
@@ -26,6 +25,7 @@ from fetch_data import (
     get_all_possible_dimension_combinations,
 )
 from zonal_stats import interpolate_and_compute_zonal_stats
+from zonal_stats_cache import get_or_compute_zonal_stats
 from validate_request import (
     validate_latlon,
     project_latlon,
@@ -37,7 +37,7 @@ from postprocessing import (
     postprocess,
 )
 from csv_functions import create_csv
-from config import WEST_BBOX, EAST_BBOX
+from config import BBOX_TILE_SIZE_M, WEST_BBOX, EAST_BBOX
 from . import routes
 
 taspr_api = Blueprint("taspr_api", __name__)
@@ -954,34 +954,46 @@ async def fetch_bbox_netcdf(x1, y1, x2, y2, var_coord, cov_ids, summary_decades)
     """
     encoding = "netcdf"
 
-    urls = []
-    for cov_id, decade_tpl in zip(cov_ids, summary_decades):
-        if decade_tpl:
-            # if summary decades are given, create a WCPS request string
-            x = f"{x1}:{x2}"
-            y = f"{y1}:{y2}"
-            request_str = get_wcps_request_str(
-                x, y, var_coord, cov_id, decade_tpl, encoding
-            )
-        else:
-            # otheriwse use generic WCS request str
-            x = f"{x1},{x2}"
-            y = f"{y1},{y2}"
-            request_str = generate_wcs_getcov_str(
-                x, y, cov_id, var_coord, encoding=encoding
-            )
-        urls.append(generate_wcs_query_url(request_str))
+    def get_url_function(cov_id, decade_tpl):
+        def get_url(bounds):
+            bx1, by1, bx2, by2 = bounds
+            if decade_tpl:
+                # if summary decades are given, create a WCPS request string
+                x = f"{bx1}:{bx2}"
+                y = f"{by1}:{by2}"
+                request_str = get_wcps_request_str(
+                    x, y, var_coord, cov_id, decade_tpl, encoding
+                )
+            else:
+                # otheriwse use generic WCS request str
+                x = f"{bx1},{bx2}"
+                y = f"{by1},{by2}"
+                request_str = generate_wcs_getcov_str(
+                    x, y, cov_id, var_coord, encoding=encoding
+                )
+            return generate_wcs_query_url(request_str)
+
+        return get_url
 
+    # the bbox is fetched as cached tiles, shared with overlapping and repeated areas
     start_time = time.time()
-    data_list = await fetch_data(urls)
+    ds_list = await asyncio.gather(
+        *[
+            fetch_tiled_bbox_netcdf(
+                (x1, y1, x2, y2),
+                get_url_function(cov_id, decade_tpl),
+                "X",
+                "Y",
+                BBOX_TILE_SIZE_M,
+            )
+            for cov_id, decade_tpl in zip(cov_ids, summary_decades)
+        ]
+    )
     app.logger.info(
         f"Fetched BBOX data from Rasdaman, elapsed time {round(time.time() - start_time)}s"
     )
 
-    # create xarray.DataSet from bytestring
-    ds_list = [xr.open_dataset(io.BytesIO(netcdf_bytes)) for netcdf_bytes in data_list]
-
-    return ds_list
+    return list(ds_list)
 
 
 def combine_pkg_dicts(tas_di, pr_di):
@@ -1137,9 +1149,14 @@ def run_fetch_point_data(lat, lon):
 
 
 def run_aggregate_allvar_polygon(poly_id):
-    """Get data summary (e.g. zonal mean) within a Polygon for all variables."""
+    """Get data summary (e.g. zonal mean) within a Polygon for all variables.
+    Each variable is cached separately, so they are shared with the single variable endpoints.
+    """
+    cov_ids = list(set(make_fetch_args()[0]))
     tas_pkg, pr_pkg = [
-        run_aggregate_var_polygon(var_ep, poly_id)
+        get_or_compute_zonal_stats(
+            poly_id, cov_ids, var_ep, run_aggregate_var_polygon, var_ep, poly_id
+        )
         for var_ep in ["temperature", "precipitation"]
     ]
     combined_pkg = combine_pkg_dicts(tas_pkg, pr_pkg)
@@ -1785,7 +1802,10 @@ def taspr_area_data_endpoint(var_id):
             var_ep = "taspr"
 
         if var_ep in var_ep_lu.keys():
-            poly_pkg = run_aggregate_var_polygon(var_ep, var_id)
+            cov_ids = list(set(make_fetch_args()[0]))
+            poly_pkg = get_or_compute_zonal_stats(
+                var_id, cov_ids, var_ep, run_aggregate_var_polygon, var_ep, var_id
+            )
         elif var_ep == "taspr":
             poly_pkg = run_aggregate_allvar_polygon(var_id)
         else:
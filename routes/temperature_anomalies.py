@@ -18,7 +18,7 @@ from validate_request import (
 from generate_urls import generate_wcs_query_url
 from generate_requests import generate_wcs_getcov_str
 from fetch_data import fetch_data, describe_via_wcps
-from postprocessing import merge_dicts, postprocess, prune_nulls_with_max_intensity
+from postprocessing import merge_dicts, postprocess
 from . import routes
 
 temperature_anomaly_api = Blueprint("temperature_anomalies_api", __name__)
@@ -158,9 +158,7 @@ def run_fetch_temperature_anomalies_point_data(lat, lon):
             data_di = package_temperature_anomalies_data(point_data_list, cov_id)
             merged_data = merge_dicts(merged_data, data_di)
 
-        data = prune_nulls_with_max_intensity(
-            postprocess(merged_data, "temperature_anomalies")
-        )
+        data = postprocess(merged_data, "temperature_anomalies", prune_nulls=True)
 
         if request.args.get("format") == "csv":
             place_id = request.args.get("community")
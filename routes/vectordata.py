@@ -18,6 +18,7 @@ from validate_request import validate_latlon
 from generate_urls import generate_wfs_search_url, generate_wfs_places_url
 from fetch_data import fetch_data
 from csv_functions import create_csv
+from validate_data import add_places
 
 data_api = Blueprint("data_api", __name__)
 
@@ -33,6 +34,7 @@ all_communities_full = asyncio.run(
         ]
     )
 )["features"]
+add_places(all_communities_full)
 
 for extent in geojson_names:
     geojson_path = os.path.join(
@@ -0,0 +1,63 @@
+import numpy as np
+
+from columnar import (
+    build_columnar_result,
+    columnar_to_nested_dict,
+    get_labels_with_data,
+    iter_columnar_csv_rows,
+    mask_columnar_nodata,
+)
+from postprocessing import nullify_and_prune
+
+
+def test_columnar_to_nested_dict_matches_postprocessed_dicts():
+    """
+    Tests that serializing a masked columnar result gives the same nested dict
+    as nullifying and pruning the fully packaged dict of the same values.
+    """
+    rng = np.random.default_rng(0)
+    values = np.round(rng.normal(0, 1, (2, 3, 4)), 5)
+    values[rng.random(values.shape) < 0.3] = -9999
+    values[1, 2] = np.nan
+    dim_encodings = {
+        "model": ["m0", "m1"],
+        "month": ["2000-01", "2000-02", "2000-03"],
+        "variable": ["tas", "pr", "evspsbl", "snw"],
+    }
+    precision = {"tas": 3, "pr": 3, "evspsbl": 8}
+
+    def package_value(value, var):
+        if var in precision:
+            return round(float(value), precision[var])
+        return float(value)
+
+    packaged = {
+        model: {
+            month: {
+                var: package_value(values[mi, ti, vi], var)
+                for vi, var in enumerate(dim_encodings["variable"])
+            }
+            for ti, month in enumerate(dim_encodings["month"])
+        }
+        for mi, model in enumerate(dim_encodings["model"])
+    }
+    expected = nullify_and_prune(packaged, "cmip6_monthly", prune_nulls=True)
+
+    result = build_columnar_result(values, dim_encodings, precision)
+    result = mask_columnar_nodata(result, "cmip6_monthly")
+    assert columnar_to_nested_dict(result) == expected
+
+    rows = list(iter_columnar_csv_rows(result, chunk_size=4))
+    assert [row[:2] for row in rows] == [
+        (model, month) for model in expected for month in expected[model]
+    ]
+    for model, month, *row_values in rows:
+        assert row_values == [
+            expected[model][month].get(var) for var in dim_encodings["variable"]
+        ]
+
+    assert get_labels_with_data(result, "variable") == [
+        var
+        for i, var in enumerate(dim_encodings["variable"])
+        if any(row[2 + i] is not None for row in rows)
+    ]
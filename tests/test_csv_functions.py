@@ -0,0 +1,95 @@
+import csv
+import io
+
+import pytest
+from flask import Flask
+
+import csv_functions
+from csv_functions import (
+    build_csv_dicts,
+    iter_csv_dicts,
+    table_formats,
+    write_csv,
+    write_table,
+)
+
+
+def test_write_csv_streams_rows_in_chunks(monkeypatch):
+    """
+    Tests that the streamed CSV has the metadata, header and rows of the
+    whole CSV, when rows are written a few at a time from a generator.
+    """
+    data = {
+        model: {
+            f"2000-01-{day:02d}": {"pr": day * 0.5, "tasmax": -day}
+            for day in range(1, 12)
+        }
+        for model in ["m0", "m1"]
+    }
+    data["m1"]["2000-01-05"] = {"pr": 1.0}
+    fieldnames = ["model", "date", "pr", "tasmax"]
+    values = ["pr", "tasmax"]
+    properties = {
+        "metadata": "# metadata\n",
+        "fieldnames": fieldnames,
+        "filename": "test.csv",
+    }
+
+    expected = io.StringIO()
+    expected.write(properties["metadata"])
+    writer = csv.DictWriter(expected, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerows(build_csv_dicts(data, fieldnames, values=values))
+
+    monkeypatch.setattr(csv_functions, "CSV_STREAM_CHUNK_ROWS", 5)
+    properties["csv_dicts"] = iter_csv_dicts(data, fieldnames, values=values)
+    with Flask(__name__).test_request_context():
+        response = write_csv(properties)
+        assert response.is_streamed
+        chunks = list(response.response)
+
+    # metadata and header, then 22 rows 5 at a time
+    assert len(chunks) == 6
+    assert "".join(chunks) == expected.getvalue()
+
+
+def test_write_table_matches_csv():
+    """
+    Tests that the Parquet and Arrow exports have the columns, rows and
+    metadata of the CSV export, with typed columns.
+    """
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    data = {
+        model: {
+            f"2000-01-{day:02d}": {"pr": day * 0.5, "tasmax": -day}
+            for day in range(1, 4)
+        }
+        for model in ["m0", "m1"]
+    }
+    data["m1"]["2000-01-02"] = {"pr": 1.0}
+    fieldnames = ["model", "date", "pr", "tasmax"]
+    values = ["pr", "tasmax"]
+    expected = build_csv_dicts(data, fieldnames, values=values)
+
+    for output_format, read_table in [
+        ("parquet", lambda body: pq.read_table(pa.BufferReader(body))),
+        ("arrow", lambda body: pa.ipc.open_stream(body).read_all()),
+    ]:
+        properties = {
+            "metadata": "# metadata\n",
+            "fieldnames": fieldnames,
+            "filename": "test" + table_formats[output_format][0],
+            "csv_dicts": iter_csv_dicts(data, fieldnames, values=values),
+        }
+        with Flask(__name__).test_request_context():
+            response = write_table(properties, output_format)
+        table = read_table(response.get_data())
+
+        assert response.mimetype == table_formats[output_format][1]
+        assert table.column_names == fieldnames
+        assert table.to_pylist() == expected
+        assert table.schema.field("pr").type == pa.float64()
+        assert table.schema.field("tasmax").type == pa.int64()
+        assert table.schema.metadata[b"metadata"] == b"# metadata\n"
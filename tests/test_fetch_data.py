@@ -0,0 +1,109 @@
+import asyncio
+import io
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import fetch_data
+from fetch_data import WCS_BBOX_SUBSET_RE, fetch_wcs_bbox_netcdf
+
+
+def make_coverage():
+    """Build a synthetic 1km EPSG:3338 coverage, rows running north to south."""
+    rng = np.random.default_rng(0)
+    x = np.arange(-300500.0, 300000.0, 1000.0)
+    y = np.arange(900500.0, 300000.0, -1000.0)
+    values = rng.random((3, y.size, x.size), dtype="float32")
+    return xr.Dataset(
+        {"Gray": (("era", "Y", "X"), values)},
+        coords={"era": [0, 1, 2], "X": x, "Y": y},
+    )
+
+
+def test_tiled_bbox_fetch_matches_direct_fetch(monkeypatch):
+    """
+    Tests that bboxes fetched as tiles are mosaicked to the same cells as
+    a direct fetch, and that overlapping bboxes reuse the cached tiles.
+    """
+    coverage = make_coverage()
+    requested = []
+
+    def get_coverage(url):
+        # like Rasdaman, return every cell whose footprint intersects the bbox
+        _, x1, x2, _, y1, y2 = WCS_BBOX_SUBSET_RE.search(url).groups()
+        x, y = coverage["X"], coverage["Y"]
+        subset = coverage.isel(
+            X=(x + 500 >= float(x1)) & (x - 500 <= float(x2)),
+            Y=(y + 500 >= float(y1)) & (y - 500 <= float(y2)),
+        )
+        return subset.to_netcdf()
+
+    async def fake_fetch_data(urls):
+        requested.extend(urls)
+        results = [get_coverage(url) for url in urls]
+        return results[0] if len(results) == 1 else results
+
+    monkeypatch.setattr(fetch_data, "fetch_data", fake_fetch_data)
+    monkeypatch.setattr(fetch_data, "_netcdf_tiles", fetch_data.OrderedDict())
+    monkeypatch.setattr(fetch_data, "_netcdf_tiles_nbytes", 0)
+
+    url = (
+        "https://example.org/ows?&SERVICE=WCS&VERSION=2.0.1&REQUEST=GetCoverage"
+        "&COVERAGEID=test&SUBSET=X(-12345.6,61234.5)&SUBSET=Y(412345.1,498765.2)"
+        "&FORMAT=application/netcdf"
+    )
+    actual = asyncio.run(fetch_wcs_bbox_netcdf(url))
+    expected = xr.open_dataset(io.BytesIO(get_coverage(url)))
+    xr.testing.assert_identical(actual.load(), expected.load())
+    assert len(requested) == 6
+
+    # a nested bbox with an edge on a cell boundary only needs tiles fetched already
+    nested_url = url.replace("61234.5", "30000")
+    actual = asyncio.run(fetch_wcs_bbox_netcdf(nested_url))
+    expected = xr.open_dataset(io.BytesIO(get_coverage(nested_url)))
+    xr.testing.assert_identical(actual.load(), expected.load())
+    assert len(requested) == 6
+
+
+def test_small_bbox_fetched_directly(monkeypatch):
+    """
+    Tests that a bbox much smaller than a tile is fetched directly, even
+    when it straddles a tile corner.
+    """
+    requested = []
+
+    async def fake_fetch_data(urls):
+        requested.extend(urls)
+        return make_coverage().isel(X=slice(0, 2), Y=slice(0, 2)).to_netcdf()
+
+    monkeypatch.setattr(fetch_data, "fetch_data", fake_fetch_data)
+    url = (
+        "https://example.org/ows?&SERVICE=WCS&VERSION=2.0.1&REQUEST=GetCoverage"
+        "&COVERAGEID=test&SUBSET=X(-1000,1000)&SUBSET=Y(499000,501000)"
+        "&FORMAT=application/netcdf"
+    )
+    asyncio.run(fetch_wcs_bbox_netcdf(url))
+    assert len(requested) == 1
+    assert "SUBSET=X(-1000.0,1000.0)" in requested[0]
+
+
+def test_mosaic_rejects_misaligned_tiles():
+    """
+    Tests that tiles whose cells do not line up are not mosaicked.
+    """
+    coverage = make_coverage()
+    tiles = [(-50000.0, 400000.0, 0.0, 450000.0), (0.0, 400000.0, 50000.0, 450000.0)]
+    west = coverage.sel(X=slice(-50000, 0), Y=slice(450000, 400000))
+    east = coverage.sel(X=slice(0, 50000), Y=slice(450000, 400000))
+    bbox = (-50000.0, 400000.0, 50000.0, 450000.0)
+
+    # a tile on a grid offset by half a cell
+    shifted = east.assign_coords(Y=east["Y"] + 500)
+    with pytest.raises(ValueError):
+        fetch_data.mosaic_bbox_tiles([west, shifted], tiles, bbox, "X", "Y")
+
+    # a tile clipped by the coverage edge, leaving a gap
+    clipped = east.isel(X=slice(5, None))
+    with pytest.raises(ValueError):
+        fetch_data.mosaic_bbox_tiles([west, clipped], tiles, bbox, "X", "Y")
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from routes.fire_weather import nday_rolling_average, summer_fire_danger_rating_days
+
+MODEL_METADATA = {"bui": {"model_encoding": {0: "era5", 1: "MRI-ESM2-0"}}}
+
+
+def make_fire_weather_dataset():
+    """Build six June days of BUI for a model with a nodata day and a model with only nodata."""
+    values = np.array([[10, -9999, 50, 50, 70, 100], [-9999] * 6], dtype="float64")
+    return xr.Dataset(
+        {"bui": (("model", "time"), values)},
+        coords={"model": [0, 1], "time": pd.date_range("2001-06-01", periods=6)},
+    )
+
+
+def test_fire_weather_rolling_average_masks_nodata():
+    """
+    Tests that nodata values are masked before the rolling averages, so that
+    windows with a nodata day are NaN instead of being dragged toward -9999,
+    and that models without any data are left out.
+    """
+    actual = nday_rolling_average(
+        3, {"bui": make_fire_weather_dataset()}, MODEL_METADATA, 2001, 2001
+    )
+
+    nan = {"min": np.nan, "mean": np.nan, "max": np.nan}
+    expected = {
+        "2001-2001": {
+            "bui": {
+                "era5": {
+                    "06-01": nan,
+                    "06-02": nan,
+                    "06-03": nan,
+                    "06-04": {"min": 56.667, "mean": 56.667, "max": 56.667},
+                    "06-05": {"min": 73.333, "mean": 73.333, "max": 73.333},
+                    "06-06": nan,
+                }
+            }
+        }
+    }
+    np.testing.assert_equal(actual, expected)
+
+
+def test_fire_weather_danger_rating_days_skip_nodata():
+    """
+    Tests that nodata days are not counted toward any summer fire danger
+    rating class.
+    """
+    actual = summer_fire_danger_rating_days(
+        {"bui": make_fire_weather_dataset()}, MODEL_METADATA, 2001, 2001
+    )
+
+    expected = {
+        "2001-2001": {
+            "bui": {
+                "era5": {"Low": 1, "Mod": 2, "High": 1, "VHigh": 1, "Ext": 0},
+                "MRI-ESM2-0": {"Low": 0, "Mod": 0, "High": 0, "VHigh": 0, "Ext": 0},
+            }
+        }
+    }
+    assert actual == expected
@@ -0,0 +1,20 @@
+from generate_requests import generate_netcdf_wcs_getcov_str
+
+
+def test_netcdf_wcs_getcov_str_only_scales_x_and_y():
+    """
+    Tests that scaled bbox requests only decimate the X and Y axes, since
+    SCALEFACTOR would also decimate the other axes of the coverage.
+    """
+    bbox_bounds = (-100000, 200000, 100000, 400000)
+
+    native = generate_netcdf_wcs_getcov_str(bbox_bounds, "alfresco_cov")
+    assert native == (
+        "GetCoverage&COVERAGEID=alfresco_cov"
+        "&SUBSET=X(-100000,100000)&SUBSET=Y(200000,400000)"
+        "&FORMAT=application/netcdf"
+    )
+
+    scaled = generate_netcdf_wcs_getcov_str(bbox_bounds, "alfresco_cov", scale_factor=4)
+    assert scaled == native + "&SCALEAXES=X(4),Y(4)"
+    assert "SCALEFACTOR" not in scaled
@@ -0,0 +1,108 @@
+import json
+from datetime import date
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from flask import Flask
+
+import json_provider
+from columnar import build_columnar_result
+from json_provider import APIJSONProvider, default, orjson
+
+
+def test_json_provider_serializes_numpy_and_non_finite_values():
+    """
+    Tests that both encoders of the JSON provider serialize NumPy values,
+    columnar results and non-finite floats to the same valid JSON, and keep
+    the key order of the data unless keys are sorted.
+    """
+    app = Flask(__name__)
+    data = {
+        "b": np.float32(1.5),
+        "a": [np.int16(-9999), np.float64("nan"), float("inf"), np.bool_(True)],
+        "c": np.array([[1, 2], [3, 4]], dtype=np.uint8),
+        "d": np.array([0.5, np.nan], dtype=np.float16),
+        "e": build_columnar_result([[1.25, np.nan]], {"x": ["x0"], "y": ["y0", "y1"]}),
+        "f": date(2020, 1, 1),
+    }
+    expected = {
+        "b": 1.5,
+        "a": [-9999, None, None, True],
+        "c": [[1, 2], [3, 4]],
+        "d": [0.5, None],
+        "e": {"x0": {"y0": 1.25}},
+        "f": "Wed, 01 Jan 2020 00:00:00 GMT",
+    }
+
+    encoders = ["json"] if orjson is None else ["json", "orjson"]
+    for encoder in encoders:
+        provider = APIJSONProvider(app)
+        provider.encoder = encoder
+        for sort_keys in [False, True]:
+            provider.sort_keys = sort_keys
+            with app.app_context():
+                response = provider.response(data)
+            serialized = response.get_data(as_text=True)
+            assert json.loads(serialized) == expected
+            keys = list(json.loads(serialized))
+            assert keys == (sorted(expected) if sort_keys else list(expected))
+
+
+def test_streamed_json_matches_json_response():
+    """
+    Tests that streamed responses of packaged and columnar results have the
+    same bytes as the JSON response of the packaged results.
+    """
+    app = Flask(__name__)
+    rng = np.random.default_rng(0)
+    values = np.round(rng.normal(0, 1, (2, 3, 50, 2)), 4)
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[1, 2] = np.nan
+    result = build_columnar_result(
+        values,
+        {
+            "model": ["m0", "m1"],
+            "scenario": ["historical", "ssp245", "ssp585"],
+            "date": [f"2000-01-{day}" for day in range(50)],
+            "variable": ["pr", "tas"],
+        },
+        {"pr": 1, "tas": 3},
+    )
+    packaged = default(result)
+
+    encoders = ["json"] if orjson is None else ["json", "orjson"]
+    for encoder in encoders:
+        provider = APIJSONProvider(app)
+        provider.encoder = encoder
+        with app.app_context():
+            expected = provider.response(packaged).get_data()
+            for data in [packaged, result]:
+                for levels in range(4):
+                    response = provider.stream_response(data, levels)
+                    assert response.is_streamed
+                    assert response.get_data() == expected
+                    streamed = b"".join(provider.iter_json(data, levels, 7))
+                    assert streamed + b"\n" == expected
+
+
+def test_streamed_json_errors():
+    """
+    Tests that an error in the first chunk of a streamed response is raised
+    before the response is returned, and that errors in later chunks are
+    logged.
+    """
+    app = Flask(__name__)
+    provider = APIJSONProvider(app)
+    unserializable = object()
+
+    with app.app_context():
+        with pytest.raises(TypeError):
+            provider.stream_response({"a": {"b": unserializable}}, levels=1)
+
+        data = {"a": {"b": 1}, "c": {"d": unserializable}}
+        response = provider.stream_response(data, levels=1)
+        with patch.object(json_provider.logger, "exception") as log_exception:
+            with pytest.raises(TypeError):
+                response.get_data()
+        log_exception.assert_called_once()
@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+import xarray as xr
+from flask import Flask
+
+from columnar import build_columnar_result
+from netcdf_functions import columnar_to_dataset, create_netcdf, hydrology_netcdf
+
+
+def test_create_netcdf_from_columnar_result():
+    """
+    Tests that a columnar result is written to a NetCDF file with one data
+    variable per label of its last dimension, datetime dates, and the
+    location of the request in the attributes and file name.
+    """
+    values = np.arange(12, dtype=float).reshape(4, 3)
+    values[:, 2] = np.nan
+    values[1, 0] = np.nan
+    result = build_columnar_result(
+        values,
+        {
+            "date": ["2000-01-01", "2000-01-02", "2000-01-03", "2000-01-04"],
+            "variable": ["t2_min", "t2_max", "seaice_max"],
+        },
+        precision=1,
+    )
+
+    with Flask(__name__).test_request_context("/era5wrf/point/65.0/-147.0"):
+        response = create_netcdf(
+            columnar_to_dataset(result), "ERA5 4km Data", lat="65.0", lon="-147.0"
+        )
+    ds = xr.open_dataset(io.BytesIO(response.get_data()), engine="h5netcdf")
+
+    assert response.mimetype == "application/x-netcdf"
+    assert "ERA5%204km%20Data%20for%2065.0%20-147.0.nc" in (
+        response.headers["Content-Disposition"]
+    )
+    assert list(ds.data_vars) == ["t2_min", "t2_max"]
+    assert ds["date"].dtype.kind == "M"
+    np.testing.assert_array_equal(ds["t2_min"].values, values[:, 0])
+    assert ds["t2_max"].encoding["zlib"]
+    assert ds.attrs["latitude"] == 65.0
+    assert ds.attrs["url"] == "https://earthmaps.io/era5wrf/point/65.0/-147.0"
+
+
+def test_hydrology_netcdf_attributes():
+    """
+    Tests that hydrology NetCDF files get the stream attributes filled in by
+    the given function, and the data source.
+    """
+    ds = xr.Dataset({"flow": ("doy", np.array([1.5, 2.5]))}, coords={"doy": [1, 2]})
+
+    def populate_attributes(data_dict, gdf):
+        data_dict.update(gdf)
+        return data_dict
+
+    gdf = {"name": "Test Creek", "latitude": 61.2, "longitude": -149.9}
+    with Flask(__name__).test_request_context("/conus_hydrology/stats/1000"):
+        response = hydrology_netcdf(
+            ds, gdf, "1000", "Hydrologic Statistics", "original_gcm", populate_attributes
+        )
+    ds = xr.open_dataset(io.BytesIO(response.get_data()), engine="h5netcdf")
+
+    assert "Hydrologic%20Statistics%20for%20Stream%20ID%201000.nc" in (
+        response.headers["Content-Disposition"]
+    )
+    assert ds.attrs["name"] == "Test Creek"
+    assert ds.attrs["data_source"] == "original_gcm"
+    assert ds.attrs["place_id"] == "1000"
+    assert ds.attrs["longitude"] == -149.9
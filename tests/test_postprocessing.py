@@ -0,0 +1,96 @@
+import numpy as np
+
+from postprocessing import (
+    get_nodata_mask,
+    nodata_mappings,
+    nodata_tests,
+    nullify_and_prune,
+    nullify_nodata,
+    prune_nodata,
+    prune_nulls_with_max_intensity,
+)
+
+
+def test_nodata_tests_match_string_comparison():
+    """
+    Tests that the typed nodata tests match the same values as
+    comparing the strings of values and nodata values.
+    """
+    values = [
+        -9999,
+        -9999.0,
+        "-9999",
+        "-9999.0",
+        np.int16(-9999),
+        np.float32(-9999),
+        np.float64(-9999),
+        np.nan,
+        np.float32("nan"),
+        "nan",
+        "null",
+        None,
+        "None",
+        True,
+        120,
+        120.0,
+        np.uint8(255),
+        -9.223372e18,
+        -9.223372036854776e18,
+        np.float32(-9.223372036854776e18),
+        0,
+        0.0,
+        12.5,
+        "2020-01-01",
+    ]
+    for endpoint, nodata in nodata_mappings.items():
+        for value in values:
+            expected = str(value) in map(str, nodata)
+            assert nodata_tests[endpoint](value) == expected, (endpoint, value)
+
+
+def test_nullify_and_prune_matches_separate_passes():
+    """
+    Tests that the single pass of nullify_and_prune gives the same result as
+    nullifying, pruning and pruning nulls in separate passes.
+    """
+    data = {
+        "a": {"x": -9999, "y": 1.5, "z": {"deep": -9999.0}},
+        "b": {"x": -9999, "y": np.nan},
+        "c": [{"x": -9999, "y": 2}, {"x": -9999}, [1, 2], [[3]], (4, -9999), 5],
+        "d": (-9999, {"x": -9999}),
+        "e": [],
+        "f": {},
+        "nan": "keep",
+        -9999: "nodata key",
+        "g": {"kept": None, "x": 3},
+    }
+    for endpoint in ["era5wrf_4km", "cmip6_downscaled", "gipl"]:
+        expected = prune_nodata(nullify_nodata(data, endpoint))
+        assert nullify_and_prune(data, endpoint) == expected
+
+        for keys_to_keep in [None, ["kept", "b"]]:
+            pruned = prune_nulls_with_max_intensity(expected, keys_to_keep)
+            actual = nullify_and_prune(
+                data, endpoint, prune_nulls=True, keys_to_keep=keys_to_keep
+            )
+            assert actual == pruned
+
+    assert nullify_and_prune({"x": -9999}, "cmip6_downscaled") is None
+    assert nullify_and_prune(-9999, "cmip6_downscaled") is None
+
+
+def test_nodata_mask_matches_nodata_tests():
+    """
+    Tests that the array nodata mask matches the nodata test of each value
+    for float, integer, string and object arrays.
+    """
+    arrays = [
+        np.array([-9999.0, 1.5, np.nan, -9.223372036854776e18, 0.0]),
+        np.array([-9999, 1, 0], dtype=np.int16),
+        np.array(["-9999", "nan", "1.5"]),
+        np.array([-9999, -9999.0, None, "nan", 2.5], dtype=object),
+    ]
+    for endpoint in nodata_mappings:
+        for values in arrays:
+            expected = [nodata_tests[endpoint](value) for value in values.tolist()]
+            assert get_nodata_mask(values, endpoint).tolist() == expected
@@ -0,0 +1,68 @@
+import time
+
+import validate_data
+from validate_data import place_name_and_type
+
+
+def make_features(places):
+    return [
+        {"properties": {"id": id, "name": name, "alt_name": alt_name, "type": type}}
+        for id, name, alt_name, type in places
+    ]
+
+
+def test_place_name_and_type_uses_place_directory(monkeypatch):
+    """
+    Tests that places are resolved from the place directory once it is loaded,
+    with areas taking precedence over communities (also before it is loaded),
+    and that GeoServer is only queried for places while the directory is not
+    loaded.
+    """
+    requested = []
+
+    async def fetch_data(urls):
+        requested.append(urls)
+        if len(urls) == 1:
+            if "all_areas" in urls[0] and "19010208" in urls[0]:
+                features = make_features([("19010208", "Kenai Peninsula", "", "huc")])
+                return {"numberMatched": 1, "features": features}
+            return {"numberMatched": 0, "features": []}
+        areas = make_features([("19010208", "Kenai Peninsula", "", "huc")])
+        communities = make_features(
+            [
+                ("AK124", "Fairbanks", "", "community"),
+                ("AK15", "Utqiagvik", "Barrow", "community"),
+                ("19010208", "Duplicate", "", "community"),
+            ]
+        )
+        return [{"features": areas}, {"features": communities}]
+
+    monkeypatch.setattr(validate_data, "fetch_data", fetch_data)
+    monkeypatch.setattr(validate_data, "_place_directory", {})
+    monkeypatch.setattr(validate_data, "_place_directory_loaded", False)
+    monkeypatch.setattr(validate_data, "_place_directory_checked_at", time.time())
+
+    assert place_name_and_type(None) == (None, None)
+    assert place_name_and_type("AK124") == (None, None)
+    assert len(requested) == 2
+
+    # added communities skip the community query, but not the area query
+    validate_data.add_places(
+        make_features(
+            [
+                ("AK124", "Fairbanks", "", "community"),
+                ("19010208", "Duplicate", "", "community"),
+            ]
+        )
+    )
+    assert place_name_and_type("AK124") == ("Fairbanks", "community")
+    assert len(requested) == 3
+    assert place_name_and_type("19010208") == ("Kenai Peninsula", "huc")
+    assert len(requested) == 4
+
+    validate_data.load_place_directory()
+    requested.clear()
+    assert place_name_and_type("AK15") == ("Utqiagvik (Barrow)", "community")
+    assert place_name_and_type("19010208") == ("Kenai Peninsula", "huc")
+    assert place_name_and_type("XX0") == (None, None)
+    assert requested == []
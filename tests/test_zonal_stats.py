@@ -0,0 +1,357 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import rioxarray  # noqa: F401, registers the .rio accessor
+import xarray as xr
+from affine import Affine
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+
+import zonal_stats
+from zonal_stats import (
+    calculate_zonal_class_counts,
+    calculate_zonal_means_vectorized,
+    calculate_zonal_stats,
+    compute_grouped_zonal_means,
+    get_geographic_cell_weights,
+    get_polygon_part_groups,
+    get_scale_factor,
+    get_wcs_scale_factor,
+    interpolate,
+    interpolate_and_compute_multipart_zonal_stats,
+    interpolate_and_compute_zonal_means,
+    interpolate_and_compute_zonal_stats,
+    interpolate_and_compute_zonal_sums,
+    rasterize_polygon,
+    simplify_geometry,
+)
+
+
+def make_dataset(n_x, n_y, dtype):
+    """Build a small synthetic 3338 dataset shaped like a Rasdaman bbox fetch."""
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(
+        {
+            "Gray": (
+                ("era", "Y", "X"),
+                (rng.random((2, n_y, n_x)) * 100).astype(dtype),
+            )
+        },
+        coords={
+            "era": [0, 1],
+            "X": np.arange(n_x) * 2000.0 + 1000,
+            # rows run north to south, like the coverages
+            "Y": (np.arange(n_y) * 2000.0 + 500)[::-1],
+        },
+    )
+    return ds.rio.write_crs("EPSG:3338")
+
+
+@pytest.mark.parametrize("dtype", ["float32", "int16"])
+@pytest.mark.parametrize("scale_factor", [1, 3, 8, 15])
+@pytest.mark.parametrize("n_x, n_y", [(1, 4), (10, 9), (33, 20)])
+def test_interpolate_nearest_matches_interp(n_x, n_y, scale_factor, dtype):
+    """
+    Tests that the block replication path for nearest neighbour oversampling
+    gives the same values as xarray's interp(method="nearest"), in the
+    smallest float dtype that holds the data exactly.
+    """
+    ds = make_dataset(n_x, n_y, dtype)
+
+    actual = interpolate(ds, "Gray", "X", "Y", scale_factor, method="nearest")
+
+    new_x = np.linspace(ds["X"][0].item(), ds["X"][-1].item(), n_x * scale_factor)
+    new_y = np.linspace(ds["Y"][0].item(), ds["Y"][-1].item(), n_y * scale_factor)
+    expected = ds["Gray"].interp(method="nearest", coords={"X": new_x, "Y": new_y})
+
+    # assert_identical() does not compare dtypes, and interp() always returns float64
+    assert actual.dtype == "float32"
+    xr.testing.assert_identical(actual, expected.astype(actual.dtype))
+
+
+@pytest.mark.parametrize("scale_factor", [1, 4])
+@pytest.mark.parametrize(
+    "dtype, float_dtype",
+    [("int16", "float32"), ("float32", "float32"), ("int32", "float64")],
+)
+def test_interpolate_keeps_small_dtypes(dtype, float_dtype, scale_factor):
+    """
+    Tests that interpolation only casts data to a float dtype large enough
+    to hold it exactly, and that zonal means still accumulate in float64.
+    """
+    ds = make_dataset(10, 12, dtype).rename({"era": "time"})
+    polygon_array = np.zeros((12 * scale_factor, 10 * scale_factor), dtype="uint8")
+    polygon_array[2:40, 3:30] = 1
+    weights = np.linspace(0.5, 1, 12 * scale_factor)[:, np.newaxis] * np.ones(
+        10 * scale_factor
+    )
+
+    da_i = interpolate(ds, "Gray", "X", "Y", scale_factor, method="nearest")
+    assert da_i.dtype == float_dtype
+
+    values = da_i.values.astype("float64")[:, polygon_array == 1]
+    masked_weights = weights[polygon_array == 1]
+    np.testing.assert_allclose(
+        calculate_zonal_means_vectorized(da_i, polygon_array, "X", "Y"),
+        values.mean(axis=1),
+        rtol=1e-12,
+    )
+    np.testing.assert_allclose(
+        calculate_zonal_means_vectorized(
+            da_i, polygon_array, "X", "Y", weights=weights
+        ),
+        (values * masked_weights).sum(axis=1) / masked_weights.sum(),
+        rtol=1e-12,
+    )
+
+
+def test_blockwise_zonal_means_match_full_time_series():
+    """
+    Tests that streaming a daily time series through interpolation in
+    time chunks gives the same zonal means as interpolating it all at once.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.random((50, 12, 10), dtype="float32")
+    values[3] = np.nan  # an all-nodata day
+    ds = xr.Dataset(
+        {"t2_mean": (("time", "Y", "X"), values)},
+        coords={
+            "time": np.arange(50),
+            "X": np.arange(10) * 4000.0,
+            "Y": (np.arange(12) * 4000.0)[::-1],
+        },
+    ).rio.write_crs("EPSG:3338")
+    scale_factor = 4
+    polygon_array = np.zeros((12 * scale_factor, 10 * scale_factor), dtype="uint8")
+    polygon_array[5:30, 8:25] = 1
+
+    expected = calculate_zonal_means_vectorized(
+        interpolate(ds, "t2_mean", "X", "Y", scale_factor, method="nearest"),
+        polygon_array,
+        "X",
+        "Y",
+    )
+    # budget small enough to force the smallest chunks
+    actual = interpolate_and_compute_zonal_means(
+        ds, "t2_mean", "X", "Y", scale_factor, polygon_array, memory_budget_mb=0.01
+    )
+
+    np.testing.assert_array_equal(actual, expected)
+
+
+def test_geographic_zonal_means_are_area_weighted():
+    """
+    Tests that zonal means on an EPSG:4326 grid weight each row of cells by its area,
+    and that nodata cells are left out of the weights.
+    """
+    lat = np.array([70.0, 60.0])
+    values = np.array([[[1.0, 1.0], [3.0, np.nan]]])
+    da = xr.DataArray(
+        values,
+        dims=("time", "latitude", "longitude"),
+        coords={"time": [0], "latitude": lat, "longitude": [-150.0, -149.0]},
+    )
+    polygon_array = np.ones((2, 2), dtype="uint8")
+
+    weights = get_geographic_cell_weights(da, "longitude", "latitude")
+    actual = calculate_zonal_means_vectorized(
+        da, polygon_array, "longitude", "latitude", weights=weights
+    )
+
+    north, south = np.cos(np.deg2rad(lat))
+    expected = (2 * north * 1.0 + south * 3.0) / (2 * north + south)
+    np.testing.assert_allclose(actual, [expected])
+
+
+def test_zonal_class_counts_match_unique_counts():
+    """
+    Tests that counting classes for all combinations at once gives the same
+    counts as np.unique for each combination, for combinations in any order.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.choice([1.0, 2.0, 3.0, np.nan], size=(3, 2, 20, 30))
+    values[2, 1] = np.nan  # a combination with no data
+    da = xr.DataArray(
+        values,
+        dims=("era", "model", "Y", "X"),
+        coords={"era": [0, 1, 2], "model": [0, 1]},
+    )
+    polygon_array = np.zeros((20, 30), dtype="uint8")
+    polygon_array[4:15, 3:22] = 1
+    combos = [{"era": era, "model": model} for era in [2, 0, 1] for model in [1, 0]]
+
+    actual = calculate_zonal_class_counts(
+        da, polygon_array, combos, [3, 1, 2], "X", "Y"
+    )
+
+    for combo, counts in zip(combos, actual):
+        combo_values = da.sel(combo).values[polygon_array == 1]
+        unique_values, unique_counts = np.unique(
+            combo_values[~np.isnan(combo_values)], return_counts=True
+        )
+        expected = dict(zip(unique_values, unique_counts))
+        assert counts.tolist() == [expected.get(level, 0) for level in [3, 1, 2]]
+
+
+def test_grouped_zonal_means_match_single_polygon_means():
+    """
+    Tests that computing the zonal means of many (touching and overlapping) polygons
+    in one grouped reduction gives the same means as masking each polygon separately.
+    """
+    ds = make_dataset(40, 30, "float32")
+    ds["Gray"][0, 3:10, 3:12] = np.nan
+    # polygons with the same scale factor, spanning the dataset, so they are
+    # oversampled together on the grid of the whole dataset
+    polygons = gpd.GeoDataFrame(
+        geometry=[
+            box(1000, 1000, 40000, 40000),
+            box(40000, 1000, 79000, 40000),  # touches the first polygon
+            box(20000, 20000, 60000, 58500),  # overlaps both polygons
+        ],
+        crs="EPSG:3338",
+    )
+    combos = [{"era": 1}, {"era": 0}]
+
+    actual = compute_grouped_zonal_means(polygons, ds, "EPSG:3338", combos)
+
+    scale_factor = get_scale_factor(4e6, polygons.area.nsmallest(1).values)
+    assert scale_factor == get_scale_factor(4e6, polygons.area.nlargest(1).values)
+    da_i = interpolate(ds, "Gray", "X", "Y", scale_factor, method="nearest")
+    for i in range(len(polygons)):
+        polygon_array = rasterize_polygon(da_i, "X", "Y", polygons.iloc[[i]])
+        for j, combo in enumerate(combos):
+            expected = calculate_zonal_stats(da_i.sel(combo), polygon_array, "X", "Y")
+            np.testing.assert_allclose(actual[j, i], expected["mean"], rtol=1e-6)
+
+
+def test_grouped_zonal_means_oversample_small_polygons_locally(monkeypatch):
+    """
+    Tests that a small polygon batched with a large one is oversampled with its
+    own scale factor on the cells around it only, not on the whole dataset.
+    """
+    ds = make_dataset(40, 30, "float32")
+    polygons = gpd.GeoDataFrame(
+        geometry=[box(1000, 1000, 79000, 58500), box(60000, 40000, 63000, 42000)],
+        crs="EPSG:3338",
+    )
+    combos = [{"era": 0}, {"era": 1}]
+    grid_sizes = []
+    get_zonal_cell_weights = zonal_stats.get_zonal_cell_weights
+
+    def record_grid_size(group_ds, x_dim, y_dim, scale_factor, group_polygons):
+        grid_sizes.append(group_ds["X"].size * group_ds["Y"].size * scale_factor**2)
+        return get_zonal_cell_weights(
+            group_ds, x_dim, y_dim, scale_factor, group_polygons
+        )
+
+    monkeypatch.setattr(zonal_stats, "get_zonal_cell_weights", record_grid_size)
+    actual = compute_grouped_zonal_means(polygons, ds, "EPSG:3338", combos)
+
+    small_scale_factor = get_scale_factor(4e6, polygons.area.nsmallest(1).values)
+    assert max(grid_sizes) < 40 * 30 * small_scale_factor**2 / 10
+    for i in range(len(polygons)):
+        expected = compute_grouped_zonal_means(
+            polygons.iloc[[i]], ds, "EPSG:3338", combos
+        )
+        np.testing.assert_array_equal(actual[:, [i]], expected)
+
+
+def test_simplify_geometry_to_pixel_tolerance():
+    """
+    Tests that polygons are simplified to well below the pixel size, stay valid,
+    and that the simplified geometry is cached for the same polygon and grid.
+    """
+    angles = np.linspace(0, 2 * np.pi, 5000, endpoint=False)
+    radii = 10000 * (1 + 0.001 * np.random.default_rng(0).standard_normal(5000))
+    polygon = Polygon(np.column_stack([radii * np.cos(angles), radii * np.sin(angles)]))
+    transform = Affine(400, 0, -12000, 0, -400, 12000)
+
+    simplified = simplify_geometry(polygon, transform)
+
+    assert simplified.is_valid
+    assert len(simplified.exterior.coords) < len(polygon.exterior.coords) / 10
+    assert polygon.hausdorff_distance(simplified) <= 0.25 * 400
+    assert simplify_geometry(polygon, transform) is simplified
+
+
+def test_large_polygons_are_not_oversampled():
+    """
+    Tests that polygons covering many native grid cells get a scale factor of 1,
+    and that very large bboxes are decimated to at most the cell budget.
+    """
+    assert get_scale_factor(4e6, np.array([4e6 * 100])) > 1
+    assert get_scale_factor(4e6, np.array([4e6 * 10**6])) == 1
+
+    assert get_wcs_scale_factor((0, 0, 1e6, 1e6), 1000, max_cells=0) == 1
+    assert get_wcs_scale_factor((0, 0, 1e5, 1e5), 1000, max_cells=10**5) == 1
+    scale_factor = get_wcs_scale_factor((0, 0, 1e6, 2e6), 1000, max_cells=10**5)
+    assert (1000 / scale_factor) * (2000 / scale_factor) <= 10**5
+    assert (1000 / (scale_factor - 1)) * (2000 / (scale_factor - 1)) > 10**5
+
+
+def test_multipart_zonal_stats_match_single_bbox():
+    """
+    Tests that far-apart polygon parts are split into separate bbox groups, and that
+    combining the zonal stats of the groups, including a group of several parts,
+    gives the stats of the whole polygon.
+    """
+    ds = make_dataset(120, 100, "float32")
+    # two nearby parts, which share a bbox group, and a far-apart part
+    geometry = MultiPolygon(
+        [
+            Point(30000, 40000).buffer(15000),
+            Point(65000, 45000).buffer(12000),
+            Point(200000, 160000).buffer(20000),
+        ]
+    )
+    polygon = gpd.GeoDataFrame(geometry=[geometry], crs="EPSG:3338")
+    dimension_combinations = [{"era": 0}, {"era": 1}]
+
+    polygon_parts = get_polygon_part_groups(polygon)
+    assert len(polygon_parts) == 2
+    assert sorted(len(parts) for parts in polygon_parts) == [1, 2]
+    assert get_polygon_part_groups(polygon, max_bboxes=1)[0] is polygon
+
+    # parts rasterized on the same grid as the whole polygon cover the same cells
+    expected = interpolate_and_compute_zonal_stats(
+        polygon, ds, "EPSG:3338", dimension_combinations, compute_full_stats=True
+    )
+    actual = interpolate_and_compute_multipart_zonal_stats(
+        polygon_parts,
+        [ds, ds],
+        "EPSG:3338",
+        dimension_combinations,
+        compute_full_stats=True,
+    )
+    assert actual == expected
+
+
+def test_zonal_sums_combine_to_weighted_means():
+    """
+    Tests that the weighted sums of the parts of a polygon combine
+    to the weighted zonal means of the whole polygon.
+    """
+    ds = make_dataset(10, 12, "float32").rename({"era": "time"})
+    ds["Gray"][0, 2, 3] = np.nan
+    scale_factor = 3
+    polygon_array = np.zeros((12 * scale_factor, 10 * scale_factor), dtype="uint8")
+    polygon_array[5:30, 8:25] = 1
+    weights = np.linspace(0.5, 1, 12 * scale_factor)[:, np.newaxis] * np.ones(
+        10 * scale_factor
+    )
+
+    expected = interpolate_and_compute_zonal_means(
+        ds, "Gray", "X", "Y", scale_factor, polygon_array, weights=weights
+    )
+    part_arrays = [polygon_array.copy(), polygon_array.copy()]
+    part_arrays[0][:, 15:] = 0
+    part_arrays[1][:, :15] = 0
+    part_sums = [
+        interpolate_and_compute_zonal_sums(
+            ds, "Gray", "X", "Y", scale_factor, part_array, weights
+        )
+        for part_array in part_arrays
+    ]
+    weighted_sums = sum(sums for sums, _ in part_sums)
+    weight_sums = sum(totals for _, totals in part_sums)
+
+    np.testing.assert_allclose(weighted_sums / weight_sums, expected, rtol=1e-12)
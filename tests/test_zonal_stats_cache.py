@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+import zonal_stats_cache
+from zonal_stats_cache import (
+    cache_zonal_stats,
+    generate_cache_key,
+    get_cached_zonal_stats,
+)
+
+
+def use_cache_dir(monkeypatch, cache_dir):
+    monkeypatch.setattr(zonal_stats_cache, "ZONAL_STATS_CACHE", True)
+    monkeypatch.setattr(zonal_stats_cache, "ZONAL_STATS_CACHE_DIR", str(cache_dir))
+    monkeypatch.setattr(zonal_stats_cache, "_cache_dir_ok", None)
+    monkeypatch.setattr(
+        zonal_stats_cache,
+        "get_coverage_version",
+        lambda cov_id, backend=zonal_stats_cache.RAS_BASE_URL: "v1",
+    )
+
+
+def test_cached_results_round_trip_as_json(monkeypatch, tmp_path):
+    """
+    Tests that area results are cached as JSON and read back unchanged, and
+    that results that would change as JSON are not cached.
+    """
+    cache_dir = tmp_path / "cache"
+    use_cache_dir(monkeypatch, cache_dir)
+    result = {
+        "1950-2009": {"tas": {"mean": np.float64(-3.25), "nodata": float("nan")}},
+        "hist": [1, None, np.int64(2)],
+    }
+
+    cache_zonal_stats("19010208", ["cov"], "taspr", result)
+    cached = get_cached_zonal_stats("19010208", ["cov"], "taspr")
+    assert [path.suffix for path in cache_dir.iterdir()] == [".json"]
+    assert cached["1950-2009"]["tas"]["mean"] == -3.25
+    assert np.isnan(cached["1950-2009"]["tas"]["nodata"])
+    assert cached["hist"] == [1, None, 2]
+
+    for poly_id, unchanged in [
+        ("1", {"values": (1, 2)}),
+        ("2", {2000: 1.0}),
+        ("3", {"mean": np.float32(0.1)}),
+    ]:
+        cache_zonal_stats(poly_id, ["cov"], "taspr", unchanged)
+        assert get_cached_zonal_stats(poly_id, ["cov"], "taspr") is None
+
+
+def test_cache_dir_writable_by_others_is_not_used(monkeypatch, tmp_path):
+    """
+    Tests that the cache is not used if its directory is writable by others.
+    """
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o777)
+    use_cache_dir(monkeypatch, cache_dir)
+
+    cache_zonal_stats("19010208", ["cov"], "taspr", {"mean": 1.0})
+    assert list(cache_dir.iterdir()) == []
+    assert get_cached_zonal_stats("19010208", ["cov"], "taspr") is None
+
+
+def test_cache_key_covers_settings_and_limits(monkeypatch, tmp_path):
+    """
+    Tests that zonal stats settings are part of the cache key, and that
+    results beyond the age and size limits of the cache are dropped.
+    """
+    use_cache_dir(monkeypatch, tmp_path / "cache")
+    key = generate_cache_key("19010208", ["cov"], "taspr")
+    monkeypatch.setitem(zonal_stats_cache.ZONAL_STATS_SETTINGS, "native_cells", 1)
+    assert generate_cache_key("19010208", ["cov"], "taspr") != key
+
+    cache_zonal_stats("old", ["cov"], "taspr", {"mean": 1.0})
+    old_path = zonal_stats_cache.get_cache_path(
+        generate_cache_key("old", ["cov"], "taspr")
+    )
+    os.utime(old_path, (0, 0))
+    assert get_cached_zonal_stats("old", ["cov"], "taspr") is None
+    assert not os.path.exists(old_path)
+
+    monkeypatch.setattr(zonal_stats_cache, "ZONAL_STATS_CACHE_MAX_MB", 1)
+    monkeypatch.setattr(zonal_stats_cache, "_last_pruned_at", 0.0)
+    large = {"values": [0.5] * 200000}
+    cache_zonal_stats("a", ["cov"], "taspr", large)
+    # older than "b", but well within the age limit
+    an_hour_ago = time.time() - 3600
+    os.utime(
+        zonal_stats_cache.get_cache_path(generate_cache_key("a", ["cov"], "taspr")),
+        (an_hour_ago, an_hour_ago),
+    )
+    monkeypatch.setattr(zonal_stats_cache, "_last_pruned_at", 0.0)
+    cache_zonal_stats("b", ["cov"], "taspr", large)
+    assert get_cached_zonal_stats("a", ["cov"], "taspr") is None
+    assert get_cached_zonal_stats("b", ["cov"], "taspr") == large
+
+
+def test_geoserver_coverages_are_versioned_separately(monkeypatch):
+    """
+    Tests that coverages are versioned with the metadata from their own server,
+    so that a changed GeoServer coverage changes the cache key.
+    """
+    monkeypatch.setattr(zonal_stats_cache, "_coverage_versions", {})
+
+    async def describe_via_wcps(cov_id):
+        return {"coverage": cov_id}
+
+    gs_metadata = {"xml": "<wcs:CoverageDescriptions>v1</wcs:CoverageDescriptions>"}
+
+    async def describe_via_gs_wcs(cov_id):
+        return gs_metadata["xml"]
+
+    monkeypatch.setattr(zonal_stats_cache, "describe_via_wcps", describe_via_wcps)
+    monkeypatch.setattr(zonal_stats_cache, "describe_via_gs_wcs", describe_via_gs_wcs)
+    gs = zonal_stats_cache.GS_BASE_URL
+
+    key = generate_cache_key("NPS7", ["dem"], "dem", backend=gs)
+    assert generate_cache_key("NPS7", ["dem"], "dem") != key
+
+    gs_metadata["xml"] = "<wcs:CoverageDescriptions>v2</wcs:CoverageDescriptions>"
+    monkeypatch.setattr(zonal_stats_cache, "_coverage_versions", {})
+    assert generate_cache_key("NPS7", ["dem"], "dem", backend=gs) != key
+
+
+def test_concurrent_prunes_scan_the_cache_once(monkeypatch, tmp_path):
+    """
+    Tests that only one of several threads pruning at the same time scans the
+    cache directory.
+    """
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    use_cache_dir(monkeypatch, cache_dir)
+    monkeypatch.setattr(zonal_stats_cache, "ZONAL_STATS_CACHE_MAX_MB", 1)
+    monkeypatch.setattr(zonal_stats_cache, "_last_pruned_at", 0.0)
+
+    scans = []
+    scandir = os.scandir
+    barrier = threading.Barrier(8)
+
+    def counting_scandir(path):
+        scans.append(path)
+        return scandir(path)
+
+    def prune():
+        barrier.wait()
+        zonal_stats_cache.prune_cache()
+
+    monkeypatch.setattr(zonal_stats_cache.os, "scandir", counting_scandir)
+    threads = [threading.Thread(target=prune) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scans == [str(cache_dir)]
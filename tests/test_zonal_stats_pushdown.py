@@ -0,0 +1,96 @@
+import logging
+from urllib.parse import unquote
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+import zonal_stats_pushdown
+from zonal_stats_pushdown import get_zonal_means_with_pushdown
+
+
+def test_pushdown_zonal_means_are_checked_against_local_means(monkeypatch, caplog):
+    """
+    Tests that pushdown means are unpacked in dimension combination order, and
+    that checked results which differ from the local means are not used.
+    """
+    polygon = gpd.GeoDataFrame(geometry=[box(0, 0, 5000, 4000)], crs=3338)
+    axis_coords = {"era": [0, 1, 2], "scenario": [0, 1]}
+    dimension_combinations = [
+        {"era": era, "scenario": scenario} for scenario in [1, 0] for era in [2, 0]
+    ]
+    # Rasdaman returns the means as nested lists indexed by grid position
+    pushdown_means = np.array([[1.0, 2.0], [3.0, 4.0], [5.0, None]])
+    expected = np.array([np.nan, 2.0, 5.0, 1.0])
+    requested = []
+
+    async def fake_fetch_data(urls):
+        requested.extend(urls)
+        return pushdown_means.tolist()
+
+    monkeypatch.setattr(zonal_stats_pushdown, "fetch_data", fake_fetch_data)
+    monkeypatch.setattr(zonal_stats_pushdown, "ZONAL_STATS_PUSHDOWN_CHECK_RATE", 0)
+
+    def get_means(local_means):
+        return get_zonal_means_with_pushdown(
+            polygon,
+            "test_cov",
+            "EPSG:3338",
+            axis_coords,
+            dimension_combinations,
+            1000,
+            lambda: local_means,
+        )
+
+    np.testing.assert_array_equal(get_means(None), expected)
+    query = unquote(requested[0])
+    assert "over $a0 era(0:2), $a1 scenario(0:1)" in query
+    assert "POLYGON((" in query and "EPSG/0/3338" in query
+
+    # every result is checked, close enough results are used
+    monkeypatch.setattr(zonal_stats_pushdown, "ZONAL_STATS_PUSHDOWN_CHECK_RATE", 1)
+    np.testing.assert_array_equal(get_means(list(expected + 0.01)), expected)
+
+    with caplog.at_level(logging.WARNING):
+        local_means = list(expected + 1)
+        assert get_means(local_means) == local_means
+        local_means = [np.nan, np.nan, 5.0, 1.0]
+        assert get_means(local_means) == local_means
+    assert len(caplog.records) == 2
+
+    # too detailed polygons are computed locally without querying Rasdaman
+    monkeypatch.setattr(zonal_stats_pushdown, "ZONAL_STATS_PUSHDOWN_MAX_URL_LENGTH", 10)
+    assert get_means(local_means) == local_means
+    assert len(requested) == 4
+
+
+def test_unexpected_pushdown_responses_fall_back_to_local_means(monkeypatch, caplog):
+    """
+    Tests that empty, truncated or non-numeric pushdown responses are logged
+    and the local means are used instead.
+    """
+    polygon = gpd.GeoDataFrame(geometry=[box(0, 0, 5000, 4000)], crs=3338)
+    axis_coords = {"era": [0, 1, 2]}
+    dimension_combinations = [{"era": era} for era in [0, 1, 2]]
+    local_means = [1.0, 2.0, 3.0]
+    monkeypatch.setattr(zonal_stats_pushdown, "ZONAL_STATS_PUSHDOWN_CHECK_RATE", 0)
+
+    for response in [b"", [1.0, 2.0], ["a", "b", "c"], {"error": "x"}]:
+
+        async def fake_fetch_data(urls):
+            return response
+
+        monkeypatch.setattr(zonal_stats_pushdown, "fetch_data", fake_fetch_data)
+        caplog.clear()
+        with caplog.at_level(logging.WARNING):
+            means = get_zonal_means_with_pushdown(
+                polygon,
+                "test_cov",
+                "EPSG:3338",
+                axis_coords,
+                dimension_combinations,
+                1000,
+                lambda: local_means,
+            )
+        assert means == local_means
+        assert len(caplog.records) == 1
@@ -1,14 +1,121 @@
 """A module to validate fetched data values."""
 
 import asyncio
+import logging
+import threading
+import time
 from datetime import datetime
+from config import PLACE_DIRECTORY_TTL
 from generate_urls import generate_wfs_places_url
 from fetch_data import fetch_data
 
+logger = logging.getLogger(__name__)
+
+# place ID -> (name, alt_name, type) of all areas and communities, see get_place()
+_place_directory = {}
+_place_directory_loaded = False
+_place_directory_checked_at = None
+_place_directory_lock = threading.Lock()
+
+
+def index_places(features):
+    """Index WFS place features by their ID.
+
+    Args:
+        features (list): GeoJSON features with id, name, alt_name and type properties
+
+    Returns:
+        dict of place ID -> (name, alt_name, type)
+    """
+    places = {}
+    for feature in features:
+        place = feature["properties"]
+        places[place["id"]] = (
+            place["name"],
+            place.get("alt_name") or "",
+            place["type"],
+        )
+    return places
+
+
+def add_places(features):
+    """Add places that were already fetched, e.g. the full community list, to the
+    place directory before it is loaded. Until then, areas are still looked up first.
+
+    Args:
+        features (list): GeoJSON features with id, name, alt_name and type properties
+    """
+    places = index_places(features)
+    with _place_directory_lock:
+        if not _place_directory_loaded:
+            _place_directory.update(places)
+
+
+def load_place_directory():
+    """Fetch all areas and communities from GeoServer and replace the place directory."""
+    global _place_directory, _place_directory_loaded
+    try:
+        areas, communities = asyncio.run(
+            fetch_data(
+                [
+                    generate_wfs_places_url(
+                        "all_boundaries:all_areas", "id,name,alt_name,type"
+                    ),
+                    generate_wfs_places_url(
+                        "all_boundaries:all_communities", "id,name,alt_name,type"
+                    ),
+                ]
+            )
+        )
+        # areas take precedence, like in place_name_and_type()
+        places = index_places(communities["features"])
+        places.update(index_places(areas["features"]))
+    except Exception as exc:
+        logger.warning(f"Could not load the place directory: {exc}")
+        return
+
+    with _place_directory_lock:
+        _place_directory = places
+        _place_directory_loaded = True
+    logger.info(f"Loaded {len(places)} places into the place directory")
+
+
+def get_place(place_id):
+    """Look up a place in the in-memory place directory. The directory is loaded in a
+    background thread on first use and reloaded every PLACE_DIRECTORY_TTL seconds, so
+    requests never wait for it.
+
+    Args:
+        place_id (str): place identifier (e.g., AK124)
+
+    Returns:
+        (place, loaded): the (name, alt_name, type) of the place or None if it is not in
+            the directory, and whether the directory has been fully loaded
+    """
+    global _place_directory_checked_at
+    with _place_directory_lock:
+        now = time.time()
+        if (
+            _place_directory_checked_at is None
+            or now - _place_directory_checked_at >= PLACE_DIRECTORY_TTL
+        ):
+            _place_directory_checked_at = now
+            threading.Thread(target=load_place_directory, daemon=True).start()
+        return _place_directory.get(place_id), _place_directory_loaded
+
+
+def format_place_name(name, alt_name):
+    """Format a place name with its alternate name in parentheses, if it has one."""
+    if alt_name != "":
+        return name + " (" + alt_name + ")"
+    return name
+
 
 def place_name_and_type(place_id):
     """
-    Determine if provided place_id corresponds to a known place.
+    Determine if provided place_id corresponds to a known place. Places are looked up in
+    the place directory, GeoServer is only queried while the directory is not loaded
+    (for areas, and for communities not added to the directory yet).
 
     Args:
         place_id (str): place identifier (e.g., AK124)
@@ -20,7 +127,16 @@ def place_name_and_type(place_id):
     if place_id is None:
         return None, None
 
-    place = asyncio.run(
+    place, loaded = get_place(place_id)
+    if loaded:
+        if place is None:
+            return None, None
+        name, alt_name, place_type = place
+        return format_place_name(name, alt_name), place_type
+
+    # before the directory is loaded it only holds communities added with add_places(),
+    # which must not shadow an area with the same ID
+    area = asyncio.run(
         fetch_data(
             [
                 generate_wfs_places_url(
@@ -32,12 +148,12 @@ def place_name_and_type(place_id):
             ]
         )
     )
-    if place["numberMatched"] > 0:
-        place = place["features"][0]["properties"]
-        full_place = place["name"]
-        if place["alt_name"] != "":
-            full_place += " (" + place["alt_name"] + ")"
-        return full_place, place["type"]
+    if area["numberMatched"] > 0:
+        area = area["features"][0]["properties"]
+        return format_place_name(area["name"], area["alt_name"]), area["type"]
+    elif place is not None:
+        name, alt_name, place_type = place
+        return format_place_name(name, alt_name), place_type
     else:
         place = asyncio.run(
             fetch_data(
@@ -53,10 +169,7 @@ def place_name_and_type(place_id):
         )
         if place["numberMatched"] > 0:
             place = place["features"][0]["properties"]
-            full_place = place["name"]
-            if place["alt_name"] != "":
-                full_place += " (" + place["alt_name"] + ")"
-            return full_place, place["type"]
+            return format_place_name(place["name"], place["alt_name"]), place["type"]
 
     return None, None
 
@@ -2,15 +2,53 @@
 Read more about the Zonal Oversampling Process (ZOP) here: https://github.com/ua-snap/zonal_stats
 """
 
+import hashlib
 import logging
+import threading
 import warnings
+from collections import OrderedDict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 import numpy as np
+import xarray as xr
 from rasterio.features import rasterize
 from rasterio.crs import CRS
 from flask import render_template
 
+from config import (
+    ZONAL_STATS_BATCH_BBOX_RATIO,
+    ZONAL_STATS_EXECUTOR,
+    ZONAL_STATS_MAX_BBOXES,
+    ZONAL_STATS_MAX_WORKERS,
+    ZONAL_STATS_MEMORY_BUDGET_MB,
+    ZONAL_STATS_NATIVE_CELLS,
+    ZONAL_STATS_REQUEST_CONCURRENCY,
+    ZONAL_STATS_SIMPLIFY_TOLERANCE,
+    ZONAL_STATS_WCS_MAX_CELLS,
+)
+
 logger = logging.getLogger(__name__)
 
+# bump this whenever a change to the zonal stats process changes its results,
+# so that cached area results computed by the old version are not reused
+ZONAL_STATS_ENGINE_VERSION = 4
+
+# mean radius of the Earth in meters, for cell areas of geographic grids
+EARTH_RADIUS_M = 6371008.8
+
+# executor pools are shared across requests and created on first use
+_executors = {}
+_executors_lock = threading.Lock()
+
+# simplified polygons, keyed by a digest of the original geometry and the tolerance (least recently used first)
+SIMPLIFIED_GEOMETRY_CACHE_SIZE = 256
+_simplified_geometries = OrderedDict()
+_simplified_geometries_lock = threading.Lock()
+
 
 def get_scale_factor(grid_cell_area, polygon_area):
     """Calculate the scale factor for a given grid cell area and polygon area. Inputs must be in the same units.
@@ -18,7 +56,8 @@ def get_scale_factor(grid_cell_area, polygon_area):
         grid_cell_area (float): area of a grid cell
         polygon_area (float): area of a polygon
     Returns:
-        int: scale factor, rounded up to the nearest integer
+        int: scale factor, rounded up to the nearest integer, or 1 (no oversampling) if the
+            polygon covers at least ZONAL_STATS_NATIVE_CELLS grid cells
     """
 
     if grid_cell_area <= 0:
@@ -29,6 +68,10 @@ def get_scale_factor(grid_cell_area, polygon_area):
         return y
 
     x = polygon_area / grid_cell_area
+    # the curve never drops below 2, but oversampling a polygon this large only multiplies the work
+    if ZONAL_STATS_NATIVE_CELLS > 0 and np.all(x >= ZONAL_STATS_NATIVE_CELLS):
+        return 1
+
     m = 0
     b = 350
     c = -24
@@ -38,6 +81,45 @@ def get_scale_factor(grid_cell_area, polygon_area):
     return int(scale_factor)
 
 
+def get_wcs_scale_factor(
+    bbox_bounds, resolution, max_cells=ZONAL_STATS_WCS_MAX_CELLS
+):
+    """Get the WCS scale factor to request a bbox from Rasdaman with, so that the fetched grid has
+    no more than max_cells cells.
+    Args:
+        bbox_bounds (tuple): 4-tuple of bbox extent (xmin, ymin, xmax, ymax)
+        resolution (float): native grid cell size of the coverage, in the units of the bbox
+        max_cells (int): maximum number of grid cells to fetch, 0 disables scaling
+    Returns:
+        int: scale factor to decimate both axes by, 1 if the bbox is small enough already
+    """
+    if max_cells <= 0:
+        return 1
+    x1, y1, x2, y2 = bbox_bounds
+    n_cells = (abs(x2 - x1) / resolution) * (abs(y2 - y1) / resolution)
+    return max(1, int(np.ceil(np.sqrt(n_cells / max_cells))))
+
+
+def get_geographic_cell_area(ds, x_dim, y_dim):
+    """Get the approximate area of a grid cell in square meters for a dataset in geographic coordinates (e.g. EPSG:4326).
+    Uses the cell size at the mean latitude of the dataset, which is accurate enough for choosing a scale factor.
+    Args:
+        ds (xarray.DataSet): xarray dataset with longitude and latitude coordinates in degrees
+        x_dim (str): name of the x (longitude) dimension
+        y_dim (str): name of the y (latitude) dimension
+    Returns:
+        float: area of a grid cell in square meters
+    """
+    x_res, y_res = ds.rio.resolution()
+    mean_lat = np.deg2rad(ds[y_dim].values.mean())
+    return (
+        EARTH_RADIUS_M**2
+        * abs(np.deg2rad(x_res))
+        * abs(np.deg2rad(y_res))
+        * np.cos(mean_lat)
+    )
+
+
 def interpolate(ds, var_name, x_dim, y_dim, scale_factor, method):
     """Interpolate the array for a single variable from an xarray dataset to a higher resolution.
 
@@ -52,15 +134,113 @@ def interpolate(ds, var_name, x_dim, y_dim, scale_factor, method):
     Returns:
         da_i (xarray.DataArray): xarray data array interpolated to higher resolution
     """
+    if scale_factor == 1:
+        # nothing to oversample, interp() would only cast the data to floats
+        da_i = ds[var_name]
+        if not np.issubdtype(da_i.dtype, np.floating):
+            da_i = da_i.astype(get_float_dtype(da_i.dtype))
+        return da_i.rio.set_spatial_dims(x_dim, y_dim)
+
+    new_coords = get_interpolated_coords(ds, x_dim, y_dim, scale_factor)
+
+    if method == "nearest":
+        # nearest neighbour oversampling is just block replication of the source cells,
+        # so skip the general nearest search done by xarray's interp machinery
+        da_i = replicate_blocks(ds[var_name], new_coords)
+    else:
+        da_i = ds[var_name].interp(method=method, coords=new_coords)
+    da_i = da_i.rio.set_spatial_dims(x_dim, y_dim, inplace=True)
+
+    return da_i
+
+
+def get_float_dtype(dtype):
+    """Get the smallest float dtype that holds every value of a dtype exactly, so that interpolated
+    data is only as large as it needs to be, e.g. float32 for int16 or float32 data and float64 for int32 data.
+    Args:
+        dtype (numpy.dtype): dtype of the data to interpolate
+    Returns:
+        numpy.dtype: float dtype for the interpolated data
+    """
+    return np.result_type(dtype, np.float32)
+
+
+def get_interpolated_coords(ds, x_dim, y_dim, scale_factor):
+    """Get the x and y coordinates of a dataset interpolated to a higher resolution.
+    Args:
+        ds (xarray.DataSet): xarray dataset returned from fetching a bbox from a coverage
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+    Returns:
+        new_coords (dict): maps the x and y dimension names to 1D arrays of new coordinates
+    """
     x = x_dim
     y = y_dim
 
     new_lon = np.linspace(ds[x][0].item(), ds[x][-1].item(), ds.sizes[x] * scale_factor)
     new_lat = np.linspace(ds[y][0].item(), ds[y][-1].item(), ds.sizes[y] * scale_factor)
 
-    da_i = ds[var_name].interp(method=method, coords={x: new_lon, y: new_lat})
-    da_i = da_i.rio.set_spatial_dims(x_dim, y_dim, inplace=True)
+    return {x: new_lon, y: new_lat}
+
+
+def get_nearest_source_indices(coords, new_coords):
+    """Get the index of the nearest source coordinate for each new coordinate.
+    Ties are broken the same way as xarray's interp(method="nearest") (i.e., scipy's interp1d),
+    so results are identical to interpolating.
+
+    Args:
+        coords (numpy.ndarray): 1D array of source coordinates, ascending or descending
+        new_coords (numpy.ndarray): 1D array of new coordinates within the source coordinate range
+    Returns:
+        indices (numpy.ndarray): 1D array of source indices, one per new coordinate
+    """
+    order = np.argsort(coords, kind="stable")
+    sorted_coords = coords[order]
+    # cell boundaries halfway between neighbouring coordinates, computed like interp1d does
+    halfway = sorted_coords / 2.0
+    bounds = halfway[1:] + halfway[:-1]
+    indices = np.searchsorted(bounds, new_coords, side="left")
+    return order[indices]
+
+
+def replicate_blocks(da, new_coords):
+    """Upsample a data array to new coordinates by nearest neighbour block replication.
+    Each source cell is repeated along each spatial axis as many times as it is the nearest
+    source cell for a new coordinate, which is equivalent to (but much cheaper than) nearest
+    neighbour interpolation when the new coordinates run in the same direction as the source.
+
+    Args:
+        da (xarray.DataArray): data array to upsample
+        new_coords (dict): maps dimension names to 1D arrays of new coordinates
+    Returns:
+        da_i (xarray.DataArray): upsampled data array with the new coordinates
+    """
+    data = da.values
+    # like interp(), return floats for integer coverages, but only as wide as needed to
+    # hold them exactly (interp() always uses float64), casting before replication so
+    # the oversampled array is only built once
+    if not np.issubdtype(data.dtype, np.floating):
+        data = data.astype(get_float_dtype(data.dtype))
+
+    for dim, dim_coords in new_coords.items():
+        axis = da.get_axis_num(dim)
+        indices = get_nearest_source_indices(da[dim].values, dim_coords)
+        if np.all(np.diff(indices) >= 0):
+            # indices are sorted, so every source cell becomes a contiguous block
+            counts = np.bincount(indices, minlength=da.sizes[dim])
+            data = np.repeat(data, counts, axis=axis)
+        else:
+            data = np.take(data, indices, axis=axis)
+
+    coords = {
+        name: coord
+        for name, coord in da.coords.items()
+        if not any(dim in coord.dims for dim in new_coords)
+    }
+    coords.update({dim: dim_coords for dim, dim_coords in new_coords.items()})
 
+    da_i = xr.DataArray(data, dims=da.dims, coords=coords, name=da.name, attrs=da.attrs)
     return da_i
 
 
@@ -70,19 +250,24 @@ def rasterize_polygon(da_i, x_dim, y_dim, polygon):
         da_i (xarray.DataArray): xarray data array, probably interpolated
         x_dim (str): name of the x dimension
         y_dim (str): name of the y dimension
-        polygon (shapely.Polygon): polygon to rasterize. Must be in the same CRS as the dataset.
+        polygon (geopandas.GeoDataFrame): polygon to rasterize, all rows are burned. Must be in the same CRS as the dataset.
     Returns:
         rasterized_polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
     """
+    # must recalc since we interpolated, otherwise the old stored transform is used and rasterized polygon is not aligned
+    transform = da_i.rio.transform(recalc=True)
+    # burn every row, e.g. each part of a group from get_polygon_part_groups()
+    shapes = [
+        (simplify_geometry(geometry, transform), 1) for geometry in polygon.geometry
+    ]
+
     rasterized_polygon_array = rasterize(
-        [(polygon.geometry.iloc[0], 1)],
+        shapes,
         out_shape=(
             da_i[y_dim].values.shape[0],
             da_i[x_dim].values.shape[0],
         ),  # must be YX order for numpy array!
-        transform=da_i.rio.transform(
-            recalc=True
-        ),  # must recalc since we interpolated, otherwise the old stored transform is used and rasterized polygon is not aligned
+        transform=transform,
         fill=0,
         all_touched=False,
     )
@@ -90,6 +275,59 @@ def rasterize_polygon(da_i, x_dim, y_dim, polygon):
     return rasterized_polygon_array
 
 
+def simplify_geometry(geometry, transform):
+    """Simplify a polygon to a tolerance well below the pixel size of the grid it will be rasterized on.
+    Polygons often have far more vertices than the grid can resolve, and rasterization time grows with the
+    number of vertices. Simplified geometries are cached by original geometry and tolerance, so repeated
+    requests for the same polygon and grid resolution only simplify it once.
+    Args:
+        geometry (shapely.Geometry): polygon to simplify
+        transform (affine.Affine): transform of the grid the polygon will be rasterized on
+    Returns:
+        shapely.Geometry: simplified polygon, with topology preserved
+    """
+    pixel_size = min(abs(transform.a), abs(transform.e))
+    tolerance = ZONAL_STATS_SIMPLIFY_TOLERANCE * pixel_size
+    if tolerance <= 0:
+        return geometry
+
+    key = (hashlib.sha1(geometry.wkb).hexdigest(), tolerance)
+    with _simplified_geometries_lock:
+        if key in _simplified_geometries:
+            _simplified_geometries.move_to_end(key)
+            return _simplified_geometries[key]
+
+    # plain Douglas-Peucker is several times faster than the topology preserving simplifier,
+    # only fall back to the latter when it would make the polygon invalid
+    simplified = geometry.simplify(tolerance, preserve_topology=False)
+    if simplified.is_empty or not simplified.is_valid:
+        simplified = geometry.simplify(tolerance, preserve_topology=True)
+
+    with _simplified_geometries_lock:
+        _simplified_geometries[key] = simplified
+        if len(_simplified_geometries) > SIMPLIFIED_GEOMETRY_CACHE_SIZE:
+            _simplified_geometries.popitem(last=False)
+
+    return simplified
+
+
+def get_geographic_cell_weights(da_i, x_dim, y_dim):
+    """Get the relative area of each grid cell for a data array in geographic coordinates (e.g. EPSG:4326).
+    Cells on a regular latitude/longitude grid shrink towards the poles in proportion to the cosine of their latitude,
+    so weighting by these makes a zonal mean on the geographic grid match a zonal mean on an equal area grid.
+    Args:
+        da_i (xarray.DataArray): xarray data array with latitude coordinates in degrees, probably interpolated
+        x_dim (str): name of the x (longitude) dimension
+        y_dim (str): name of the y (latitude) dimension
+    Returns:
+        weights (numpy.ndarray): 2D numpy array of cell weights, same YX shape as a rasterized polygon array
+    """
+    row_weights = np.cos(np.deg2rad(da_i[y_dim].values))
+    return np.broadcast_to(
+        row_weights[:, np.newaxis], (da_i.sizes[y_dim], da_i.sizes[x_dim])
+    )
+
+
 def calculate_zonal_stats(da_i, polygon_array, x_dim, y_dim, compute_full_stats=False):
     """Calculate zonal statistics for an xarray data array and a rasterized polygon array of the same shape.
 
@@ -102,18 +340,31 @@ def calculate_zonal_stats(da_i, polygon_array, x_dim, y_dim, compute_full_stats=
     Returns:
         zonal_stats (dict): dictionary of zonal statistics
     """
-    zonal_stats = {}
-
     # transpose to match numpy array YX order and get values that overlap the polygon
     arr = da_i.transpose(y_dim, x_dim).values
     values = arr[polygon_array == 1]
 
+    return calculate_zonal_stats_from_values(values, compute_full_stats)
+
+
+def calculate_zonal_stats_from_values(values, compute_full_stats=False):
+    """Calculate zonal statistics from the values of the cells within a polygon.
+
+    Args:
+        values (numpy.ndarray): 1D numpy array of cell values within the polygon
+        compute_full_stats (bool): if True, compute all stats; if False, only compute mean
+    Returns:
+        zonal_stats (dict): dictionary of zonal statistics
+    """
+    zonal_stats = {}
+
     if values.size > 0:
         # Suppress warnings for all-NaN slices
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=RuntimeWarning)
             # Convert to float() to ensure JSON serializable Python float, not numpy float32
-            mean_val = np.nanmean(values)
+            # accumulate in float64 so that float32 data keeps its precision over many cells
+            mean_val = np.nanmean(values, dtype=np.float64)
             zonal_stats["mean"] = float(mean_val) if not np.isnan(mean_val) else np.nan
 
             # ALFRESCO and indicators only need the mean value
@@ -140,7 +391,7 @@ def calculate_zonal_stats(da_i, polygon_array, x_dim, y_dim, compute_full_stats=
     return zonal_stats
 
 
-def calculate_zonal_means_vectorized(da_i, polygon_array, x_dim, y_dim):
+def calculate_zonal_means_vectorized(da_i, polygon_array, x_dim, y_dim, weights=None):
     """
     Calculate zonal means for a 3D xarray data array (time, y, x)
     and a 2D rasterized polygon array of the same shape.
@@ -149,6 +400,8 @@ def calculate_zonal_means_vectorized(da_i, polygon_array, x_dim, y_dim):
         polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
         x_dim (str): name of the x dimension
         y_dim (str): name of the y dimension
+        weights (numpy.ndarray): optional 2D numpy array of cell weights, same shape as polygon_array,
+            e.g. from get_geographic_cell_weights(). If None, all cells are weighted equally.
     Returns:
         time_series_means (list): list of zonal means for each time slice
     """
@@ -161,12 +414,401 @@ def calculate_zonal_means_vectorized(da_i, polygon_array, x_dim, y_dim):
     # broadcast the 2D mask to the 3D array, selecting pixels within the polygon for all time slices
     masked_arr = arr[:, mask]
 
-    # compute the mean for each time slice, ignoring NaNs
-    time_series_means = np.nanmean(masked_arr, axis=1)
+    if weights is None:
+        # compute the mean for each time slice, ignoring NaNs, accumulating in float64
+        time_series_means = np.nanmean(masked_arr, axis=1, dtype=np.float64)
+    else:
+        # compute the weighted mean for each time slice, ignoring NaNs
+        weighted_sums, weight_sums = calculate_masked_weighted_sums(
+            masked_arr, weights[mask]
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            time_series_means = weighted_sums / weight_sums
 
     return time_series_means.tolist()
 
 
+def calculate_masked_weighted_sums(masked_arr, masked_weights):
+    """Calculate the weighted sum of the valid (not NaN) values, and the sum of their weights, for each time slice.
+    Args:
+        masked_arr (numpy.ndarray): 2D numpy array (time, cell) of the values within a polygon
+        masked_weights (numpy.ndarray): 1D numpy array of the weights of the cells within a polygon
+    Returns:
+        tuple: 1D numpy arrays of weighted sums and of weight sums, one value per time slice
+    """
+    valid = ~np.isnan(masked_arr)
+    # einsum accumulates in float64 without promoting (float32) values to a float64 copy of the array
+    weighted_sums = np.einsum(
+        "tn,n->t", np.where(valid, masked_arr, 0), masked_weights, dtype=np.float64
+    )
+    weight_sums = np.einsum("tn,n->t", valid, masked_weights, dtype=np.float64)
+    return weighted_sums, weight_sums
+
+
+def calculate_zonal_sums_vectorized(da_i, polygon_array, x_dim, y_dim, weights):
+    """
+    Calculate the weighted sums needed for zonal means of a 3D xarray data array (time, y, x), so that
+    the zonal means of a polygon can be combined across the separately fetched bboxes of its parts.
+    Args:
+        da_i (xarray.DataArray): 3D xarray data array, probably interpolated
+        polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        weights (numpy.ndarray): 2D numpy array of cell weights, same shape as polygon_array
+    Returns:
+        tuple: 1D numpy arrays of weighted sums and of weight sums, one value per time slice
+    """
+    arr = da_i.transpose("time", y_dim, x_dim).values
+    mask = polygon_array == 1
+    return calculate_masked_weighted_sums(arr[:, mask], weights[mask])
+
+
+def get_executor(kind=ZONAL_STATS_EXECUTOR):
+    """Get the shared executor pool used to run zonal statistics tasks, creating it if needed.
+    Args:
+        kind (str): "thread" or "process"
+    Returns:
+        executor (concurrent.futures.Executor): shared executor pool
+    """
+    with _executors_lock:
+        if kind not in _executors:
+            if kind == "thread":
+                _executors[kind] = ThreadPoolExecutor(
+                    max_workers=ZONAL_STATS_MAX_WORKERS,
+                    thread_name_prefix="zonal_stats",
+                )
+            elif kind == "process":
+                _executors[kind] = ProcessPoolExecutor(
+                    max_workers=ZONAL_STATS_MAX_WORKERS
+                )
+            else:
+                raise ValueError(f"Unknown zonal stats executor '{kind}'")
+        return _executors[kind]
+
+
+def run_zonal_tasks(
+    func,
+    tasks,
+    max_concurrency=ZONAL_STATS_REQUEST_CONCURRENCY,
+    kind=ZONAL_STATS_EXECUTOR,
+):
+    """Run independent zonal statistics tasks on the shared executor and gather the results.
+    At most `max_concurrency` tasks from this call are in flight at once, so a single request
+    cannot monopolize the pool. Tasks run serially in the calling thread if the executor is
+    "serial", the concurrency cap is 1, or there is only one task.
+
+    Args:
+        func (callable): function to call for each task. Must be defined at module level
+            if the "process" executor is used.
+        tasks (list): list of argument tuples, one per call to `func`
+        max_concurrency (int): maximum number of tasks from this call to run at once
+        kind (str): "thread", "process", or "serial"
+    Returns:
+        results (list): return values of `func`, in the same order as `tasks`
+    """
+    tasks = list(tasks)
+    if kind == "serial" or max_concurrency <= 1 or len(tasks) <= 1:
+        return [func(*args) for args in tasks]
+
+    executor = get_executor(kind)
+    results = [None] * len(tasks)
+    pending = {}
+    next_task = 0
+    while next_task < len(tasks) or pending:
+        # top up the window of in-flight tasks, then wait for any of them to finish
+        while next_task < len(tasks) and len(pending) < max_concurrency:
+            future = executor.submit(func, *tasks[next_task])
+            pending[future] = next_task
+            next_task += 1
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            results[pending.pop(future)] = future.result()
+
+    return results
+
+
+def chunk_list(items, n_chunks):
+    """Split a list into at most `n_chunks` contiguous chunks of near-equal size."""
+    n_chunks = max(1, min(n_chunks, len(items)))
+    bounds = np.linspace(0, len(items), n_chunks + 1).astype(int)
+    return [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def calculate_zonal_stats_for_combos(
+    da_i, polygon_array, dimension_combinations, x_dim, y_dim, compute_full_stats
+):
+    """Calculate zonal statistics for a list of dimension combinations of the same data array.
+    Args:
+        da_i (xarray.DataArray): xarray data array, interpolated
+        polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
+        dimension_combinations (list): list of dicts mapping dimension names to coordinate values
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        compute_full_stats (bool): if True, compute all stats; if False, only compute mean
+    Returns:
+        list: list of tuples (dimension combo, zonal_stats_dict) for each dimension combination
+    """
+    return [
+        (
+            combo,
+            calculate_zonal_stats(
+                da_i.sel(combo),
+                polygon_array,
+                x_dim,
+                y_dim,
+                compute_full_stats,
+            ),
+        )
+        for combo in dimension_combinations
+    ]
+
+
+def calculate_zonal_class_counts(
+    da_i, polygon_array, dimension_combinations, classes, x_dim, y_dim
+):
+    """Count the cells of each class within a polygon for all dimension combinations of a categorical data array at once.
+    Cells are binned with a single np.bincount, instead of computing unique values and counts for every combination.
+
+    Args:
+        da_i (xarray.DataArray): xarray data array of integer classes, interpolated
+        polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
+        dimension_combinations (list): list of dicts mapping dimension names to coordinate values
+        classes (list): class values to count, e.g. [1, 2, 3]. Other values (including NaN) are not counted.
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+    Returns:
+        class_counts (numpy.ndarray): 2D array of cell counts, one row per dimension combination and one column per class
+    """
+    dimnames = [dim for dim in da_i.dims if dim not in [x_dim, y_dim]]
+    arr = da_i.transpose(*dimnames, y_dim, x_dim).values
+    values = arr[..., polygon_array == 1]
+
+    # select the requested combinations, in order, as rows of cell values
+    combo_indexers = tuple(
+        da_i.get_index(dim).get_indexer(
+            [combo[dim] for combo in dimension_combinations]
+        )
+        for dim in dimnames
+    )
+    values = values[combo_indexers].reshape(len(dimension_combinations), -1)
+
+    # map each cell value to the index of its class, with one extra bin for anything else
+    sorted_classes = np.sort(np.asarray(classes, dtype=values.dtype))
+    n_classes = len(sorted_classes)
+    class_indices = np.searchsorted(sorted_classes, values)
+    is_class = class_indices < n_classes
+    is_class[is_class] = sorted_classes[class_indices[is_class]] == values[is_class]
+    class_indices[~is_class] = n_classes
+
+    # offset each combination's bins so all combinations are counted in one pass
+    offsets = np.arange(len(dimension_combinations))[:, np.newaxis] * (n_classes + 1)
+    class_counts = np.bincount(
+        (class_indices + offsets).ravel(),
+        minlength=len(dimension_combinations) * (n_classes + 1),
+    ).reshape(len(dimension_combinations), n_classes + 1)[:, :n_classes]
+
+    # return the columns in the order the classes were given
+    return class_counts[:, np.searchsorted(sorted_classes, classes)]
+
+
+def get_time_chunk_size(ds, var_name, x_dim, y_dim, scale_factor, memory_budget_mb):
+    """Get the number of time slices that can be interpolated and masked within a memory budget.
+    Args:
+        ds (xarray.DataSet): xarray dataset with a time dimension
+        var_name (str): name of the variable to interpolate
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+        memory_budget_mb (int): memory budget in megabytes
+    Returns:
+        int: number of time slices per chunk
+    """
+    # interpolated integer data is cast to floats
+    itemsize = get_float_dtype(ds[var_name].dtype).itemsize
+    n_cells = ds.sizes[x_dim] * ds.sizes[y_dim] * scale_factor**2
+    # the interpolated slice, the masked copy and the temporary copies made by np.nanmean
+    # add up to roughly four times the size of the interpolated slice
+    bytes_per_slice = 4 * n_cells * itemsize
+    return max(1, int(memory_budget_mb * 1024**2 // bytes_per_slice))
+
+
+def get_time_chunk_bounds(ds, var_name, x_dim, y_dim, scale_factor, memory_budget_mb):
+    """Split the time series of a dataset into chunks of time slices that fit in a memory budget.
+    Args:
+        ds (xarray.DataSet): xarray dataset with a time dimension
+        var_name (str): name of the variable to interpolate
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+        memory_budget_mb (int): memory budget in megabytes for each chunk,
+            0 or None for a single chunk
+    Returns:
+        list: list of (start, stop) time indices, one per chunk
+    """
+    n_times = ds.sizes["time"]
+    if memory_budget_mb:
+        chunk_size = get_time_chunk_size(
+            ds, var_name, x_dim, y_dim, scale_factor, memory_budget_mb
+        )
+    else:
+        chunk_size = n_times
+
+    # numpy sums a single masked time slice in a different order than a stack of them,
+    # so keep every chunk at least two slices long to get the same means as the full array
+    chunk_size = max(2, chunk_size)
+    chunk_starts = list(range(0, n_times, chunk_size))
+    if len(chunk_starts) > 1 and n_times - chunk_starts[-1] == 1:
+        chunk_starts.pop()
+    chunk_stops = chunk_starts[1:] + [n_times]
+
+    return list(zip(chunk_starts, chunk_stops))
+
+
+def interpolate_and_compute_zonal_means(
+    ds,
+    var_name,
+    x_dim,
+    y_dim,
+    scale_factor,
+    polygon_array,
+    memory_budget_mb=ZONAL_STATS_MEMORY_BUDGET_MB,
+    weights=None,
+):
+    """Interpolate the time series of a variable and calculate the zonal mean of each time slice.
+    The time series is streamed through interpolation and masking in chunks of time slices
+    that fit in the memory budget, so peak memory does not grow with the length of the time series.
+
+    Args:
+        ds (xarray.DataSet): xarray dataset with a time dimension
+        var_name (str): name of the variable to interpolate
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+        polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
+        memory_budget_mb (int): memory budget in megabytes for each chunk,
+            0 or None to interpolate the whole time series at once
+        weights (numpy.ndarray): optional 2D numpy array of cell weights, same shape as polygon_array
+    Returns:
+        time_series_means (list): list of zonal means for each time slice
+    """
+    chunk_bounds = get_time_chunk_bounds(
+        ds, var_name, x_dim, y_dim, scale_factor, memory_budget_mb
+    )
+
+    # the chunks only need nearest neighbour oversampling, not a spatially-aware data array,
+    # so replicate blocks directly (the rio accessor creates reference cycles that would keep
+    # every chunk alive until the next garbage collection)
+    new_coords = get_interpolated_coords(ds, x_dim, y_dim, scale_factor)
+    time_series_means = []
+    for start, stop in chunk_bounds:
+        da_i_3d = replicate_blocks(
+            ds[var_name].isel(time=slice(start, stop)), new_coords
+        )
+        time_series_means.extend(
+            calculate_zonal_means_vectorized(
+                da_i_3d, polygon_array, x_dim, y_dim, weights=weights
+            )
+        )
+        # release the chunk before interpolating the next one
+        del da_i_3d
+
+    return time_series_means
+
+
+def interpolate_and_compute_zonal_sums(
+    ds,
+    var_name,
+    x_dim,
+    y_dim,
+    scale_factor,
+    polygon_array,
+    weights,
+    memory_budget_mb=ZONAL_STATS_MEMORY_BUDGET_MB,
+):
+    """Like interpolate_and_compute_zonal_means, but return the weighted sums of each time slice instead
+    of the means, so that the results for the parts of a polygon fetched in separate bboxes can be combined.
+
+    Args:
+        ds (xarray.DataSet): xarray dataset with a time dimension
+        var_name (str): name of the variable to interpolate
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+        polygon_array (numpy.ndarray): 2D numpy array with the rasterized polygon
+        weights (numpy.ndarray): 2D numpy array of cell weights, same shape as polygon_array
+        memory_budget_mb (int): memory budget in megabytes for each chunk,
+            0 or None to interpolate the whole time series at once
+    Returns:
+        tuple: 1D numpy arrays of weighted sums and of weight sums, one value per time slice
+    """
+    chunk_bounds = get_time_chunk_bounds(
+        ds, var_name, x_dim, y_dim, scale_factor, memory_budget_mb
+    )
+
+    new_coords = get_interpolated_coords(ds, x_dim, y_dim, scale_factor)
+    weighted_sums = []
+    weight_sums = []
+    for start, stop in chunk_bounds:
+        da_i_3d = replicate_blocks(
+            ds[var_name].isel(time=slice(start, stop)), new_coords
+        )
+        chunk_sums = calculate_zonal_sums_vectorized(
+            da_i_3d, polygon_array, x_dim, y_dim, weights
+        )
+        weighted_sums.append(chunk_sums[0])
+        weight_sums.append(chunk_sums[1])
+        # release the chunk before interpolating the next one
+        del da_i_3d
+
+    return np.concatenate(weighted_sums), np.concatenate(weight_sums)
+
+
+def interpolate_and_rasterize(
+    polygon, dataset, crs, var_name, x_dim, y_dim, scale_factor=None
+):
+    """Interpolate a dataset for a polygon and rasterize the polygon onto the interpolated grid.
+
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon to compute zonal statistics for. Must be in the same CRS as the dataset.
+        dataset (xarray.DataSet): xarray dataset returned from fetching a bbox from a coverage
+        crs (str): coordinate reference system of the dataset. Must be in the same CRS as the polygon.
+        var_name (str): name of the variable to interpolate
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by. Default is None, to use the scale factor
+            for the area of the polygon.
+    Returns:
+        tuple: interpolated data array and 2D rasterized polygon array, or None if the CRS is not valid
+    """
+    # test if the polygon is in the same CRS as the dataset
+    if str(polygon.crs) != crs:
+        logger.debug("Polygon and dataset CRS do not match")
+        return None
+
+    # make sure dataset CRS is projected, not geographic
+    if not CRS.from_string(crs).is_projected:
+        logger.debug("Dataset CRS is not projected")
+        return None
+
+    # confirm spatial info
+    dataset.rio.set_spatial_dims(x_dim, y_dim)
+    dataset.rio.write_crs(crs, inplace=True)
+
+    if scale_factor is None:
+        # calculate the scale factor, assuming square pixels and projection in meters
+        spatial_resolution = dataset.rio.resolution()
+        grid_cell_area_m2 = abs(spatial_resolution[0]) * abs(spatial_resolution[1])
+        polygon_area_m2 = polygon.area
+        scale_factor = get_scale_factor(grid_cell_area_m2, polygon_area_m2)
+
+    # interpolate the dataset and rasterize the polygon
+    da_i = interpolate(dataset, var_name, x_dim, y_dim, scale_factor, method="nearest")
+
+    rasterized_polygon_array = rasterize_polygon(da_i, x_dim, y_dim, polygon)
+
+    return da_i, rasterized_polygon_array
+
+
 def interpolate_and_compute_zonal_stats(
     polygon,
     dataset,
@@ -192,9 +834,383 @@ def interpolate_and_compute_zonal_stats(
     Returns:
         list: list of tuples (dimension combo, zonal_stats_dict) for each dimension combination
     """
+    interpolated = interpolate_and_rasterize(
+        polygon, dataset, crs, var_name, x_dim, y_dim
+    )
+    if interpolated is None:
+        return render_template("500/server_error.html"), 500
+    da_i, rasterized_polygon_array = interpolated
 
-    # test if the polygon is in the same CRS as the dataset
-    if str(polygon.crs) != crs:
+    # split the combos into one chunk per concurrent task, each chunk is computed independently
+    combo_chunks = chunk_list(dimension_combinations, ZONAL_STATS_REQUEST_CONCURRENCY)
+    chunk_results = run_zonal_tasks(
+        calculate_zonal_stats_for_combos,
+        [
+            (da_i, rasterized_polygon_array, chunk, x_dim, y_dim, compute_full_stats)
+            for chunk in combo_chunks
+        ],
+    )
+    results = [result for chunk in chunk_results for result in chunk]
+
+    return results
+
+
+def calculate_multipart_zonal_stats_for_combos(
+    parts, dimension_combinations, x_dim, y_dim, compute_full_stats
+):
+    """Calculate zonal statistics for a list of dimension combinations over the parts of a polygon,
+    each interpolated and rasterized on the grid of its own bbox.
+    Args:
+        parts (list): list of tuples (interpolated data array, 2D rasterized polygon array), one per part
+        dimension_combinations (list): list of dicts mapping dimension names to coordinate values
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        compute_full_stats (bool): if True, compute all stats; if False, only compute mean
+    Returns:
+        list: list of tuples (dimension combo, zonal_stats_dict) for each dimension combination
+    """
+    results = []
+    for combo in dimension_combinations:
+        values = np.concatenate(
+            [
+                da_i.sel(combo).transpose(y_dim, x_dim).values[polygon_array == 1]
+                for da_i, polygon_array in parts
+            ]
+        )
+        results.append(
+            (combo, calculate_zonal_stats_from_values(values, compute_full_stats))
+        )
+    return results
+
+
+def interpolate_and_compute_multipart_zonal_stats(
+    polygon_parts,
+    datasets,
+    crs,
+    dimension_combinations,
+    var_name="Gray",
+    x_dim="X",
+    y_dim="Y",
+    compute_full_stats=False,
+):
+    """Version of interpolate_and_compute_zonal_stats for a polygon whose parts were fetched in separate bboxes
+    (see get_polygon_part_groups). Every part is oversampled with the scale factor of the whole polygon,
+    and the values of all parts are pooled, so the stats only differ from those of a single bbox covering
+    all of the parts by resampling at the part edges.
+
+    Args:
+        polygon_parts (list): list of geopandas.GeoDataFrames with the parts of the polygon, one per bbox.
+            Must be in the same CRS as the datasets.
+        datasets (list): list of xarray.DataSets fetched for the bboxes of the polygon parts, in the same order
+        crs (str): coordinate reference system of the datasets. Must be in the same CRS as the polygon.
+        dimension_combinations (list): list of dicts, each dict maps dimension names to coordinate values
+            e.g., [{'era': 0, 'model': 1, 'scenario': 2}, ...]
+        var_name (str): name of the variable to interpolate. Default is "Gray", the default name used when ingesting into Rasdaman.
+        x_dim (str): name of the x dimension. Default is "X".
+        y_dim (str): name of the y dimension. Default is "Y".
+        compute_full_stats (bool): if True, compute all stats; if False, only mean
+    Returns:
+        list: list of tuples (dimension combo, zonal_stats_dict) for each dimension combination
+    """
+    if len(polygon_parts) == 1:
+        return interpolate_and_compute_zonal_stats(
+            polygon_parts[0],
+            datasets[0],
+            crs,
+            dimension_combinations,
+            var_name,
+            x_dim,
+            y_dim,
+            compute_full_stats,
+        )
+
+    # all parts share the native grid, so scale it for the area of the whole polygon
+    dataset = datasets[0].rio.set_spatial_dims(x_dim, y_dim)
+    spatial_resolution = dataset.rio.resolution()
+    grid_cell_area_m2 = abs(spatial_resolution[0]) * abs(spatial_resolution[1])
+    polygon_area_m2 = np.array([sum(parts.area.sum() for parts in polygon_parts)])
+    scale_factor = get_scale_factor(grid_cell_area_m2, polygon_area_m2)
+
+    parts = []
+    for part_polygon, dataset in zip(polygon_parts, datasets):
+        interpolated = interpolate_and_rasterize(
+            part_polygon, dataset, crs, var_name, x_dim, y_dim, scale_factor
+        )
+        if interpolated is None:
+            return render_template("500/server_error.html"), 500
+        parts.append(interpolated)
+
+    combo_chunks = chunk_list(dimension_combinations, ZONAL_STATS_REQUEST_CONCURRENCY)
+    chunk_results = run_zonal_tasks(
+        calculate_multipart_zonal_stats_for_combos,
+        [
+            (parts, chunk, x_dim, y_dim, compute_full_stats)
+            for chunk in combo_chunks
+        ],
+    )
+    results = [result for chunk in chunk_results for result in chunk]
+
+    return results
+
+
+def interpolate_and_compute_zonal_class_counts(
+    polygon,
+    dataset,
+    crs,
+    dimension_combinations,
+    classes,
+    var_name="Gray",
+    x_dim="X",
+    y_dim="Y",
+):
+    """Categorical version of interpolate_and_compute_zonal_stats: interpolate once, rasterize once,
+    and count the cells of each class within the polygon for all combinations at once.
+
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon to compute zonal statistics for. Must be in the same CRS as the dataset.
+        dataset (xarray.DataSet): xarray dataset returned from fetching a bbox from a coverage
+        crs (str): coordinate reference system of the dataset. Must be in the same CRS as the polygon.
+        dimension_combinations (list): list of dicts, each dict maps dimension names to coordinate values
+            e.g., [{'era': 0, 'model': 1, 'scenario': 2}, ...]
+        classes (list): class values of the coverage, e.g. [1, 2, 3]
+        var_name (str): name of the variable to interpolate. Default is "Gray", the default name used when ingesting into Rasdaman.
+        x_dim (str): name of the x dimension. Default is "X".
+        y_dim (str): name of the y dimension. Default is "Y".
+    Returns:
+        class_counts (numpy.ndarray): 2D array of cell counts, one row per dimension combination and one column per class
+    """
+    interpolated = interpolate_and_rasterize(
+        polygon, dataset, crs, var_name, x_dim, y_dim
+    )
+    if interpolated is None:
+        return render_template("500/server_error.html"), 500
+    da_i, rasterized_polygon_array = interpolated
+
+    return calculate_zonal_class_counts(
+        da_i, rasterized_polygon_array, dimension_combinations, classes, x_dim, y_dim
+    )
+
+
+def group_polygons_by_bbox(polygons, max_bbox_ratio=ZONAL_STATS_BATCH_BBOX_RATIO):
+    """Group polygons so that each group can be fetched with a single covering bbox.
+    A polygon joins a group only if the group's covering bbox stays within `max_bbox_ratio` times
+    the summed area of its members' own bboxes, so far-apart polygons are fetched separately
+    instead of in one huge bbox.
+
+    Args:
+        polygons (geopandas.GeoDataFrame): polygons to group
+        max_bbox_ratio (float): maximum ratio of covering bbox area to summed member bbox areas
+    Returns:
+        groups (list): list of lists of row positions in `polygons`, one list per group
+    """
+
+    def bbox_area(bounds):
+        return (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+
+    bounds = polygons.bounds.values
+    # place the largest polygons first so smaller ones can join their groups
+    order = np.argsort([-bbox_area(b) for b in bounds], kind="stable").tolist()
+
+    groups = []
+    for i in order:
+        for group in groups:
+            members = bounds[group + [i]]
+            union = np.concatenate(
+                [members[:, :2].min(axis=0), members[:, 2:].max(axis=0)]
+            )
+            if bbox_area(union) <= max_bbox_ratio * sum(map(bbox_area, members)):
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+
+    return [sorted(group) for group in groups]
+
+
+def get_polygon_part_groups(polygon, max_bboxes=ZONAL_STATS_MAX_BBOXES):
+    """Split a multi-part polygon into groups of nearby parts, so that each group can be fetched with
+    its own tight bbox. The parts of places like the Aleutians, or of places split at the antimeridian
+    in geographic coordinates, are far apart, and a single bbox covering all of them is mostly empty.
+
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon to split
+        max_bboxes (int): maximum number of groups, far-apart parts are grouped more loosely to stay within it
+    Returns:
+        list: list of geopandas.GeoDataFrames with the parts of each group, or just the polygon if one bbox is enough
+    """
+    parts = polygon[["geometry"]].explode(index_parts=False).reset_index(drop=True)
+    if len(parts) == 1:
+        return [polygon]
+
+    max_bbox_ratio = ZONAL_STATS_BATCH_BBOX_RATIO
+    groups = group_polygons_by_bbox(parts, max_bbox_ratio)
+    while len(groups) > max_bboxes:
+        max_bbox_ratio *= 2
+        groups = group_polygons_by_bbox(parts, max_bbox_ratio)
+
+    if len(groups) == 1:
+        return [polygon]
+    return [parts.iloc[group] for group in groups]
+
+
+def get_polygon_layers(polygons):
+    """Split polygons into layers of polygons that do not overlap each other (they may touch),
+    so that each layer can be burned into a single label raster.
+
+    Args:
+        polygons (geopandas.GeoDataFrame): polygons to split into layers
+    Returns:
+        layers (list): list of lists of row positions in `polygons`, one list per layer
+    """
+    geometries = list(polygons.geometry)
+    # only compare polygons whose bboxes intersect, found with the spatial index
+    sindex = polygons.sindex
+    layer_of = []
+    layers = []
+    for i, geometry in enumerate(geometries):
+        overlapping_layers = {
+            layer_of[j]
+            for j in sindex.query(geometry, predicate="intersects")
+            if j < i and not geometry.touches(geometries[j])
+        }
+        layer = next(
+            (k for k in range(len(layers)) if k not in overlapping_layers), len(layers)
+        )
+        if layer == len(layers):
+            layers.append([])
+        layers[layer].append(i)
+        layer_of.append(layer)
+    return layers
+
+
+def get_zonal_cell_weights(ds, x_dim, y_dim, scale_factor, polygons):
+    """Rasterize many polygons onto the oversampled grid of a dataset and count, for each polygon,
+    how many oversampled cells inside it come from each source cell. Nearest neighbour oversampling
+    only repeats source cells, so these counts are all that is needed to compute the same zonal means
+    as interpolate() followed by a mask, without ever building the oversampled array.
+
+    Args:
+        ds (xarray.DataSet): xarray dataset returned from fetching a bbox from a coverage
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        scale_factor (int): multiplier to increase the resolution by
+        polygons (geopandas.GeoDataFrame): polygons in the same CRS as the dataset
+    Returns:
+        tuple: 1D arrays of polygon positions, flat (Y, X) source cell indices, and oversampled cell counts
+    """
+    new_coords = get_interpolated_coords(ds, x_dim, y_dim, scale_factor)
+    out_shape = (new_coords[y_dim].size, new_coords[x_dim].size)
+    # an empty array on the oversampled grid, only used to get its transform
+    grid = xr.DataArray(
+        np.broadcast_to(np.uint8(0), out_shape),
+        dims=(y_dim, x_dim),
+        coords=new_coords,
+    ).rio.set_spatial_dims(x_dim, y_dim)
+    transform = grid.rio.transform(recalc=True)
+
+    y_source = get_nearest_source_indices(ds[y_dim].values, new_coords[y_dim])
+    x_source = get_nearest_source_indices(ds[x_dim].values, new_coords[x_dim])
+    n_source_cells = ds.sizes[y_dim] * ds.sizes[x_dim]
+
+    keys = []
+    for layer in get_polygon_layers(polygons):
+        # labels are polygon positions + 1, 0 is outside every polygon
+        labels = rasterize(
+            [
+                (simplify_geometry(polygons.geometry.iloc[i], transform), i + 1)
+                for i in layer
+            ],
+            out_shape=out_shape,
+            transform=transform,
+            fill=0,
+            all_touched=False,
+            dtype="int32",
+        )
+        rows, cols = np.nonzero(labels)
+        source_cells = y_source[rows] * ds.sizes[x_dim] + x_source[cols]
+        polygon_indices = (labels[rows, cols] - 1).astype(np.int64)
+        keys.append(polygon_indices * n_source_cells + source_cells)
+
+    keys, cell_counts = np.unique(np.concatenate(keys), return_counts=True)
+    return keys // n_source_cells, keys % n_source_cells, cell_counts
+
+
+def calculate_grouped_zonal_means(
+    da, dimension_combinations, x_dim, y_dim, cell_weights, n_polygons
+):
+    """Calculate the zonal means of many polygons for many dimension combinations in one grouped reduction.
+
+    Args:
+        da (xarray.DataArray): xarray data array at the source resolution, not interpolated
+        dimension_combinations (list): list of dicts mapping dimension names to coordinate values
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+        cell_weights (tuple): output of get_zonal_cell_weights()
+        n_polygons (int): number of polygons
+    Returns:
+        means (numpy.ndarray): 2D array of zonal means, one row per dimension combination and one column per polygon
+    """
+    polygon_indices, source_cells, cell_counts = cell_weights
+    dimnames = [dim for dim in da.dims if dim not in [x_dim, y_dim]]
+    arr = da.transpose(*dimnames, y_dim, x_dim).values
+    arr = arr.reshape(arr.shape[: len(dimnames)] + (-1,))
+
+    # select the requested combinations, in order, as rows of source cell values
+    combo_indexers = tuple(
+        da.get_index(dim).get_indexer(
+            [combo[dim] for combo in dimension_combinations]
+        )
+        for dim in dimnames
+    )
+    values = arr[combo_indexers].reshape(len(dimension_combinations), -1)
+    values = values[:, source_cells]
+
+    # weighted sums of valid values and of valid weights per polygon, for all combinations at once
+    valid = ~np.isnan(values)
+    weights = np.where(valid, cell_counts, 0)
+    n_bins = len(dimension_combinations) * n_polygons
+    offsets = np.arange(len(dimension_combinations))[:, np.newaxis] * n_polygons
+    bins = (polygon_indices + offsets).ravel()
+    sums = np.bincount(
+        bins, weights=(np.where(valid, values, 0) * weights).ravel(), minlength=n_bins
+    )
+    totals = np.bincount(bins, weights=weights.ravel(), minlength=n_bins)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / totals
+
+    return means.reshape(len(dimension_combinations), n_polygons)
+
+
+def compute_grouped_zonal_means(
+    polygons,
+    dataset,
+    crs,
+    dimension_combinations,
+    var_name="Gray",
+    x_dim="X",
+    y_dim="Y",
+):
+    """Batch version of interpolate_and_compute_zonal_stats (means only) for many polygons within one dataset.
+    Polygons are oversampled with their own scale factor: nearby polygons with the same scale factor are
+    rasterized together on one oversampled grid covering just them, and all their means are computed in
+    one grouped reduction. Cells near polygon edges can be resampled differently than for a single polygon,
+    so means can differ very slightly from the single polygon path.
+
+    Args:
+        polygons (geopandas.GeoDataFrame): polygons to compute zonal means for. Must be in the same CRS as the dataset.
+        dataset (xarray.DataSet): xarray dataset covering all of the polygons
+        crs (str): coordinate reference system of the dataset. Must be in the same CRS as the polygons.
+        dimension_combinations (list): list of dicts, each dict maps dimension names to coordinate values
+            e.g., [{'era': 0, 'model': 1, 'scenario': 2}, ...]
+        var_name (str): name of the variable. Default is "Gray", the default name used when ingesting into Rasdaman.
+        x_dim (str): name of the x dimension. Default is "X".
+        y_dim (str): name of the y dimension. Default is "Y".
+    Returns:
+        means (numpy.ndarray): 2D array of zonal means, one row per dimension combination and one column per polygon
+    """
+    # test if the polygons are in the same CRS as the dataset
+    if str(polygons.crs) != crs:
         logger.debug("Polygon and dataset CRS do not match")
         return render_template("500/server_error.html"), 500
 
@@ -207,29 +1223,58 @@ def interpolate_and_compute_zonal_stats(
     dataset.rio.set_spatial_dims(x_dim, y_dim)
     dataset.rio.write_crs(crs, inplace=True)
 
-    # calculate the scale factor, assuming square pixels and projection in meters
     spatial_resolution = dataset.rio.resolution()
     grid_cell_area_m2 = abs(spatial_resolution[0]) * abs(spatial_resolution[1])
-    polygon_area_m2 = polygon.area
-    scale_factor = get_scale_factor(grid_cell_area_m2, polygon_area_m2)
-
-    # interpolate the dataset and rasterize the polygon
-    da_i = interpolate(dataset, var_name, x_dim, y_dim, scale_factor, method="nearest")
-
-    rasterized_polygon_array = rasterize_polygon(da_i, x_dim, y_dim, polygon)
+    scale_factors = np.array(
+        [get_scale_factor(grid_cell_area_m2, np.array([area])) for area in polygons.area]
+    )
 
-    results = [
-        (
-            combo,
-            calculate_zonal_stats(
-                da_i.sel(combo),
-                rasterized_polygon_array,
+    # oversampling the whole dataset at the scale factor of its smallest polygon can take hundreds
+    # of MB when small polygons are batched with large ones, so only the cells around nearby
+    # polygons with the same scale factor are oversampled together
+    means = np.full((len(dimension_combinations), len(polygons)), np.nan)
+    for scale_factor in np.unique(scale_factors):
+        same_scale = np.flatnonzero(scale_factors == scale_factor)
+        for group in group_polygons_by_bbox(polygons.iloc[same_scale]):
+            positions = same_scale[group]
+            group_polygons = polygons.iloc[positions]
+            group_dataset = crop_to_bounds(
+                dataset, group_polygons.total_bounds, x_dim, y_dim
+            )
+            cell_weights = get_zonal_cell_weights(
+                group_dataset, x_dim, y_dim, int(scale_factor), group_polygons
+            )
+            means[:, positions] = calculate_grouped_zonal_means(
+                group_dataset[var_name],
+                dimension_combinations,
                 x_dim,
                 y_dim,
-                compute_full_stats,
-            ),
-        )
-        for combo in dimension_combinations
-    ]
+                cell_weights,
+                len(group_polygons),
+            )
 
-    return results
+    return means
+
+
+def crop_to_bounds(ds, bounds, x_dim, y_dim):
+    """Crop a dataset to the cells intersecting a bbox, plus one cell on each side.
+
+    Args:
+        ds (xarray.DataSet): dataset to crop
+        bounds (tuple): 4-tuple of x,y lower/upper bounds: (<xmin>,<ymin>,<xmax>,<ymax>)
+        x_dim (str): name of the x dimension
+        y_dim (str): name of the y dimension
+    Returns:
+        xarray.DataSet: cropped dataset
+    """
+    xmin, ymin, xmax, ymax = bounds
+    x = ds[x_dim].values
+    y = ds[y_dim].values
+    x_res = np.abs(np.diff(x)).min() if x.size > 1 else 0
+    y_res = np.abs(np.diff(y)).min() if y.size > 1 else 0
+    return ds.isel(
+        {
+            x_dim: (x >= xmin - 1.5 * x_res) & (x <= xmax + 1.5 * x_res),
+            y_dim: (y >= ymin - 1.5 * y_res) & (y <= ymax + 1.5 * y_res),
+        }
+    )
@@ -0,0 +1,324 @@
+"""A module to cache packaged zonal statistics (area query) results on disk.
+
+Area results are deterministic for a given polygon, coverage version, set of requested dimensions and
+zonal stats configuration, so they are stored per (polygon ID, coverage versions, dimension subset,
+zonal stats engine version and settings). The coverage version is a hash of the coverage metadata from
+Rasdaman (or GeoServer, for results computed from GeoServer coverages); when a coverage is re-ingested
+its metadata hash changes, which changes the cache key and invalidates the old results.
+
+The cache is off unless API_ZONAL_STATS_CACHE is true. Results are stored as JSON, only if they are
+read back exactly as they were computed, in a directory that must be owned by the API user and not
+writable by group or others. Results older than ZONAL_STATS_CACHE_MAX_AGE are recomputed, and the
+oldest results are removed when the directory grows past ZONAL_STATS_CACHE_MAX_MB.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from config import (
+    BBOX_TILE_MAX_TILES,
+    BBOX_TILE_SIZE_DEG,
+    BBOX_TILE_SIZE_M,
+    GS_BASE_URL,
+    RAS_BASE_URL,
+    ZONAL_STATS_BATCH_BBOX_RATIO,
+    ZONAL_STATS_CACHE,
+    ZONAL_STATS_CACHE_DIR,
+    ZONAL_STATS_CACHE_MAX_AGE,
+    ZONAL_STATS_CACHE_MAX_MB,
+    ZONAL_STATS_CACHE_VERSION_TTL,
+    ZONAL_STATS_MAX_BBOXES,
+    ZONAL_STATS_NATIVE_CELLS,
+    ZONAL_STATS_PUSHDOWN_TOLERANCE,
+    ZONAL_STATS_SIMPLIFY_TOLERANCE,
+    ZONAL_STATS_WCS_MAX_CELLS,
+)
+from fetch_data import describe_via_gs_wcs, describe_via_wcps
+from zonal_stats import ZONAL_STATS_ENGINE_VERSION
+
+logger = logging.getLogger(__name__)
+
+# settings that change area results, part of every cache key
+ZONAL_STATS_SETTINGS = {
+    "simplify_tolerance": ZONAL_STATS_SIMPLIFY_TOLERANCE,
+    "native_cells": ZONAL_STATS_NATIVE_CELLS,
+    "wcs_max_cells": ZONAL_STATS_WCS_MAX_CELLS,
+    "bbox_tile_size_m": BBOX_TILE_SIZE_M,
+    "bbox_tile_size_deg": BBOX_TILE_SIZE_DEG,
+    "bbox_tile_max_tiles": BBOX_TILE_MAX_TILES,
+    "batch_bbox_ratio": ZONAL_STATS_BATCH_BBOX_RATIO,
+    "max_bboxes": ZONAL_STATS_MAX_BBOXES,
+    "pushdown_tolerance": ZONAL_STATS_PUSHDOWN_TOLERANCE,
+}
+
+# whether the cache directory passed the ownership and permission checks, checked once
+_cache_dir_ok = None
+_cache_dir_lock = threading.Lock()
+# time the cache directory was last pruned to ZONAL_STATS_CACHE_MAX_MB
+_last_pruned_at = 0.0
+_prune_lock = threading.Lock()
+# the cache directory is pruned at most this often (seconds)
+PRUNE_INTERVAL = 60
+
+# (backend, coverage ID) -> (metadata hash, time the hash was computed)
+_coverage_versions = {}
+_coverage_versions_lock = threading.Lock()
+
+
+def hash_coverage_metadata(coverage_metadata):
+    """Hash coverage metadata into a short, stable version string.
+    Args:
+        coverage_metadata (dict or str): output of describe_via_wcps() or describe_via_gs_wcs()
+    Returns:
+        str: hex digest of the metadata
+    """
+    metadata_str = json.dumps(coverage_metadata, sort_keys=True, default=str)
+    return hashlib.sha256(metadata_str.encode("utf-8")).hexdigest()[:16]
+
+
+def get_coverage_version(cov_id, backend=RAS_BASE_URL):
+    """Get the version (metadata hash) of a Rasdaman or GeoServer coverage. Hashes are kept in
+    memory and the metadata is only requested again after ZONAL_STATS_CACHE_VERSION_TTL seconds.
+    Args:
+        cov_id (str): coverage ID
+        backend (str): RAS_BASE_URL or GS_BASE_URL, the server the coverage is on
+    Returns:
+        str: hex digest of the coverage metadata
+    """
+    with _coverage_versions_lock:
+        if (backend, cov_id) in _coverage_versions:
+            version, checked_at = _coverage_versions[(backend, cov_id)]
+            if time.time() - checked_at < ZONAL_STATS_CACHE_VERSION_TTL:
+                return version
+
+    if backend == GS_BASE_URL:
+        coverage_metadata = asyncio.run(describe_via_gs_wcs(cov_id))
+    else:
+        coverage_metadata = asyncio.run(describe_via_wcps(cov_id))
+    version = hash_coverage_metadata(coverage_metadata)
+    with _coverage_versions_lock:
+        _coverage_versions[(backend, cov_id)] = (version, time.time())
+    return version
+
+
+def generate_cache_key(poly_id, cov_ids, subset, backend=RAS_BASE_URL):
+    """Generate the cache key for an area result.
+    Args:
+        poly_id (str): polygon ID, e.g. "19010208"
+        cov_ids (list): coverage IDs the result is computed from
+        subset (str or list): anything else that determines the result, e.g. the variable
+            endpoint or the requested variables
+        backend (str): RAS_BASE_URL or GS_BASE_URL, the server the coverages are on
+    Returns:
+        str: cache key, safe to use as a file name
+    """
+    versions = [
+        [cov_id, get_coverage_version(cov_id, backend)] for cov_id in sorted(cov_ids)
+    ]
+    key_str = json.dumps(
+        [
+            str(poly_id),
+            versions,
+            subset,
+            ZONAL_STATS_ENGINE_VERSION,
+            ZONAL_STATS_SETTINGS,
+        ],
+        default=str,
+    )
+    digest = hashlib.sha256(key_str.encode("utf-8")).hexdigest()[:32]
+    # poly IDs are validated as alphanumeric, so they are safe in a file name
+    return f"{poly_id}_{digest}"
+
+
+def get_cache_path(cache_key):
+    """Get the path of the cache file for a cache key."""
+    return os.path.join(ZONAL_STATS_CACHE_DIR, f"{cache_key}.json")
+
+
+def check_cache_dir():
+    """Create the cache directory if needed, and check that it is owned by the API user and not
+    writable by group or others, so that no one else can plant results. Checked once per process.
+    Returns:
+        bool: True if the cache directory can be used
+    """
+    global _cache_dir_ok
+    with _cache_dir_lock:
+        if _cache_dir_ok is None:
+            try:
+                os.makedirs(ZONAL_STATS_CACHE_DIR, mode=0o700, exist_ok=True)
+                stat = os.stat(ZONAL_STATS_CACHE_DIR)
+                _cache_dir_ok = stat.st_uid == os.getuid() and not stat.st_mode & 0o022
+            except OSError as exc:
+                logger.warning(f"Could not create the zonal stats cache directory: {exc}")
+                _cache_dir_ok = False
+            if not _cache_dir_ok:
+                logger.warning(
+                    f"Zonal stats cache disabled, {ZONAL_STATS_CACHE_DIR} must be owned by "
+                    "the API user and not writable by group or others"
+                )
+        return _cache_dir_ok
+
+
+def matches_json(value, loaded):
+    """Check that a value is read back from JSON exactly as it is, with the same types,
+    dict keys and key order (e.g. tuples, integer keys and NumPy float32 values are not).
+    Args:
+        value: value that was serialized
+        loaded: value read back from the JSON
+    Returns:
+        bool: True if the value survives a JSON round trip
+    """
+    if isinstance(value, dict):
+        return (
+            isinstance(loaded, dict)
+            and list(value) == list(loaded)
+            and all(matches_json(value[key], loaded[key]) for key in value)
+        )
+    if isinstance(value, list):
+        return (
+            isinstance(loaded, list)
+            and len(value) == len(loaded)
+            and all(matches_json(item, other) for item, other in zip(value, loaded))
+        )
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return type(loaded) is type(value) and loaded == value
+    if isinstance(value, (float, np.floating)):
+        # float64 values (including NumPy float64) are read back as Python floats
+        if np.dtype(type(value)) != np.float64 or not isinstance(loaded, float):
+            return False
+        return loaded == value or (math.isnan(loaded) and math.isnan(value))
+    if isinstance(value, (int, np.integer)) and not isinstance(value, np.bool_):
+        return type(loaded) is int and loaded == value
+    return False
+
+
+def default(obj):
+    """Serialize NumPy scalars for the JSON cache files."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def prune_cache():
+    """Remove the oldest cached results until the cache directory is below ZONAL_STATS_CACHE_MAX_MB.
+    Runs at most every PRUNE_INTERVAL seconds per process, by whichever thread claims the interval.
+    """
+    global _last_pruned_at
+    if not ZONAL_STATS_CACHE_MAX_MB:
+        return
+    with _prune_lock:
+        if time.time() - _last_pruned_at < PRUNE_INTERVAL:
+            return
+        _last_pruned_at = time.time()
+
+    entries = []
+    with os.scandir(ZONAL_STATS_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".json") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _mtime, size, _path in entries)
+    max_size = ZONAL_STATS_CACHE_MAX_MB * 1024 * 1024
+    for _mtime, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def get_cached_zonal_stats(poly_id, cov_ids, subset, backend=RAS_BASE_URL):
+    """Get a cached area result.
+    Args:
+        poly_id (str): polygon ID
+        cov_ids (list): coverage IDs the result is computed from
+        subset (str or list): anything else that determines the result
+        backend (str): RAS_BASE_URL or GS_BASE_URL, the server the coverages are on
+    Returns:
+        The cached result, or None if it is not cached (or caching is disabled)
+    """
+    if not ZONAL_STATS_CACHE or not check_cache_dir():
+        return None
+
+    try:
+        cache_path = get_cache_path(generate_cache_key(poly_id, cov_ids, subset, backend))
+        if ZONAL_STATS_CACHE_MAX_AGE:
+            if time.time() - os.path.getmtime(cache_path) > ZONAL_STATS_CACHE_MAX_AGE:
+                os.remove(cache_path)
+                return None
+        with open(cache_path, "r") as f:
+            result = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as exc:
+        # never fail a request because of the cache, just recompute
+        logger.warning(f"Could not read cached zonal stats for {poly_id}: {exc}")
+        return None
+
+    logger.info(f"Using cached zonal stats for {poly_id} ({subset})")
+    return result
+
+
+def cache_zonal_stats(poly_id, cov_ids, subset, result, backend=RAS_BASE_URL):
+    """Store an area result in the cache. The file is written to a temporary path and then moved
+    into place, so that concurrent workers never read a partially written result. Results that
+    would not be read back from JSON exactly as they are (see matches_json()) are not cached.
+    Args:
+        poly_id (str): polygon ID
+        cov_ids (list): coverage IDs the result is computed from
+        subset (str or list): anything else that determines the result
+        result: packaged result to cache
+        backend (str): RAS_BASE_URL or GS_BASE_URL, the server the coverages are on
+    Returns:
+        None
+    """
+    if not ZONAL_STATS_CACHE or not check_cache_dir():
+        return
+
+    try:
+        result_json = json.dumps(result, default=default)
+        if not matches_json(result, json.loads(result_json)):
+            logger.info(f"Zonal stats for {poly_id} are not cached, they change as JSON")
+            return
+
+        cache_path = get_cache_path(generate_cache_key(poly_id, cov_ids, subset, backend))
+        fd, tmp_path = tempfile.mkstemp(dir=ZONAL_STATS_CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(result_json)
+            os.replace(tmp_path, cache_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        prune_cache()
+    except Exception as exc:
+        logger.warning(f"Could not cache zonal stats for {poly_id}: {exc}")
+
+
+def get_or_compute_zonal_stats(poly_id, cov_ids, subset, func, *args):
+    """Get an area result from the cache, or compute and cache it if it is not cached.
+    Args:
+        poly_id (str): polygon ID
+        cov_ids (list): Rasdaman coverage IDs the result is computed from
+        subset (str or list): anything else that determines the result
+        func (callable): function that computes the result
+        *args: arguments to pass to `func`
+    Returns:
+        The cached or newly computed result
+    """
+    result = get_cached_zonal_stats(poly_id, cov_ids, subset)
+    if result is None:
+        result = func(*args)
+        cache_zonal_stats(poly_id, cov_ids, subset, result)
+    return result
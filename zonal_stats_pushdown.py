@@ -0,0 +1,165 @@
+"""A module to push mean-only zonal statistics (area query) down to Rasdaman.
+
+Instead of fetching a bbox of the coverage and aggregating it locally, a WCPS query clips the coverage
+to the polygon and averages it server-side for every combination of the non-spatial axes at once, so
+only the means are transferred. Rasdaman clips at the native resolution, without the oversampling of
+the local zonal stats, so a fraction of pushdown results is checked against the local computation.
+
+Only the ALFRESCO area routes use it. The other area routes need more than the mean of a coverage
+(min/max, class counts or time series), or, like the taspr CRU baseline, fetch the polygon bbox
+anyway for coverages that do, so pushing their means down would add a query instead of saving one.
+"""
+
+import asyncio
+import logging
+import random
+
+import numpy as np
+import shapely
+from aiohttp import ClientResponseError
+
+from config import (
+    ZONAL_STATS_PUSHDOWN_CHECK_RATE,
+    ZONAL_STATS_PUSHDOWN_MAX_URL_LENGTH,
+    ZONAL_STATS_PUSHDOWN_TOLERANCE,
+    ZONAL_STATS_SIMPLIFY_TOLERANCE,
+)
+from fetch_data import fetch_data
+from generate_requests import generate_zonal_mean_wcps_str
+from generate_urls import generate_wcs_query_url
+
+logger = logging.getLogger(__name__)
+
+
+def get_polygon_wkt(polygon, resolution):
+    """Get a compact WKT of a polygon for a WCPS clip, simplified to a fraction of the native pixel size.
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon in the CRS of the coverage
+        resolution (float): native grid cell size of the coverage, in the units of the polygon CRS
+    Returns:
+        str: WKT of the polygon, e.g. "POLYGON((x y, ...))"
+    """
+    geometry = polygon.geometry.union_all()
+    tolerance = ZONAL_STATS_SIMPLIFY_TOLERANCE * resolution
+    if tolerance > 0:
+        geometry = geometry.simplify(tolerance, preserve_topology=True)
+    # keep decimals only for sub-unit resolutions (e.g. degrees)
+    precision = max(0, int(np.ceil(-np.log10(resolution))) + 2)
+    wkt = shapely.to_wkt(geometry, rounding_precision=precision, trim=True)
+    # Rasdaman expects no space between the geometry type and its coordinates
+    return wkt.replace(" (", "(", 1)
+
+
+def fetch_pushdown_zonal_means(
+    polygon, cov_id, crs, axis_coords, dimension_combinations, resolution
+):
+    """Compute zonal means in Rasdaman with a WCPS clip and avg query.
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon in the CRS of the coverage
+        cov_id (str): Rasdaman coverage ID
+        crs (str): CRS of the coverage, e.g. "EPSG:3338"
+        axis_coords (dict): non-spatial axis names mapped to lists of their coordinate values,
+            in coverage axis order, from get_axis_coordinate_values()
+        dimension_combinations (list): list of dicts mapping axis names to coordinate values
+        resolution (float): native grid cell size of the coverage
+    Returns:
+        list: zonal mean for each dimension combination, or None if the query could not be pushed down
+    """
+    axis_sizes = {axis: len(coords) for axis, coords in axis_coords.items()}
+    url = generate_wcs_query_url(
+        generate_zonal_mean_wcps_str(
+            cov_id, get_polygon_wkt(polygon, resolution), crs, axis_sizes
+        )
+    )
+    if len(url) > ZONAL_STATS_PUSHDOWN_MAX_URL_LENGTH:
+        logger.info(f"Polygon too detailed for zonal stats pushdown ({len(url)} chars)")
+        return None
+
+    try:
+        response = asyncio.run(fetch_data([url]))
+    except ClientResponseError as exc:
+        logger.warning(f"Zonal stats pushdown failed ({exc.status}), computing locally")
+        return None
+
+    # Rasdaman returns null (or nothing at all) for combinations with no data in the polygon
+    try:
+        means = np.array(response, dtype=float).reshape(tuple(axis_sizes.values()))
+    except (TypeError, ValueError) as exc:
+        # e.g. an empty, truncated or non-numeric response
+        logger.warning(f"Unexpected zonal stats pushdown response ({exc}), computing locally")
+        return None
+    positions = {
+        axis: {coord: i for i, coord in enumerate(coords)}
+        for axis, coords in axis_coords.items()
+    }
+    return [
+        float(means[tuple(positions[axis][combo[axis]] for axis in axis_coords)])
+        for combo in dimension_combinations
+    ]
+
+
+def check_pushdown_zonal_means(pushdown_means, local_means, cov_id):
+    """Check zonal means computed by Rasdaman against the same means computed locally.
+    Args:
+        pushdown_means (list): zonal means from fetch_pushdown_zonal_means()
+        local_means (list): zonal means computed locally, in the same order
+        cov_id (str): Rasdaman coverage ID, for logging
+    Returns:
+        bool: True if the means agree within ZONAL_STATS_PUSHDOWN_TOLERANCE
+    """
+    pushdown_means = np.asarray(pushdown_means, dtype=float)
+    local_means = np.asarray(local_means, dtype=float)
+    if pushdown_means.shape != local_means.shape or not np.array_equal(
+        np.isnan(pushdown_means), np.isnan(local_means)
+    ):
+        logger.warning(f"Zonal stats pushdown for {cov_id} has missing or extra means")
+        return False
+
+    if np.isnan(local_means).all():
+        return True
+    max_diff = np.nanmax(np.abs(pushdown_means - local_means))
+    scale = np.nanmax(np.abs(local_means))
+    if max_diff > ZONAL_STATS_PUSHDOWN_TOLERANCE * scale:
+        logger.warning(
+            f"Zonal stats pushdown for {cov_id} differs from local results by {max_diff:.4g}"
+        )
+        return False
+    return True
+
+
+def get_zonal_means_with_pushdown(
+    polygon,
+    cov_id,
+    crs,
+    axis_coords,
+    dimension_combinations,
+    resolution,
+    compute_local_means,
+):
+    """Get zonal means pushed down to Rasdaman, falling back to the local computation when the
+    query cannot be pushed down. A random ZONAL_STATS_PUSHDOWN_CHECK_RATE fraction of results is
+    also computed locally, and the local means are used if the two do not agree.
+
+    Args:
+        polygon (geopandas.GeoDataFrame): polygon in the CRS of the coverage
+        cov_id (str): Rasdaman coverage ID
+        crs (str): CRS of the coverage, e.g. "EPSG:3338"
+        axis_coords (dict): non-spatial axis names mapped to lists of their coordinate values
+        dimension_combinations (list): list of dicts mapping axis names to coordinate values
+        resolution (float): native grid cell size of the coverage
+        compute_local_means (callable): computes the same means locally, takes no arguments
+    Returns:
+        list: zonal mean for each dimension combination
+    """
+    means = fetch_pushdown_zonal_means(
+        polygon, cov_id, crs, axis_coords, dimension_combinations, resolution
+    )
+    if means is None:
+        return compute_local_means()
+
+    if random.random() < ZONAL_STATS_PUSHDOWN_CHECK_RATE:
+        local_means = compute_local_means()
+        if not check_pushdown_zonal_means(means, local_means, cov_id):
+            return local_means
+
+    return means